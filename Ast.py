@@ -1,25 +1,80 @@
 from Token import Token
-from typing import Any, List, Union, Deque
+from typing import Any, List, Optional, Sequence, Tuple
 from env import Env
-from collections import deque
-
+from table import LuaTable
+from rope import flatten
+import ops
+import operator
+
+# returned by purity.MemoCache.get on a miss, defined here so the Visitor does not import purity
+MISSING = object()
+
+ARITHMETIC_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+}
+
+COMPARISON_OPERATORS = {
+    '==': operator.eq,
+    '~=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+# the binary operators evaluating both operands, 'and' and 'or' short-circuit
+LUA_OPERATORS = {
+    '+': ops.add,
+    '-': ops.sub,
+    '*': ops.mul,
+    '/': ops.div,
+    '%': ops.mod,
+    '==': ops.eq,
+    '~=': ops.ne,
+    '<': ops.lt,
+    '<=': ops.le,
+    '>': ops.gt,
+    '>=': ops.ge,
+    '..': ops.concat,
+}
+
+BINARY_OPERATORS = set(LUA_OPERATORS)
+
+LUA_UNARY_OPERATORS = {
+    '-': ops.neg,
+    '#': ops.length,
+    'not': ops.not_,
+}
 
 class Node:
+    # first token, set by Parser.parse_statement on statements only. It is the token itself rather than
+    # its line so incremental.IncrementalDocument can move lines by shifting tokens
+    __slots__ = ('token',)
+
     def accept(self, visitor: 'Visitor'):
         raise NotImplementedError(f"accept() not implemented for {self.__class__.__name__}")
 
 
 class Statement(Node):
-    pass
+    __slots__ = ()
 
 
 class Expression(Node):
-    pass
+    __slots__ = ()
 
 
 class Identifier(Node):
+    __slots__ = ('name', 'depth', 'slot')
+
     def __init__(self, name: str):
         self.name = name
+        # (depth, slot) filled in by resolver.Resolver
+        self.depth: int = None
+        self.slot: int = None
 
     def __repr__(self):
         return f'Identifier({self.name})'
@@ -29,10 +84,10 @@ class Identifier(Node):
 
 
 class Chunk(Node):
-    def __init__(self, statements: Union[List[Statement], Deque[Statement]]):
-        self.statements = statements
-        if isinstance(self.statements, List):
-            self.statements = deque(statements)
+    __slots__ = ('statements',)
+
+    def __init__(self, statements: Sequence[Statement]):
+        self.statements = tuple(statements)
 
     def __repr__(self):
         return '[' + ', '.join([str(s) for s in self.statements]) + ']'
@@ -42,23 +97,41 @@ class Chunk(Node):
 
 
 class Block(Chunk):
+    __slots__ = ('frame_size',)
+
+    def __init__(self, statements: Sequence[Statement]):
+        super().__init__(statements)
+        # set by resolver.Resolver when a closure captures one of the block's locals: the block then runs in
+        # a Frame of its own, made each time it is entered. None when its locals live in the enclosing frame
+        self.frame_size: int = None
+
     def accept(self, visitor: 'Visitor'):
         return visitor.visit_block(self)
 
 
 class Program(Node):
+    __slots__ = ('blocks', 'frame_size')
+
     def __init__(self, block: List[Block]):
         self.blocks = block
+        self.frame_size: int = 0
 
     def __repr__(self):
         return '\n'.join([str(b) for b in self.blocks])
 
     def accept(self, visitor: 'Visitor'):
         for block in self.blocks:
-            block.accept(visitor)
+            value = block.accept(visitor)
+            if visitor.returning:
+                # a top-level return ends the program with its value, as on the compiled backends
+                visitor.returning = False
+                return value
+        return None
 
 
 class AssignStatement(Statement):
+    __slots__ = ('ident', 'name', 'value', 'is_local')
+
     def __init__(self, ident: Identifier, value: Expression, is_local: bool):
         self.ident = ident
         self.name = ident.name
@@ -69,10 +142,26 @@ class AssignStatement(Statement):
         return f'Assignment({self.ident}, {self.value}, local: {self.is_local})'
 
     def accept(self, visitor: 'Visitor'):
-        visitor.visit_assignment(self)
+        return visitor.visit_assignment(self)
+
+
+class IndexAssignStatement(Statement):
+    __slots__ = ('target', 'value')
+
+    def __init__(self, target: 'IndexExpr', value: Expression):
+        self.target = target
+        self.value = value
+
+    def __repr__(self):
+        return f'IndexAssignment({self.target}, {self.value})'
+
+    def accept(self, visitor: 'Visitor'):
+        return visitor.visit_index_assignment(self)
 
 
 class ReturnStatement(Statement):
+    __slots__ = ('value',)
+
     def __init__(self, value: Expression):
         self.value = value
 
@@ -84,6 +173,8 @@ class ReturnStatement(Statement):
 
 
 class IfStatement(Statement):
+    __slots__ = ('condition', 'true_block', 'else_block')
+
     def __init__(self, condition: Expression, true_block: Block, else_block: Block = None):
         self.condition = condition
         self.true_block = true_block
@@ -93,10 +184,12 @@ class IfStatement(Statement):
         return f'IfStmt({self.condition}, {self.true_block}, {self.else_block})'
 
     def accept(self, visitor: 'Visitor'):
-        visitor.visit_if_stmt(self)
+        return visitor.visit_if_stmt(self)
 
 
 class WhileLoop(Statement):
+    __slots__ = ('condition', 'body')
+
     def __init__(self, condition: Expression, body: Block):
         self.condition = condition
         self.body = body
@@ -105,24 +198,30 @@ class WhileLoop(Statement):
         return f'WhileLoop({self.condition}, {self.body})'
 
     def accept(self, visitor: 'Visitor'):
-        visitor.visit_while_loop(self)
+        return visitor.visit_while_loop(self)
 
 
 class ForLoop(Statement):
+    __slots__ = ('initializer', 'stop', 'step', 'body', 'frame_size')
+
     def __init__(self, initializer: AssignStatement, stop: Expression, step: Expression, body: Block):
         self.initializer = initializer
         self.stop = stop
         self.step = step
         self.body = body
+        # as for Block, a loop whose control variable a closure captures makes a Frame per iteration
+        self.frame_size: int = None
 
     def __repr__(self):
         return f'ForLoop({self.initializer}, {self.stop}, {self.step}, {self.body})'
 
     def accept(self, visitor: 'Visitor'):
-        visitor.visit_for_loop(self)
+        return visitor.visit_for_loop(self)
 
 
 class Literal(Expression):
+    __slots__ = ('value',)
+
     def __init__(self, value: Any):
         self.value = value
 
@@ -134,6 +233,8 @@ class Literal(Expression):
 
 
 class BinaryExpr(Expression):
+    __slots__ = ('left', 'op', 'right')
+
     def __init__(self, left: Expression, op: Token, right: Expression):
         self.left = left
         self.op = op
@@ -147,6 +248,8 @@ class BinaryExpr(Expression):
 
 
 class UnaryExpr(Expression):
+    __slots__ = ('op', 'operand')
+
     def __init__(self, op: Token, operand: Expression):
         self.op = op
         self.operand = operand
@@ -159,6 +262,8 @@ class UnaryExpr(Expression):
 
 
 class GroupedExpr(Expression):
+    __slots__ = ('inner',)
+
     def __init__(self, inner: Expression):
         self.inner = inner
 
@@ -169,24 +274,67 @@ class GroupedExpr(Expression):
         return visitor.visit_grouped_expression(self)
 
 
+class TableExpr(Expression):
+    """fields are (key, value) pairs in source order, key is None for positional fields"""
+    __slots__ = ('fields',)
+
+    def __init__(self, fields: List[Tuple[Optional[Expression], Expression]]):
+        self.fields = fields
+
+    def __repr__(self):
+        fields_str = ', '.join([str(v) if k is None else f'{k}: {v}' for k, v in self.fields])
+        return f'Table({fields_str})'
+
+    def accept(self, visitor: 'Visitor'):
+        return visitor.visit_table_expr(self)
+
+
+class IndexExpr(Expression):
+    __slots__ = ('obj', 'key')
+
+    def __init__(self, obj: Expression, key: Expression):
+        self.obj = obj
+        self.key = key
+
+    def __repr__(self):
+        return f'Index({self.obj}, {self.key})'
+
+    def accept(self, visitor: 'Visitor'):
+        return visitor.visit_index_expr(self)
+
+
 class Function(Expression, Statement):
+    __slots__ = ('params', 'body', 'name', 'is_local', 'depth', 'slot', 'frame_size', 'memo')
+
     def __init__(self, params: List[str], body: Block, name: str = None, is_local: bool = False):
         self.params = params
         self.body = body
         self.name = name
         self.is_local = is_local
+        self.depth: int = None
+        self.slot: int = None
+        self.frame_size: int = 0
+        # purity.MemoCache of a function purity.memoize proved pure
+        self.memo = None
 
     def __repr__(self):
         return f'Function({self.name}, {self.params}, {self.body})'
 
     def accept(self, visitor: 'Visitor'):
-        visitor.visit_function_def(self)
+        return visitor.visit_function_def(self)
 
 
 class FunctionCall(Expression, Statement):
-    def __init__(self, name: str, args: List[Expression]):
+    __slots__ = ('name', 'args', 'depth', 'slot', 'callee')
+
+    def __init__(self, name: str, args: List[Expression], callee: Expression = None):
         self.name = name
         self.args = args
+        self.depth: int = None
+        self.slot: int = None
+        # the expression producing the function, as in string.len(s), or None to call the variable name.
+        # name then only describes the callee for error messages
+        self.callee = callee
 
     def __repr__(self):
         args_str = ', '.join([str(a) for a in self.args])
@@ -197,8 +345,19 @@ class FunctionCall(Expression, Statement):
 
 
 class Visitor:
-    def __init__(self, env: Env = Env()):
-        self.env = env
+    """
+    Tree-walking evaluator, the 'tree' backend. Operators, truthiness and errors are those of ops, shared
+    with every backend. Names are scoped dynamically: a call pushes a level onto the one Env, so a function
+    sees the locals of its callers, and the locals of a function are gone once it returns, so a nested
+    function cannot close over them. The compiled backends ('vm', 'closure') scope names lexically through
+    resolver.Resolver, so programs whose functions read a caller's local, or return a closure over their
+    own, behave differently there.
+    """
+    def __init__(self, env: Env = None):
+        # a default Env() argument would be one symbol table shared by every visitor made without an env
+        self.env = Env() if env is None else env
+        # set by a return statement until the enclosing function call (or the program) unwinds
+        self.returning = False
 
     @staticmethod
     def visit_literal(le: Literal) -> Any:
@@ -208,130 +367,122 @@ class Visitor:
         return ge.inner.accept(self)
 
     def visit_binary_expr(self, expr: BinaryExpr):
-        left, op, right = expr.left, expr.op.lexeme, expr.right
-        if op in ('+', '-', '*',  '/', '%'):
-            left = left.accept(self)
-            right = right.accept(self)
-
-            if not isinstance(left, (int, float)) or not isinstance(right, (int, float)):
-                print(f"Operands for '{op} must be of type number")
-                exit(1)
-
-            return {
-                '+': left + right,
-                '-': left - right,
-                '*': left * right,
-                '/': left / right,
-                '%': left % right,
-            }[op]
-
-        if op in ('==', '~=', '<', '<=', '>', '>='):
-            left = left.accept(self)
-            right = right.accept(self)
-
-            if not isinstance(left, (int, float, str)) or not isinstance(right, (int, float, str)):
-                print(f"Operands for '{op}' must be of type number or string")
-                exit(1)
-
-            if type(left) is not type(right):
-                print(f"Operands for '{op}' must be both of type number or string")
-                exit(1)
-
-            return {
-                '==': left == right,
-                '~=': left != right,
-                '<': left < right,
-                '<=': left <= right,
-                '>': left > right,
-                '>=': left >= right
-            }[op]
-
-        if op == '..':
-            left = left.accept(self)
-            right = right.accept(self)
-
-            if not isinstance(left, str) or not isinstance(right, str):
-                print(f"Operands for '{op} must be of type string")
-                exit(1)
-
-            return left + right
-
-        if op == 'and':
-            left = left.accept(self)
-            right = right.accept(self)
-
-            if left in (None, False) or right in (None, False):
-                return False
-            return True
-
-        print(f"Unrecognized binary operator '{op}'")
-        exit(1)
+        op = expr.op.lexeme
+        if op == 'and' or op == 'or':
+            # short-circuit and yield an operand, as in Lua: nil and 1 is nil, false or 2 is 2
+            left = expr.left.accept(self)
+            if (left is None or left is False) == (op == 'and'):
+                return left
+            return expr.right.accept(self)
+        if op not in BINARY_OPERATORS:
+            print(f"Unrecognized binary operator '{op}'")
+            exit(1)
+        return self.binary_op(op, expr.left.accept(self), expr.right.accept(self))
+
+    @staticmethod
+    def binary_op(op: str, left: Any, right: Any):
+        # the operators of the compiled backends, so every backend agrees on types and errors
+        return LUA_OPERATORS[op](left, right)
 
     def visit_unary_expression(self, ue: UnaryExpr):
         op = ue.op.lexeme
-        operand = ue.operand.accept(self)
+        return self.unary_op(op, ue.operand.accept(self))
 
-        if op == '#':
-            if not isinstance(operand, str):
-                print("Operand for '#' must be of type string.")
-                exit(1)
-            return len(operand)
-
-        if op == '-':
-            if not isinstance(operand, (int, float)):
-                print("Operand for '-' must be of type number.")
-                exit(1)
-
-            return -operand
-
-        if op == 'not':
-            return False if operand in (True, None) else True
-
-        print(f"Unrecognized unary operator '{op}'")
-        exit(1)
+    @staticmethod
+    def unary_op(op: str, operand: Any):
+        fn = LUA_UNARY_OPERATORS.get(op)
+        if fn is None:
+            print(f"Unrecognized unary operator '{op}'")
+            exit(1)
+        return fn(operand)
 
     def visit_assignment(self, stmt: AssignStatement):
         self.env.set(stmt.name, stmt.value.accept(self), stmt.is_local)
 
+    def visit_index_assignment(self, stmt: IndexAssignStatement):
+        obj = stmt.target.obj.accept(self)
+        if not isinstance(obj, LuaTable) and not isinstance(obj, ops.ARRAY_TYPES):
+            print(f"Attempt to index a non-table value '{obj}'")
+            exit(1)
+        ops.set_index(obj, stmt.target.key.accept(self), stmt.value.accept(self))
+
+    def visit_table_expr(self, te: TableExpr):
+        table = LuaTable()
+        position = 0
+        for key, value in te.fields:
+            if key is None:
+                position += 1
+                table.set(position, value.accept(self))
+            else:
+                table.set(key.accept(self), value.accept(self))
+        return table
+
+    def visit_index_expr(self, ie: IndexExpr):
+        obj = ie.obj.accept(self)
+        if not isinstance(obj, LuaTable) and not isinstance(obj, ops.ARRAY_TYPES):
+            print(f"Attempt to index a non-table value '{obj}'")
+            exit(1)
+        return ops.index(obj, ie.key.accept(self))
+
     def visit_return_statement(self, rs: ReturnStatement):
-        return rs.value.accept(self)
+        value = rs.value.accept(self)
+        self.returning = True
+        return value
 
     def visit_identifier(self, ident: Identifier):
-        value = self.env.get(ident.name)
-        if value is None:
+        env = self.env
+        level = env.get_level_of_symbol(ident.name)
+        value = env.registry.globals.get(ident.name) if level == -1 else env.symbol_table[level][ident.name]
+        # a declared local may hold nil, a global holding nil is undeclared as on the compiled backends
+        if value is None and level <= 0:
             print(f"Identifier {ident.name} not previously declared")
             exit(1)
         return value
 
     def visit_block(self, block: Block):
         self.env.add_level()
-        return_value = None
-        for stmt in block.statements:
-            if isinstance(stmt, ReturnStatement):
-                return_value = stmt.accept(self)
-                break
-            stmt.accept(self)
+        return_value = self.execute_statements(block.statements)
         self.env.pop_level()
         return return_value
 
+    def execute_statements(self, statements):
+        for stmt in statements:
+            value = stmt.accept(self)
+            if self.returning:
+                return value
+        return None
+
     def visit_while_loop(self, wl: WhileLoop):
         condition_result = wl.condition.accept(self)
-        while condition_result:
-            wl.body.accept(self)
+        while condition_result is not None and condition_result is not False:
+            return_value = wl.body.accept(self)
+            if self.returning:
+                return return_value
             condition_result = wl.condition.accept(self)
 
     def visit_for_loop(self, fl: ForLoop):
-        pass
+        values = ops.numeric_range(fl.initializer.value.accept(self), fl.stop.accept(self), fl.step.accept(self))
+
+        env, name, body = self.env, fl.initializer.name, fl.body
+        env.add_level()
+        scope = env.symbol_table[env.level]
+        return_value = None
+        for value in values:
+            scope[name] = value
+            return_value = body.accept(self)
+            if self.returning:
+                break
+        env.pop_level()
+        return return_value
 
     def visit_if_stmt(self, if_stmt: IfStatement):
         condition_result = if_stmt.condition.accept(self)
 
-        if condition_result:
-            if_stmt.true_block.accept(self)
-            return
+        if condition_result is not None and condition_result is not False:
+            return if_stmt.true_block.accept(self)
 
         if if_stmt.else_block is not None:
-            if_stmt.else_block.accept(self)
+            return if_stmt.else_block.accept(self)
 
     def visit_function_def(self, fn: Function):
         if fn.name is None:
@@ -340,20 +491,49 @@ class Visitor:
         return fn
 
     def visit_function_call(self, fc: FunctionCall):
-        fn: Function = self.env.get(fc.name)
+        fn: Function = self.env.get(fc.name) if fc.callee is None else fc.callee.accept(self)
 
         if fn is None:
             print(f"Function '{fc.name}' not previously declared")
             exit(1)
 
+        if not isinstance(fn, Function):
+            if callable(fn):
+                # host functions take the argument values directly, as plain strings, no scope is entered
+                return fn(*[flatten(arg.accept(self)) for arg in fc.args])
+            print(f"Attempt to call a non-function value '{fc.name}'")
+            exit(1)
+
         if len(fc.args) != len(fn.params):
             print(f"Incorrect number of arguments for '{fc.name}'")
             exit(1)
 
-        args, params = fc.args, fn.params
-        body = fn.body.statements.copy()
-        for i in range(len(args)):
-            body.appendleft(AssignStatement(Identifier(params[i]), args[i], True))
+        # arguments are evaluated in the caller's scope before the callee's level exists
+        return self.call(fn, [arg.accept(self) for arg in fc.args])
+
+    def call(self, fn: Function, args: List[Any]):
+        memo = fn.memo
+        if memo is None:
+            return self.invoke(fn, args)
+
+        key = memo.key(args)
+        if key is None:
+            return self.invoke(fn, args)
+        value = memo.get(key)
+        if value is MISSING:
+            value = self.invoke(fn, args)
+            memo.put(key, value)
+        return value
+
+    def invoke(self, fn: Function, args: List[Any]):
+        env = self.env
+        env.add_level()
+        scope = env.symbol_table[env.level]
+        for i, param in enumerate(fn.params):
+            scope[param] = args[i]
 
-        return Block(body).accept(self)
+        return_value = self.execute_statements(fn.body.statements)
 
+        self.returning = False
+        env.pop_level()
+        return return_value
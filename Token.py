@@ -13,6 +13,7 @@ class TokenType(Enum):
     RBRACE = 'RBRACE'
     LBRACKET = 'LBRACKET'
     RBRACKET = 'RBRACKET'
+    DOT = 'DOT'
 
     # unary operators
     NOT = 'NOT'
@@ -66,6 +67,8 @@ class TokenType(Enum):
 @dataclass
 class Token:
     """pos, line, col, token_type, lexeme, literal"""
+    __slots__ = ('pos', 'line', 'col', 'token_type', 'lexeme', 'literal')
+
     pos: int
     line: int
     col: int
@@ -0,0 +1,248 @@
+from array import array
+from typing import Any, Dict, List
+import Ast
+
+
+# node kinds
+(LITERAL, IDENTIFIER, GROUPED, BINARY, UNARY, TABLE, INDEX, FUNCTION, CALL, ASSIGN, INDEX_ASSIGN, RETURN,
+ IF, WHILE, FOR, BLOCK, PROGRAM) = range(17)
+
+KIND_NAMES = [
+    'LITERAL', 'IDENTIFIER', 'GROUPED', 'BINARY', 'UNARY', 'TABLE', 'INDEX', 'FUNCTION', 'CALL', 'ASSIGN',
+    'INDEX_ASSIGN', 'RETURN', 'IF', 'WHILE', 'FOR', 'BLOCK', 'PROGRAM',
+]
+
+NONE = -1
+
+
+class Arena:
+    """
+    A whole syntax tree stored in parallel arrays instead of one object per node. Nodes are numbered in
+    post-order, so children always come before their parent and the root is the last node. Node i has
+    kind kinds[i] and the operands operands[offsets[i]:offsets[i + 1]], which are child node indices,
+    indices into the pool (literal values, names and operator tokens) or flags, depending on the kind:
+
+        LITERAL       value
+        IDENTIFIER    name
+        GROUPED       inner
+        BINARY        left, op, right
+        UNARY         op, operand
+        TABLE         key or NONE, value, key or NONE, value, ...
+        INDEX         obj, key
+        FUNCTION      name, is_local, body, params...
+        CALL          name, callee or NONE, args...
+        ASSIGN        ident, value, is_local
+        INDEX_ASSIGN  target, value
+        RETURN        value
+        IF            condition, true_block, else_block or NONE
+        WHILE         condition, body
+        FOR           initializer, stop, step, body
+        BLOCK         statements...
+        PROGRAM       blocks...
+
+    first_tokens[i] is the pool index of the first token of a statement in a block, for its line info.
+
+    An Arena is a storage and transport form, used by the on-disk ScriptCache and to ship scripts to batch
+    workers. No backend evaluates it directly: evaluate, Runtime and the batch workers decode it into Ast
+    objects first, so running a script still allocates one object per node.
+    """
+    def __init__(self):
+        self.kinds = array('B')
+        self.offsets = array('I', [0])
+        self.operands = array('i')
+        # pool index of a statement's first token, NONE for other nodes
+        self.first_tokens = array('i')
+        self.pool: List[Any] = []
+        self.pool_index: Dict[Any, int] = {}
+
+    def __getstate__(self):
+        # the pool index only matters while encoding, a loaded Arena is read-only
+        state = self.__dict__.copy()
+        del state['pool_index']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pool_index = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @property
+    def root(self) -> int:
+        return len(self.kinds) - 1
+
+    def kind(self, node: int) -> int:
+        return self.kinds[node]
+
+    def operands_of(self, node: int) -> array:
+        return self.operands[self.offsets[node]:self.offsets[node + 1]]
+
+    def value(self, index: int) -> Any:
+        return self.pool[index]
+
+    def add(self, kind: int, *operands: int) -> int:
+        self.kinds.append(kind)
+        self.first_tokens.append(NONE)
+        self.operands.extend(operands)
+        self.offsets.append(len(self.operands))
+        return len(self.kinds) - 1
+
+    def constant(self, value: Any) -> int:
+        # True == 1 == 1.0 and 0.0 == -0.0 so the key tells them apart, tokens are not hashable and never shared
+        try:
+            key = (type(value), repr(value) if type(value) is float else value)
+            if key not in self.pool_index:
+                self.pool_index[key] = len(self.pool)
+                self.pool.append(value)
+            return self.pool_index[key]
+        except TypeError:
+            self.pool.append(value)
+            return len(self.pool) - 1
+
+    def decode(self, node: int = None) -> Ast.Node:
+        """Materializes the node (the whole program by default) as Ast objects"""
+        node = self.root if node is None else node
+        kind, operands, pool = self.kinds[node], self.operands_of(node), self.pool
+
+        def child(index):
+            return None if index == NONE else self.decode(index)
+
+        if kind == LITERAL:
+            return Ast.Literal(pool[operands[0]])
+        if kind == IDENTIFIER:
+            return Ast.Identifier(pool[operands[0]])
+        if kind == GROUPED:
+            return Ast.GroupedExpr(child(operands[0]))
+        if kind == BINARY:
+            return Ast.BinaryExpr(child(operands[0]), pool[operands[1]], child(operands[2]))
+        if kind == UNARY:
+            return Ast.UnaryExpr(pool[operands[0]], child(operands[1]))
+        if kind == TABLE:
+            return Ast.TableExpr([(child(operands[i]), child(operands[i + 1])) for i in range(0, len(operands), 2)])
+        if kind == INDEX:
+            return Ast.IndexExpr(child(operands[0]), child(operands[1]))
+        if kind == FUNCTION:
+            params = [pool[param] for param in operands[3:]]
+            return Ast.Function(params, child(operands[2]), pool[operands[0]], bool(operands[1]))
+        if kind == CALL:
+            return Ast.FunctionCall(pool[operands[0]], [child(arg) for arg in operands[2:]], child(operands[1]))
+        if kind == ASSIGN:
+            return Ast.AssignStatement(child(operands[0]), child(operands[1]), bool(operands[2]))
+        if kind == INDEX_ASSIGN:
+            return Ast.IndexAssignStatement(child(operands[0]), child(operands[1]))
+        if kind == RETURN:
+            return Ast.ReturnStatement(child(operands[0]))
+        if kind == IF:
+            return Ast.IfStatement(child(operands[0]), child(operands[1]), child(operands[2]))
+        if kind == WHILE:
+            return Ast.WhileLoop(child(operands[0]), child(operands[1]))
+        if kind == FOR:
+            return Ast.ForLoop(child(operands[0]), child(operands[1]), child(operands[2]), child(operands[3]))
+        if kind == BLOCK:
+            statements = []
+            for index in operands:
+                stmt = child(index)
+                if self.first_tokens[index] != NONE:
+                    stmt.token = pool[self.first_tokens[index]]
+                statements.append(stmt)
+            return Ast.Block(statements)
+        if kind == PROGRAM:
+            return Ast.Program([child(block) for block in operands])
+
+        print(f'Unknown node kind {kind}')
+        exit(1)
+
+    def dump(self) -> str:
+        lines = []
+        for node in range(len(self.kinds)):
+            operands = ', '.join(str(operand) for operand in self.operands_of(node))
+            lines.append(f'{node:>6} {KIND_NAMES[self.kinds[node]]:<13} {operands}')
+        return '\n'.join(lines)
+
+
+class ArenaEncoder:
+    """Flattens an Ast tree into an Arena, every visit returns the index of the node it added"""
+    def __init__(self):
+        self.arena = Arena()
+
+    def encode(self, program: Ast.Program) -> Arena:
+        self.arena.add(PROGRAM, *[block.accept(self) for block in program.blocks])
+        return self.arena
+
+    def optional(self, node: Ast.Node) -> int:
+        return NONE if node is None else node.accept(self)
+
+    def visit_literal(self, le: Ast.Literal):
+        return self.arena.add(LITERAL, self.arena.constant(le.value))
+
+    def visit_identifier(self, ident: Ast.Identifier):
+        return self.arena.add(IDENTIFIER, self.arena.constant(ident.name))
+
+    def visit_grouped_expression(self, ge: Ast.GroupedExpr):
+        return self.arena.add(GROUPED, ge.inner.accept(self))
+
+    def visit_binary_expr(self, expr: Ast.BinaryExpr):
+        left, right = expr.left.accept(self), expr.right.accept(self)
+        return self.arena.add(BINARY, left, self.arena.constant(expr.op), right)
+
+    def visit_unary_expression(self, ue: Ast.UnaryExpr):
+        operand = ue.operand.accept(self)
+        return self.arena.add(UNARY, self.arena.constant(ue.op), operand)
+
+    def visit_assignment(self, stmt: Ast.AssignStatement):
+        ident, value = stmt.ident.accept(self), stmt.value.accept(self)
+        return self.arena.add(ASSIGN, ident, value, int(stmt.is_local))
+
+    def visit_index_assignment(self, stmt: Ast.IndexAssignStatement):
+        target, value = stmt.target.accept(self), stmt.value.accept(self)
+        return self.arena.add(INDEX_ASSIGN, target, value)
+
+    def visit_table_expr(self, te: Ast.TableExpr):
+        fields = []
+        for key, value in te.fields:
+            fields.append(self.optional(key))
+            fields.append(value.accept(self))
+        return self.arena.add(TABLE, *fields)
+
+    def visit_index_expr(self, ie: Ast.IndexExpr):
+        obj, key = ie.obj.accept(self), ie.key.accept(self)
+        return self.arena.add(INDEX, obj, key)
+
+    def visit_return_statement(self, rs: Ast.ReturnStatement):
+        return self.arena.add(RETURN, rs.value.accept(self))
+
+    def visit_block(self, block: Ast.Block):
+        statements = []
+        for stmt in block.statements:
+            index = stmt.accept(self)
+            if hasattr(stmt, 'token'):
+                self.arena.first_tokens[index] = self.arena.constant(stmt.token)
+            statements.append(index)
+        return self.arena.add(BLOCK, *statements)
+
+    def visit_while_loop(self, wl: Ast.WhileLoop):
+        condition, body = wl.condition.accept(self), wl.body.accept(self)
+        return self.arena.add(WHILE, condition, body)
+
+    def visit_for_loop(self, fl: Ast.ForLoop):
+        initializer, stop, step = fl.initializer.accept(self), fl.stop.accept(self), fl.step.accept(self)
+        return self.arena.add(FOR, initializer, stop, step, fl.body.accept(self))
+
+    def visit_if_stmt(self, if_stmt: Ast.IfStatement):
+        condition, true_block = if_stmt.condition.accept(self), if_stmt.true_block.accept(self)
+        return self.arena.add(IF, condition, true_block, self.optional(if_stmt.else_block))
+
+    def visit_function_def(self, fn: Ast.Function):
+        body = fn.body.accept(self)
+        params = [self.arena.constant(param) for param in fn.params]
+        return self.arena.add(FUNCTION, self.arena.constant(fn.name), int(fn.is_local), body, *params)
+
+    def visit_function_call(self, fc: Ast.FunctionCall):
+        callee = self.optional(fc.callee)
+        args = [arg.accept(self) for arg in fc.args]
+        return self.arena.add(CALL, self.arena.constant(fc.name), callee, *args)
+
+
+def encode(program: Ast.Program) -> Arena:
+    return ArenaEncoder().encode(program)
@@ -0,0 +1,173 @@
+from typing import Any, Set
+from env import Env
+from table import LuaTable
+from vm import Closure
+from closure_compiler import LuaFunction
+import Ast
+import host
+import ops
+
+try:
+    import numpy
+except ImportError:
+    # the array builtins are only registered when NumPy is installed
+    numpy = None
+
+
+def to_array(value: Any):
+    if isinstance(value, ops.ARRAY_TYPES):
+        return value
+    if isinstance(value, LuaTable):
+        for element in value.array:
+            if not isinstance(element, ops.NUMBER_TYPES):
+                print(f"Array elements must be of type number, got '{element}'")
+                exit(1)
+        return numpy.array(value.array, dtype=float)
+    print(f"Expected an array or a table of numbers, got '{value}'")
+    exit(1)
+
+
+def operand(value: Any):
+    return value if isinstance(value, ops.NUMBER_TYPES) else to_array(value)
+
+
+def array(source: Any):
+    """array(n) is n zeros, array(t) copies the array part of table t"""
+    if isinstance(source, ops.NUMBER_TYPES):
+        return numpy.zeros(int(source))
+    return to_array(source).copy()
+
+
+def array_table(values: Any) -> LuaTable:
+    table = LuaTable()
+    table.array = to_array(values).tolist()
+    return table
+
+
+def array_add(left: Any, right: Any):
+    return numpy.add(operand(left), operand(right))
+
+
+def array_mul(left: Any, right: Any):
+    return numpy.multiply(operand(left), operand(right))
+
+
+def array_sum(values: Any) -> float:
+    return to_array(values).sum().item()
+
+
+def non_empty(values: Any, name: str):
+    values = to_array(values)
+    if not len(values):
+        print(f"'{name}' of an empty array")
+        exit(1)
+    return values
+
+
+def array_min(values: Any) -> float:
+    return non_empty(values, 'array_min').min().item()
+
+
+def array_max(values: Any) -> float:
+    return non_empty(values, 'array_max').max().item()
+
+
+def array_dot(left: Any, right: Any) -> float:
+    left, right = to_array(left), to_array(right)
+    if len(left) != len(right):
+        print(f"'array_dot' of arrays of length {len(left)} and {len(right)}")
+        exit(1)
+    return numpy.dot(left, right).item()
+
+
+class ScalarFunction:
+    """
+    Accepts a function whose body only assigns locals and returns arithmetic on numbers, its parameters
+    and those locals. Run once with arrays as arguments, such a function computes all elements at once
+    through the broadcasting arithmetic operators.
+    """
+    def __init__(self):
+        # parameters and the locals assigned so far, the only names the body runs with
+        self.names: Set[str] = set()
+
+    def check(self, fn: Ast.Function) -> bool:
+        self.names = set(fn.params)
+        return all(stmt.accept(self) for stmt in fn.body.statements)
+
+    def reject(self, *_) -> bool:
+        return False
+
+    def visit_literal(self, le: Ast.Literal) -> bool:
+        return isinstance(le.value, ops.NUMBER_TYPES) and type(le.value) is not bool
+
+    def visit_identifier(self, ident: Ast.Identifier) -> bool:
+        # the body runs in an empty Env, a global or a local captured from an enclosing function is not there
+        return ident.name in self.names
+
+    def visit_grouped_expression(self, ge: Ast.GroupedExpr) -> bool:
+        return ge.inner.accept(self)
+
+    def visit_binary_expr(self, expr: Ast.BinaryExpr) -> bool:
+        return expr.op.lexeme in Ast.ARITHMETIC_OPERATORS and expr.left.accept(self) and expr.right.accept(self)
+
+    def visit_unary_expression(self, ue: Ast.UnaryExpr) -> bool:
+        return ue.op.lexeme == '-' and ue.operand.accept(self)
+
+    def visit_assignment(self, stmt: Ast.AssignStatement) -> bool:
+        if not (stmt.is_local or stmt.name in self.names) or not stmt.value.accept(self):
+            return False
+        self.names.add(stmt.name)
+        return True
+
+    def visit_return_statement(self, rs: Ast.ReturnStatement) -> bool:
+        return rs.value.accept(self)
+
+    # control flow would branch on a whole array, and calls, tables and closures are not elementwise
+    visit_if_stmt = visit_while_loop = visit_for_loop = visit_block = reject
+    visit_function_call = visit_function_def = reject
+    visit_index_assignment = visit_table_expr = visit_index_expr = reject
+
+
+def function_node(fn: Any) -> Ast.Function:
+    if isinstance(fn, Ast.Function):
+        return fn
+    if isinstance(fn, Closure):
+        return fn.proto.node
+    if isinstance(fn, LuaFunction):
+        return fn.node
+    return None
+
+
+def array_map(fn: Any, values: Any):
+    """fn applied to every element, fn is run once over the whole array instead of once per element"""
+    node = function_node(fn)
+    if node is None or len(node.params) != 1 or not ScalarFunction().check(node):
+        print("'array_map' expects a function of one parameter that only computes arithmetic on it and its locals")
+        exit(1)
+    values = to_array(values)
+    result = Ast.Visitor(Env()).call(node, [values])
+    if isinstance(result, ops.ARRAY_TYPES):
+        return result.astype(float, copy=False)
+    if not isinstance(result, ops.NUMBER_TYPES):
+        print("'array_map' expects a function returning a number")
+        exit(1)
+    # the function ignored its parameter
+    return numpy.full(values.shape, result, dtype=float)
+
+
+# name: (function, arity)
+FUNCTIONS = {
+    'array': (array, 1),
+    'array_table': (array_table, 1),
+    'array_add': (array_add, 2),
+    'array_mul': (array_mul, 2),
+    'array_sum': (array_sum, 1),
+    'array_min': (array_min, 1),
+    'array_max': (array_max, 1),
+    'array_dot': (array_dot, 2),
+    'array_map': (array_map, 2),
+}
+
+if numpy is not None:
+    for name, (fn, arity) in FUNCTIONS.items():
+        host.register(name, fn, arity)
@@ -0,0 +1,156 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from parser import Parser
+from vm import Closure
+from arena import Arena, encode
+from eval import BACKENDS
+from closure_compiler import LuaFunction
+from coroutines import Coroutine
+from host import VMFunction, AsyncFunction
+from runtime import Chunk
+import Ast
+import io
+import pickle
+
+
+EXPORTED_TYPES = (bool, int, float, str)
+# function and coroutine values of the backends, they only mean something inside the process that made them
+FUNCTION_TYPES = (Ast.Function, Closure, LuaFunction, Coroutine, VMFunction, AsyncFunction)
+
+
+class JobResult:
+    """
+    Outcome of one job: the value the script returned, its globals that can be sent back from a worker
+    process (functions are left out) and everything it printed. error holds the message a failing script
+    printed before exiting, or the exception it raised, and is None on success.
+    """
+    __slots__ = ('value', 'globals', 'output', 'error')
+
+    def __init__(self, value: Any = None, globals_: Dict[str, Any] = None, output: str = '', error: str = None):
+        self.value = value
+        self.globals = {} if globals_ is None else globals_
+        self.output = output
+        self.error = error
+
+    def __repr__(self):
+        if self.error is not None:
+            return f'JobResult(error={self.error!r})'
+        return f'JobResult({self.value!r}, {self.globals!r})'
+
+
+def exportable(value: Any) -> bool:
+    if value is None or type(value) in EXPORTED_TYPES:
+        return True
+    if isinstance(value, FUNCTION_TYPES):
+        return False
+    # a table may still hold a function somewhere
+    try:
+        pickle.dumps(value)
+    except Exception:
+        return False
+    return True
+
+
+def run_job(chunk: Chunk, inputs: Dict[str, Any]) -> JobResult:
+    globals_ = dict(inputs)
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            value = chunk.run(globals_)
+    except SystemExit:
+        # errors are printed right before exiting
+        lines = output.getvalue().splitlines()
+        return JobResult(output=output.getvalue(), error=lines[-1] if lines else 'exit')
+    except Exception as e:
+        return JobResult(output=output.getvalue(), error=f'{type(e).__name__}: {e}')
+
+    if not exportable(value):
+        value = None
+    return JobResult(value, {name: v for name, v in globals_.items() if exportable(v)}, output.getvalue())
+
+
+def parse_script(source: str) -> Tuple[Optional[Arena], Optional[str]]:
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            return encode(Parser(source=source).parse_program()), None
+    except SystemExit:
+        lines = output.getvalue().splitlines()
+        return None, lines[-1] if lines else 'exit'
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+
+
+# state of a worker process, set once by init_worker
+worker_arenas: List[Arena] = []
+worker_chunks: Dict[int, Chunk] = {}
+worker_options: Tuple[str, bool] = ('tree', False)
+
+
+def init_worker(arenas: List[Arena], backend: str, optimized: bool):
+    global worker_arenas, worker_options
+    worker_arenas = arenas
+    worker_options = (backend, optimized)
+    worker_chunks.clear()
+
+
+def run_chunk(script_id: int, inputs: List[Dict[str, Any]]) -> List[JobResult]:
+    chunk = worker_chunks.get(script_id)
+    if chunk is None:
+        # each worker compiles a script the first time it gets one of its jobs
+        backend, optimized = worker_options
+        chunk = worker_chunks[script_id] = Chunk(worker_arenas[script_id].decode(), backend, optimized)
+    return [run_job(chunk, job_inputs) for job_inputs in inputs]
+
+
+def run_batch(jobs: Iterable[Tuple[str, Dict[str, Any]]], backend: str = 'tree', workers: int = None,
+              optimized: bool = False, chunksize: int = 64) -> List[JobResult]:
+    """
+    Runs (source, inputs) jobs across a pool of worker processes and returns one JobResult per job, in
+    job order. Every distinct source is parsed once in this process and sent to each worker once, as an
+    Arena, jobs are then sent in chunks of up to chunksize jobs of the same script. workers=1 runs
+    everything in this process.
+    """
+    if backend not in BACKENDS:
+        print(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+        exit(1)
+
+    jobs = list(jobs)
+    results: List[Optional[JobResult]] = [None] * len(jobs)
+    script_ids: Dict[str, int] = {}
+    arenas: List[Arena] = []
+    errors: List[Optional[str]] = []
+    pending: Dict[int, List[int]] = {}
+    for index, (source, _) in enumerate(jobs):
+        script_id = script_ids.get(source)
+        if script_id is None:
+            script_id = script_ids[source] = len(arenas)
+            arena, error = parse_script(source)
+            arenas.append(arena)
+            errors.append(error)
+        if errors[script_id] is not None:
+            results[index] = JobResult(error=errors[script_id])
+        else:
+            pending.setdefault(script_id, []).append(index)
+
+    chunks: List[Tuple[int, Sequence[int]]] = [
+        (script_id, indices[start:start + chunksize])
+        for script_id, indices in pending.items()
+        for start in range(0, len(indices), chunksize)
+    ]
+
+    if workers == 1:
+        init_worker(arenas, backend, optimized)
+        for script_id, indices in chunks:
+            for index, result in zip(indices, run_chunk(script_id, [jobs[i][1] for i in indices])):
+                results[index] = result
+        return results
+
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(arenas, backend, optimized)) as executor:
+        futures = [(indices, executor.submit(run_chunk, script_id, [jobs[i][1] for i in indices]))
+                   for script_id, indices in chunks]
+        for indices, future in futures:
+            for index, result in zip(indices, future.result()):
+                results[index] = result
+    return results
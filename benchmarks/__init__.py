@@ -0,0 +1,8 @@
+"""
+Lex, parse and evaluation benchmarks over generated Lua workloads.
+
+    python -m benchmarks -o baseline.json
+    python -m benchmarks --compare baseline.json --backends tree,vm
+"""
+from benchmarks.runner import run, compare
+from benchmarks.workloads import WORKLOADS
@@ -0,0 +1,52 @@
+from benchmarks.runner import run, compare, format_table
+from benchmarks.workloads import WORKLOADS
+from eval import BACKENDS
+import argparse
+import json
+import sys
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Lex, parse and evaluation benchmarks')
+    arg_parser.add_argument('workloads', nargs='*', help=f'from {", ".join(WORKLOADS)}, all by default')
+    arg_parser.add_argument('--backends', default='tree', help=f'comma separated, from {", ".join(BACKENDS)}')
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--warmup', type=int, default=1)
+    arg_parser.add_argument('--scale', type=int, default=1, help='multiplies the size of every workload')
+    arg_parser.add_argument('--output', '-o', help='write the results as JSON to this file instead of stdout')
+    arg_parser.add_argument('--compare', help='baseline JSON file to compare against, exits 1 on a regression')
+    arg_parser.add_argument('--threshold', type=float, default=0.1, help='allowed slowdown of a median, default 0.1')
+    args = arg_parser.parse_args()
+
+    for name in args.workloads:
+        if name not in WORKLOADS:
+            print(f"Unknown workload '{name}', expected one of {', '.join(WORKLOADS)}")
+            exit(1)
+
+    backends = args.backends.split(',')
+    for backend in backends:
+        if backend not in BACKENDS:
+            print(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+            exit(1)
+
+    results = run(args.workloads or None, backends, args.repeat, args.warmup, args.scale)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(format_table(results), file=sys.stderr)
+    elif not args.compare:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(baseline, results, args.threshold)
+        print(format_table(results, rows))
+        if any(row['regression'] for row in rows):
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+from typing import Any, Callable, Dict, List, Sequence
+from lexer import Lexer
+from parser import Parser
+from env import Env
+from eval import evaluate
+from benchmarks.workloads import WORKLOADS
+import platform
+import statistics
+import sys
+import time
+
+
+def measure(fn: Callable[[], Any], repeat: int, warmup: int) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    return {
+        'min': min(timings),
+        'max': max(timings),
+        'mean': statistics.mean(timings),
+        'median': statistics.median(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'repeat': repeat,
+    }
+
+
+def run_workload(source: str, backends: Sequence[str], repeat: int, warmup: int) -> Dict[str, Dict[str, float]]:
+    """Times lexing, parsing and evaluation of source separately, each stage starts from the previous one's output"""
+    # Lexer.match recurses once per run of whitespace, the limit is only raised while timing
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 100000))
+    try:
+        tokens = Lexer().lex(source)
+        results = {
+            'lex': measure(lambda: Lexer().lex(source), repeat, warmup),
+            'parse': measure(lambda: Parser(tokens=tokens).parse_program(), repeat, warmup),
+        }
+        for backend in backends:
+            # every run gets a fresh tree, compiled backends annotate it and the quick backend specializes it
+            programs = [Parser(tokens=tokens).parse_program() for _ in range(repeat + warmup)]
+            results[f'eval:{backend}'] = measure(lambda: evaluate(programs.pop(), backend, Env()), repeat, warmup)
+        return results
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+def run(names: Sequence[str] = None, backends: Sequence[str] = ('tree',), repeat: int = 5, warmup: int = 1,
+        scale: int = 1) -> Dict[str, Any]:
+    names = list(WORKLOADS) if names is None else names
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': scale,
+        'results': {
+            name: run_workload(WORKLOADS[name](scale), backends, repeat, warmup) for name in names
+        },
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1) -> List[Dict[str, Any]]:
+    """
+    Compares medians of every (workload, stage) present in both runs. A stage regressed when its median
+    grew by more than threshold, as a fraction of the baseline median, and by more than twice the baseline
+    stdev so run-to-run noise on very short stages is not reported.
+    """
+    rows = []
+    for name, stages in current['results'].items():
+        for stage, stats in stages.items():
+            base = baseline['results'].get(name, {}).get(stage)
+            if base is None:
+                continue
+            change = stats['median'] / base['median'] - 1 if base['median'] else 0.0
+            rows.append({
+                'workload': name,
+                'stage': stage,
+                'baseline': base['median'],
+                'current': stats['median'],
+                'change': change,
+                'regression': change > threshold and stats['median'] - base['median'] > 2 * base['stdev'],
+            })
+    return rows
+
+
+def format_table(current: Dict[str, Any], rows: List[Dict[str, Any]] = None) -> str:
+    lines = []
+    if rows is None:
+        lines.append(f'{"workload":<22} {"stage":<14} {"median ms":>10} {"stdev ms":>10}')
+        for name, stages in current['results'].items():
+            for stage, stats in stages.items():
+                lines.append(f'{name:<22} {stage:<14} {stats["median"] * 1000:>10.2f} {stats["stdev"] * 1000:>10.2f}')
+    else:
+        lines.append(f'{"workload":<22} {"stage":<14} {"baseline ms":>12} {"current ms":>11} {"change":>8}')
+        for row in rows:
+            flag = '  REGRESSION' if row['regression'] else ''
+            lines.append(f'{row["workload"]:<22} {row["stage"]:<14} {row["baseline"] * 1000:>12.2f} '
+                         f'{row["current"] * 1000:>11.2f} {row["change"]:>+8.1%}{flag}')
+    return '\n'.join(lines)
@@ -0,0 +1,85 @@
+from typing import Callable, Dict
+import string
+
+
+def name(i: int, prefix: str = 'x') -> str:
+    # identifiers cannot contain digits, so generated names count in letters: xa, xb, ..., xz, xba, ...
+    # and the prefix keeps them clear of keywords
+    letters = string.ascii_lowercase
+    result = letters[i % 26]
+    while i >= 26:
+        i //= 26
+        result = letters[i % 26] + result
+    return prefix + result
+
+
+def arithmetic_loop(scale: int = 1) -> str:
+    return f"""
+    i = 0
+    total = 0
+    while i < {20000 * scale} do
+        local k = i % 7
+        total = total + i * k - k / 2
+        i = i + 1
+    end
+    """
+
+
+def recursive_calls(scale: int = 1) -> str:
+    return f"""
+    function fib(n)
+        if n < 2 then
+            return n
+        end
+        return fib(n - 1) + fib(n - 2)
+    end
+    result = fib({14 + scale})
+    """
+
+
+def string_concat(scale: int = 1) -> str:
+    return f"""
+    s = ""
+    for i = 1, {2000 * scale} do
+        s = s .. "ab"
+    end
+    size = #s
+    """
+
+
+def deep_nesting(scale: int = 1, depth: int = 40) -> str:
+    opening = ''.join(f'{"    " * level}if true then\n' for level in range(depth))
+    closing = ''.join(f'{"    " * level}end\n' for level in reversed(range(depth)))
+    return f"""
+    count = 0
+    for i = 1, {200 * scale} do
+{opening}count = count + 1
+{closing}
+    end
+    """
+
+
+def large_source(scale: int = 1) -> str:
+    lines = []
+    for i in range(3000 * scale):
+        lines.append(f'{name(i)} = {i} * 2 + ({i} - 1) % 3\n')
+        lines.append(f'{name(i, "s")} = "{name(i)}" .. "-" .. "{i}"\n')
+    return ''.join(lines)
+
+
+def many_small_functions(scale: int = 1) -> str:
+    count = 300 * scale
+    lines = [f'function {name(i)}(x)\n    return x + {i}\nend\n' for i in range(count)]
+    lines.append('total = 0\n')
+    lines.extend(f'total = total + {name(i)}(total % 3)\n' for i in range(count))
+    return ''.join(lines)
+
+
+WORKLOADS: Dict[str, Callable[..., str]] = {
+    'arithmetic_loop': arithmetic_loop,
+    'recursive_calls': recursive_calls,
+    'string_concat': string_concat,
+    'deep_nesting': deep_nesting,
+    'large_source': large_source,
+    'many_small_functions': many_small_functions,
+}
@@ -0,0 +1,113 @@
+from typing import Optional
+from parser import Parser
+from optimizer import optimize
+from arena import Arena, encode
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+
+# bump whenever the parser, the Ast classes or the arena layout change, so stale entries stop matching
+VERSION = 3
+
+# a directory of its own, other Lua tools may use ~/.cache/lua and evict() removes entries from it
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'pylua')
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+SUFFIX = '.arena'
+
+
+class ScriptCache:
+    """
+    On-disk cache of parsed (and optionally optimized) scripts, the way .pyc files cache Python modules.
+    Entries are pickled Arenas named after a hash of the source, the cache VERSION, the Python version and
+    whether the optimizer ran. Writes go to a temporary file that is renamed into place, so concurrent
+    workers never see a partial entry. Once the directory holds more than max_bytes the least recently
+    used entries are removed.
+    """
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(source: str, optimized: bool = False) -> str:
+        digest = hashlib.sha256(f'{VERSION}:{sys.version_info[0]}.{sys.version_info[1]}:{int(optimized)}:'.encode())
+        digest.update(source.encode())
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def load(self, source: str, optimized: bool = False) -> Optional[Arena]:
+        path = self.path(self.key(source, optimized))
+        try:
+            with open(path, 'rb') as f:
+                arena = pickle.load(f)
+        except Exception:
+            # missing, corrupt or incompatible entries are all misses, the next store replaces them
+            return None
+
+        # loads count as use, eviction removes the entries with the oldest mtime first
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return arena
+
+    def store(self, source: str, arena: Arena, optimized: bool = False):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(arena, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.path(self.key(source, optimized)))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.evict()
+
+    def parse(self, source: str, optimized: bool = False) -> Arena:
+        """Returns the cached Arena for source, lexing, parsing and storing it on a miss"""
+        arena = self.load(source, optimized)
+        if arena is not None:
+            return arena
+
+        program = Parser(source=source).parse_program()
+        if optimized:
+            program = optimize(program)
+        arena = encode(program)
+        self.store(source, arena, optimized)
+        return arena
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # removed by another worker
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                os.unlink(os.path.join(self.directory, name))
@@ -0,0 +1,326 @@
+from Token import TokenType
+from typing import Any, Callable, Dict, List, Tuple
+from resolver import resolve, GLOBAL
+from env import Env, Frame
+from host import Registry, REGISTRY
+from table import LuaTable
+from rope import flatten
+from Ast import MISSING
+import Ast
+import ops
+
+
+class LuaFunction:
+    """Function value of the closure backend: a compiled body closure plus the frame it was created in"""
+    def __init__(self, name: str, params: Tuple[str, ...], frame_size: int, body: Callable, frame: Frame, memo=None,
+                 node: Ast.Function = None):
+        self.name = name
+        self.params = params
+        self.frame_size = frame_size
+        self.body = body
+        self.frame = frame
+        self.memo = memo
+        self.node = node
+
+    def __repr__(self):
+        return f'Function({self.name}, {list(self.params)})'
+
+
+class ClosureCompiler:
+    """
+    Turns every node into a specialized Python closure ahead of execution. Expression closures take the
+    current Frame and return a value. Statement closures take the Frame and return None, or a 1-tuple
+    holding the value of a return statement so it can propagate out of nested blocks. Names are scoped
+    lexically, as in vm.VM, unlike the dynamically scoped Ast.Visitor. Globals are read from the table of
+    the run, which every Frame carries, so one compiled program runs against any number of tables.
+    """
+    def __init__(self, registry: Registry = None):
+        self.registry = REGISTRY if registry is None else registry
+
+    def compile(self, program: Ast.Program) -> Callable[[Dict[str, Any]], Any]:
+        """Compiles a program resolver.resolve has annotated into a function running it against a globals table"""
+        blocks = [block.accept(self) for block in program.blocks]
+        frame_size = program.frame_size
+
+        def run(globals_: Dict[str, Any]):
+            frame = Frame(frame_size)
+            frame.globals = globals_
+            for block in blocks:
+                result = block(frame)
+                if result is not None:
+                    return result[0]
+            return None
+        return run
+
+    def statement(self, stmt: Ast.Statement) -> Callable:
+        if isinstance(stmt, Ast.Function) and stmt.name is not None:
+            return self.function_def(stmt, keep_value=False)
+
+        compiled = stmt.accept(self)
+        if not isinstance(stmt, Ast.Expression):
+            return compiled
+
+        def discard(fr):
+            compiled(fr)
+        return discard
+
+    def statements(self, statements) -> Callable:
+        compiled = tuple(self.statement(stmt) for stmt in statements)
+
+        if len(compiled) == 1:
+            return compiled[0]
+
+        def run(fr):
+            for stmt in compiled:
+                result = stmt(fr)
+                if result is not None:
+                    return result
+        return run
+
+    def load(self, name: str, depth: int, slot: int) -> Callable:
+        if depth == GLOBAL:
+            host_globals = self.registry.globals
+
+            def load_global(fr):
+                value = fr.globals.get(name)
+                if value is None:
+                    value = host_globals.get(name)
+                    if value is None:
+                        print(f"Identifier {name} not previously declared")
+                        exit(1)
+                return value
+            return load_global
+        if depth == 0:
+            return lambda fr: fr[slot]
+        if depth == 1:
+            return lambda fr: fr.parent[slot]
+        return lambda fr: fr.get(depth, slot)
+
+    def store(self, name: str, depth: int, slot: int, value: Callable) -> Callable:
+        if depth == GLOBAL:
+            def store_global(fr):
+                fr.globals[name] = value(fr)
+            return store_global
+        if depth == 0:
+            def store_local(fr):
+                fr[slot] = value(fr)
+            return store_local
+
+        def store_outer(fr):
+            fr.set(depth, slot, value(fr))
+        return store_outer
+
+    def function_def(self, fn: Ast.Function, keep_value: bool) -> Callable:
+        name, params, frame_size, memo = fn.name, tuple(fn.params), fn.frame_size, fn.memo
+        body = self.statements(fn.body.statements)
+
+        def make_function(fr):
+            return LuaFunction(name, params, frame_size, body, fr, memo, fn)
+
+        if name is None:
+            return make_function
+
+        store = self.store(name, fn.depth, fn.slot, make_function)
+        if not keep_value:
+            return store
+
+        load = self.load(name, fn.depth, fn.slot)
+
+        def define(fr):
+            store(fr)
+            return load(fr)
+        return define
+
+    def visit_literal(self, le: Ast.Literal) -> Callable:
+        value = le.value
+        return lambda fr: value
+
+    def visit_identifier(self, ident: Ast.Identifier) -> Callable:
+        return self.load(ident.name, ident.depth, ident.slot)
+
+    def visit_grouped_expression(self, ge: Ast.GroupedExpr) -> Callable:
+        return ge.inner.accept(self)
+
+    def visit_binary_expr(self, expr: Ast.BinaryExpr) -> Callable:
+        token_type = expr.op.token_type
+        left, right = expr.left.accept(self), expr.right.accept(self)
+
+        if token_type == TokenType.AND:
+            def and_(fr):
+                value = left(fr)
+                if value is None or value is False:
+                    return value
+                return right(fr)
+            return and_
+
+        if token_type == TokenType.OR:
+            def or_(fr):
+                value = left(fr)
+                if value is None or value is False:
+                    return right(fr)
+                return value
+            return or_
+
+        if token_type not in ops.BINARY:
+            print(f"Unrecognized binary operator '{expr.op.lexeme}'")
+            exit(1)
+
+        op = ops.BINARY[token_type]
+        if isinstance(expr.right, Ast.Literal):
+            constant = expr.right.value
+            return lambda fr: op(left(fr), constant)
+        return lambda fr: op(left(fr), right(fr))
+
+    def visit_unary_expression(self, ue: Ast.UnaryExpr) -> Callable:
+        if ue.op.token_type not in ops.UNARY:
+            print(f"Unrecognized unary operator '{ue.op.lexeme}'")
+            exit(1)
+        op, operand = ops.UNARY[ue.op.token_type], ue.operand.accept(self)
+        return lambda fr: op(operand(fr))
+
+    def visit_assignment(self, stmt: Ast.AssignStatement) -> Callable:
+        return self.store(stmt.name, stmt.ident.depth, stmt.ident.slot, stmt.value.accept(self))
+
+    def visit_index_assignment(self, stmt: Ast.IndexAssignStatement) -> Callable:
+        obj, key, value = stmt.target.obj.accept(self), stmt.target.key.accept(self), stmt.value.accept(self)
+        set_index = ops.set_index
+
+        def index_assignment(fr):
+            set_index(obj(fr), key(fr), value(fr))
+        return index_assignment
+
+    def visit_table_expr(self, te: Ast.TableExpr) -> Callable:
+        fields = []
+        position = 0
+        for key, value in te.fields:
+            if key is None:
+                position += 1
+                fields.append((self.visit_literal(Ast.Literal(position)), value.accept(self)))
+            else:
+                fields.append((key.accept(self), value.accept(self)))
+
+        def table_expr(fr):
+            table = LuaTable()
+            for key_, value_ in fields:
+                table.set(key_(fr), value_(fr))
+            return table
+        return table_expr
+
+    def visit_index_expr(self, ie: Ast.IndexExpr) -> Callable:
+        obj, index = ie.obj.accept(self), ops.index
+        if isinstance(ie.key, Ast.Literal):
+            constant = ie.key.value
+            return lambda fr: index(obj(fr), constant)
+        key = ie.key.accept(self)
+        return lambda fr: index(obj(fr), key(fr))
+
+    def visit_return_statement(self, rs: Ast.ReturnStatement) -> Callable:
+        value = rs.value.accept(self)
+        return lambda fr: (value(fr),)
+
+    def visit_block(self, block: Ast.Block) -> Callable:
+        body = self.statements(block.statements)
+        if block.frame_size is None:
+            return body
+        # a closure captures one of the block's locals, each entry gets a fresh frame
+        frame_size = block.frame_size
+        return lambda fr: body(Frame(frame_size, fr))
+
+    def visit_while_loop(self, wl: Ast.WhileLoop) -> Callable:
+        condition, body = wl.condition.accept(self), wl.body.accept(self)
+
+        def while_loop(fr):
+            while True:
+                value = condition(fr)
+                if value is None or value is False:
+                    return None
+                result = body(fr)
+                if result is not None:
+                    return result
+        return while_loop
+
+    def visit_for_loop(self, fl: Ast.ForLoop) -> Callable:
+        start, stop, step = fl.initializer.value.accept(self), fl.stop.accept(self), fl.step.accept(self)
+        # the control variable is declared in the loop's own scope, so it is always a local slot
+        slot, body, numeric_range = fl.initializer.ident.slot, fl.body.accept(self), ops.numeric_range
+
+        if fl.frame_size is not None:
+            frame_size = fl.frame_size
+
+            def framed_for_loop(fr):
+                for value in numeric_range(start(fr), stop(fr), step(fr)):
+                    # a closure captures the control variable, each iteration gets a fresh one
+                    frame = Frame(frame_size, fr)
+                    frame[slot] = value
+                    result = body(frame)
+                    if result is not None:
+                        return result
+            return framed_for_loop
+
+        def for_loop(fr):
+            for value in numeric_range(start(fr), stop(fr), step(fr)):
+                fr[slot] = value
+                result = body(fr)
+                if result is not None:
+                    return result
+        return for_loop
+
+    def visit_if_stmt(self, if_stmt: Ast.IfStatement) -> Callable:
+        condition, true_block = if_stmt.condition.accept(self), if_stmt.true_block.accept(self)
+        else_block = None if if_stmt.else_block is None else if_stmt.else_block.accept(self)
+
+        def if_stmt_(fr):
+            value = condition(fr)
+            if value is not None and value is not False:
+                return true_block(fr)
+            if else_block is not None:
+                return else_block(fr)
+        return if_stmt_
+
+    def visit_function_def(self, fn: Ast.Function) -> Callable:
+        return self.function_def(fn, keep_value=True)
+
+    def visit_function_call(self, fc: Ast.FunctionCall) -> Callable:
+        callee = self.load(fc.name, fc.depth, fc.slot) if fc.callee is None else fc.callee.accept(self)
+        args: List[Callable] = [arg.accept(self) for arg in fc.args]
+        argc = len(args)
+
+        def call(fr):
+            fn = callee(fr)
+            if not isinstance(fn, LuaFunction):
+                if callable(fn):
+                    return fn(*[flatten(arg(fr)) for arg in args])
+                print(f"Attempt to call a non-function value '{fn}'")
+                exit(1)
+            if argc != len(fn.params):
+                print(f"Incorrect number of arguments for '{fn.name}'")
+                exit(1)
+            frame = Frame(fn.frame_size, fn.frame)
+            for i in range(argc):
+                frame[i] = args[i](fr)
+            memo = fn.memo
+            if memo is None:
+                result = fn.body(frame)
+                return None if result is None else result[0]
+
+            key = memo.key(frame[:argc])
+            if key is None:
+                result = fn.body(frame)
+                return None if result is None else result[0]
+            value = memo.get(key)
+            if value is MISSING:
+                result = fn.body(frame)
+                value = None if result is None else result[0]
+                memo.put(key, value)
+            return value
+        return call
+
+
+def compile_program(program: Ast.Program, env: Env = None) -> Callable[[], Any]:
+    """Resolves and compiles program into a function running it against the global level of env"""
+    env = Env() if env is None else env
+    if env.level == -1:
+        env.add_level()
+    run = ClosureCompiler(env.registry).compile(resolve(program, env.registry))
+    globals_ = env.symbol_table[0]
+    return lambda: run(globals_)
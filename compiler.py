@@ -0,0 +1,325 @@
+from Token import TokenType
+from typing import Any, List, Tuple
+from resolver import resolve, GLOBAL
+from host import Registry
+from array import array
+import Ast
+import ops
+
+
+(
+    LOAD_CONST,
+    LOAD_GLOBAL,
+    STORE_GLOBAL,
+    LOAD_LOCAL,
+    STORE_LOCAL,
+    LOAD_OUTER,
+    STORE_OUTER,
+    BINARY_OP,
+    UNARY_OP,
+    JUMP,
+    JUMP_IF_FALSE,
+    JUMP_IF_FALSE_OR_POP,
+    JUMP_IF_TRUE_OR_POP,
+    MAKE_FUNCTION,
+    CALL,
+    POP_TOP,
+    DUP_TOP,
+    RETURN,
+    NEW_TABLE,
+    TABLE_SET,
+    LOAD_INDEX,
+    STORE_INDEX,
+    FOR_PREP,
+    FOR_ITER,
+    TAIL_CALL,
+    ENTER_BLOCK,
+    LEAVE_BLOCK,
+) = range(27)
+
+OPNAMES = [
+    'LOAD_CONST', 'LOAD_GLOBAL', 'STORE_GLOBAL', 'LOAD_LOCAL', 'STORE_LOCAL', 'LOAD_OUTER', 'STORE_OUTER',
+    'BINARY_OP', 'UNARY_OP', 'JUMP', 'JUMP_IF_FALSE', 'JUMP_IF_FALSE_OR_POP', 'JUMP_IF_TRUE_OR_POP',
+    'MAKE_FUNCTION', 'CALL', 'POP_TOP', 'DUP_TOP', 'RETURN', 'NEW_TABLE', 'TABLE_SET', 'LOAD_INDEX', 'STORE_INDEX',
+    'FOR_PREP', 'FOR_ITER', 'TAIL_CALL', 'ENTER_BLOCK', 'LEAVE_BLOCK',
+]
+
+# LOAD_OUTER/STORE_OUTER pack (depth, slot) into one operand
+DEPTH_SHIFT = 16
+SLOT_MASK = (1 << DEPTH_SHIFT) - 1
+
+BINARY_TYPES: Tuple[TokenType, ...] = tuple(ops.BINARY)
+BINARY_FUNCS = tuple(ops.BINARY.values())
+BINARY_INDEX = {token_type: i for i, token_type in enumerate(BINARY_TYPES)}
+
+UNARY_TYPES: Tuple[TokenType, ...] = tuple(ops.UNARY)
+UNARY_FUNCS = tuple(ops.UNARY.values())
+UNARY_INDEX = {token_type: i for i, token_type in enumerate(UNARY_TYPES)}
+
+
+class CodeObject:
+    """Flat bytecode: parallel opcode/operand arrays plus constant and name tables"""
+    def __init__(self, name: str, ops: array, args: array, consts: List[Any], names: List[str],
+                 frame_size: int = 0):
+        self.name = name
+        self.ops = ops
+        self.args = args
+        self.consts = consts
+        self.names = names
+        self.frame_size = frame_size
+
+    def __repr__(self):
+        return f'CodeObject({self.name}, {len(self.ops)} instructions)'
+
+
+class FunctionProto:
+    def __init__(self, name: str, params: Tuple[str, ...], code: CodeObject, memo=None, node: Ast.Function = None):
+        self.name = name
+        self.params = params
+        self.code = code
+        self.memo = memo
+        # the function's AST, for host functions that analyze Lua functions passed to them
+        self.node = node
+
+    def __repr__(self):
+        return f'Function({self.name}, {list(self.params)})'
+
+
+class Compiler:
+    def __init__(self, name: str = '<main>'):
+        self.name = name
+        self.frame_size = 0
+        self.ops = array('B')
+        self.args = array('i')
+        self.consts: List[Any] = []
+        self.const_index = {}
+        self.names: List[str] = []
+        self.name_index = {}
+
+    def code(self) -> CodeObject:
+        return CodeObject(self.name, self.ops, self.args, self.consts, self.names, self.frame_size)
+
+    def emit(self, op: int, arg: int = 0) -> int:
+        self.ops.append(op)
+        self.args.append(arg)
+        return len(self.ops) - 1
+
+    def patch(self, at: int):
+        self.args[at] = len(self.ops)
+
+    def add_const(self, value: Any) -> int:
+        key = (type(value), value)
+        if key not in self.const_index:
+            self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return self.const_index[key]
+
+    def add_name(self, name: str) -> int:
+        if name not in self.name_index:
+            self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return self.name_index[name]
+
+    def compile_program(self, program: Ast.Program) -> CodeObject:
+        self.frame_size = program.frame_size
+        for block in program.blocks:
+            block.accept(self)
+        self.emit(LOAD_CONST, self.add_const(None))
+        self.emit(RETURN)
+        return self.code()
+
+    def compile_function(self, fn: Ast.Function) -> CodeObject:
+        # parameters occupy the first slots of the frame built by CALL
+        self.frame_size = fn.frame_size
+        self.compile_statements(fn.body.statements)
+        self.emit(LOAD_CONST, self.add_const(None))
+        self.emit(RETURN)
+        return self.code()
+
+    def compile_statements(self, statements):
+        for stmt in statements:
+            if isinstance(stmt, Ast.Function) and stmt.name is not None:
+                self.compile_function_def(stmt, keep_value=False)
+                continue
+            stmt.accept(self)
+            if isinstance(stmt, Ast.Expression):
+                self.emit(POP_TOP)
+
+    def compile_function_def(self, fn: Ast.Function, keep_value: bool):
+        proto = FunctionProto(fn.name, tuple(fn.params), Compiler(fn.name or '<anonymous>').compile_function(fn), fn.memo, fn)
+        self.emit(MAKE_FUNCTION, self.add_const(proto))
+        if fn.name is None:
+            return
+        if keep_value:
+            self.emit(DUP_TOP)
+        self.store(fn.name, fn.depth, fn.slot)
+
+    def load(self, name: str, depth: int, slot: int):
+        if depth == GLOBAL:
+            self.emit(LOAD_GLOBAL, self.add_name(name))
+        elif depth == 0:
+            self.emit(LOAD_LOCAL, slot)
+        else:
+            self.emit(LOAD_OUTER, depth << DEPTH_SHIFT | slot)
+
+    def store(self, name: str, depth: int, slot: int):
+        if depth == GLOBAL:
+            self.emit(STORE_GLOBAL, self.add_name(name))
+        elif depth == 0:
+            self.emit(STORE_LOCAL, slot)
+        else:
+            self.emit(STORE_OUTER, depth << DEPTH_SHIFT | slot)
+
+    def visit_literal(self, le: Ast.Literal):
+        self.emit(LOAD_CONST, self.add_const(le.value))
+
+    def visit_identifier(self, ident: Ast.Identifier):
+        self.load(ident.name, ident.depth, ident.slot)
+
+    def visit_grouped_expression(self, ge: Ast.GroupedExpr):
+        ge.inner.accept(self)
+
+    def visit_binary_expr(self, expr: Ast.BinaryExpr):
+        token_type = expr.op.token_type
+        if token_type in (TokenType.AND, TokenType.OR):
+            expr.left.accept(self)
+            jump = self.emit(JUMP_IF_FALSE_OR_POP if token_type == TokenType.AND else JUMP_IF_TRUE_OR_POP)
+            expr.right.accept(self)
+            self.patch(jump)
+            return
+
+        if token_type not in BINARY_INDEX:
+            print(f"Unrecognized binary operator '{expr.op.lexeme}'")
+            exit(1)
+
+        expr.left.accept(self)
+        expr.right.accept(self)
+        self.emit(BINARY_OP, BINARY_INDEX[token_type])
+
+    def visit_unary_expression(self, ue: Ast.UnaryExpr):
+        if ue.op.token_type not in UNARY_INDEX:
+            print(f"Unrecognized unary operator '{ue.op.lexeme}'")
+            exit(1)
+        ue.operand.accept(self)
+        self.emit(UNARY_OP, UNARY_INDEX[ue.op.token_type])
+
+    def visit_assignment(self, stmt: Ast.AssignStatement):
+        stmt.value.accept(self)
+        self.store(stmt.name, stmt.ident.depth, stmt.ident.slot)
+
+    def visit_index_assignment(self, stmt: Ast.IndexAssignStatement):
+        stmt.target.obj.accept(self)
+        stmt.target.key.accept(self)
+        stmt.value.accept(self)
+        self.emit(STORE_INDEX)
+
+    def visit_table_expr(self, te: Ast.TableExpr):
+        self.emit(NEW_TABLE)
+        position = 0
+        for key, value in te.fields:
+            if key is None:
+                position += 1
+                self.emit(LOAD_CONST, self.add_const(position))
+            else:
+                key.accept(self)
+            value.accept(self)
+            self.emit(TABLE_SET)
+
+    def visit_index_expr(self, ie: Ast.IndexExpr):
+        ie.obj.accept(self)
+        ie.key.accept(self)
+        self.emit(LOAD_INDEX)
+
+    def visit_return_statement(self, rs: Ast.ReturnStatement):
+        if isinstance(rs.value, Ast.FunctionCall):
+            # the callee takes over the caller's activation, so 'return f(x)' runs in constant space
+            self.visit_function_call(rs.value, TAIL_CALL)
+            # only reached when the VM runs the tail call as a plain call, for a memoized callee
+            self.emit(RETURN)
+            return
+        rs.value.accept(self)
+        self.emit(RETURN)
+
+    def visit_block(self, block: Ast.Block):
+        if block.frame_size is None:
+            # block locals already have their own frame slots, so no scope is pushed at runtime
+            self.compile_statements(block.statements)
+            return
+        # a closure captures one of its locals, each entry gets a fresh frame
+        self.emit(ENTER_BLOCK, block.frame_size)
+        self.compile_statements(block.statements)
+        self.emit(LEAVE_BLOCK)
+
+    def visit_while_loop(self, wl: Ast.WhileLoop):
+        start = len(self.ops)
+        wl.condition.accept(self)
+        exit_jump = self.emit(JUMP_IF_FALSE)
+        wl.body.accept(self)
+        self.emit(JUMP, start)
+        self.patch(exit_jump)
+
+    def visit_for_loop(self, fl: Ast.ForLoop):
+        # FOR_PREP replaces start, stop and step with a native iterator that FOR_ITER advances
+        fl.initializer.value.accept(self)
+        fl.stop.accept(self)
+        fl.step.accept(self)
+        self.emit(FOR_PREP)
+        loop = self.emit(FOR_ITER)
+        if fl.frame_size is not None:
+            self.emit(ENTER_BLOCK, fl.frame_size)
+        self.store(fl.initializer.name, fl.initializer.ident.depth, fl.initializer.ident.slot)
+        fl.body.accept(self)
+        if fl.frame_size is not None:
+            self.emit(LEAVE_BLOCK)
+        self.emit(JUMP, loop)
+        self.patch(loop)
+
+    def visit_if_stmt(self, if_stmt: Ast.IfStatement):
+        if_stmt.condition.accept(self)
+        else_jump = self.emit(JUMP_IF_FALSE)
+        if_stmt.true_block.accept(self)
+        if if_stmt.else_block is None:
+            self.patch(else_jump)
+            return
+        end_jump = self.emit(JUMP)
+        self.patch(else_jump)
+        if_stmt.else_block.accept(self)
+        self.patch(end_jump)
+
+    def visit_function_def(self, fn: Ast.Function):
+        self.compile_function_def(fn, keep_value=True)
+
+    def visit_function_call(self, fc: Ast.FunctionCall, opcode: int = CALL):
+        if fc.callee is None:
+            self.load(fc.name, fc.depth, fc.slot)
+        else:
+            fc.callee.accept(self)
+        for arg in fc.args:
+            arg.accept(self)
+        self.emit(opcode, len(fc.args))
+
+
+def compile_program(program: Ast.Program, registry: Registry = None) -> CodeObject:
+    return Compiler().compile_program(resolve(program, registry))
+
+
+def disassemble(code: CodeObject) -> str:
+    lines = [f'{code.name}:']
+    for pc, (op, arg) in enumerate(zip(code.ops, code.args)):
+        detail = ''
+        if op in (LOAD_CONST, MAKE_FUNCTION):
+            detail = f' ({code.consts[arg]!r})'
+        elif op in (LOAD_GLOBAL, STORE_GLOBAL):
+            detail = f' ({code.names[arg]})'
+        elif op in (LOAD_OUTER, STORE_OUTER):
+            detail = f' (depth {arg >> DEPTH_SHIFT}, slot {arg & SLOT_MASK})'
+        elif op == BINARY_OP:
+            detail = f' ({BINARY_TYPES[arg].value})'
+        elif op == UNARY_OP:
+            detail = f' ({UNARY_TYPES[arg].value})'
+        lines.append(f'{pc:>5} {OPNAMES[op]:<22}{arg}{detail}')
+    for const in code.consts:
+        if isinstance(const, FunctionProto):
+            lines.append('')
+            lines.append(disassemble(const.code))
+    return '\n'.join(lines)
@@ -0,0 +1,71 @@
+from typing import Any
+from host import VMFunction, check, register
+
+
+class Coroutine:
+    """
+    A Lua coroutine, run by VM.resume. While suspended it keeps the code, frame, operand stack, pc and call
+    stack its execute loop had when it yielded, so resuming carries on right after the yield. Interpreter
+    values are single, so resume returns the one value passed to yield, or returned by the function, and
+    the first extra argument of a later resume is the value yield returns. resume returns nil for a dead
+    coroutine, or one that fails, see VM.resume.
+    """
+    __slots__ = ('fn', 'status', 'main', 'code', 'frame', 'stack', 'pc', 'calls')
+
+    lua_type = 'thread'
+
+    def __init__(self, fn: Any, main: bool = False):
+        self.fn = fn
+        # 'suspended', 'running', 'normal' while it resumes another coroutine, or 'dead'
+        self.status = 'suspended'
+        # the whole script run by Chunk.run_async, it can await async host functions but cannot yield
+        self.main = main
+        self.code = None
+        self.frame = None
+        # None until the first resume starts the function
+        self.stack = None
+        self.pc = 0
+        self.calls = None
+
+    def __repr__(self):
+        return f'Coroutine({self.fn}, {self.status})'
+
+
+def create(fn: Any) -> Coroutine:
+    check('coroutine.create', 1, fn, 'function')
+    return Coroutine(fn)
+
+
+def resume(vm: Any, co: Any, *args: Any) -> Any:
+    check('coroutine.resume', 1, co, 'thread')
+    return vm.resume(co, list(args))
+
+
+def status(co: Any) -> str:
+    check('coroutine.status', 1, co, 'thread')
+    return co.status
+
+
+def wrap(fn: Any) -> VMFunction:
+    """A function resuming a new coroutine running fn each time it is called, errors are not caught"""
+    co = create(fn)
+    return VMFunction('coroutine.wrap', lambda vm, *args: vm.resume(co, list(args), protected=False))
+
+
+def is_yieldable(vm: Any) -> bool:
+    return vm.current is not None and not vm.current.main
+
+
+def lua_yield(vm: Any, *args: Any):
+    # VM.execute recognises YIELD itself, as suspending needs the state of its loop
+    raise AssertionError('coroutine.yield is handled by VM.execute')
+
+
+YIELD = VMFunction('coroutine.yield', lua_yield)
+
+register('coroutine.create', create, 1, ('function',))
+register('coroutine.resume', VMFunction('coroutine.resume', resume), (1, None))
+register('coroutine.yield', YIELD, (0, 1))
+register('coroutine.status', status, 1, ('thread',))
+register('coroutine.wrap', wrap, 1, ('function',))
+register('coroutine.isyieldable', VMFunction('coroutine.isyieldable', is_yieldable), 0)
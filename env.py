@@ -1,17 +1,22 @@
-from typing import Any, Dict
+from typing import Any, Dict, List
+from host import Registry, REGISTRY
 
 
 class Env:
-    def __init__(self):
+    def __init__(self, registry: Registry = None):
+        # where global names the script never assigned are looked up
+        self.registry = REGISTRY if registry is None else registry
         self.level: int = -1
         self.symbol_table: Dict[int, dict] = {}
+        # cleared level tables kept for reuse so entering a block or call does not allocate
+        self.free_levels: List[dict] = []
 
     def __repr__(self):
         return str(self.symbol_table)
 
     def get(self, name: str):
         level = self.get_level_of_symbol(name)
-        return None if level == -1 else self.symbol_table[level][name]
+        return self.registry.globals.get(name) if level == -1 else self.symbol_table[level][name]
 
     def set(self, name: str, val: Any, is_local: bool = True):
         if is_local:
@@ -31,12 +36,40 @@ class Env:
 
     def add_level(self):
         self.level += 1
-        self.symbol_table[self.level] = {}
+        self.symbol_table[self.level] = self.free_levels.pop() if self.free_levels else {}
 
     def pop_level(self):
         if self.level > 0:
-            del self.symbol_table[self.level]
+            scope = self.symbol_table.pop(self.level)
+            scope.clear()
+            self.free_levels.append(scope)
             self.level -= 1
 
     def has_symbol(self, name: str):
         return self.get_level_of_symbol(name) != -1
+
+
+class Frame(list):
+    """
+    Array-backed activation record. Variables are addressed by the (depth, slot) pairs computed by
+    resolver.Resolver: depth is the number of parent links to follow, slot the index into that frame.
+    """
+    __slots__ = ('parent', 'globals')
+
+    def __init__(self, size: int, parent: 'Frame' = None):
+        super().__init__((None,) * size)
+        self.parent = parent
+        # the globals table of the run that made the outermost frame, read by the closure backend
+        self.globals: Dict[str, Any] = None if parent is None else parent.globals
+
+    def ancestor(self, depth: int) -> 'Frame':
+        frame = self
+        for _ in range(depth):
+            frame = frame.parent
+        return frame
+
+    def get(self, depth: int, slot: int):
+        return self.ancestor(depth)[slot]
+
+    def set(self, depth: int, slot: int, val: Any):
+        self.ancestor(depth)[slot] = val
@@ -1,6 +1,93 @@
+import sys
+from typing import Union
 import Ast
 from parser import Parser
+from env import Env
+from compiler import compile_program
+from resolver import resolve
+from vm import VM
+from optimizer import optimize
+from purity import memoize as memoize_pure
+from quicken import QuickeningVisitor
+from profiler import ProfilingVisitor
+import closure_compiler
+from arena import Arena
+from cache import ScriptCache
+# registers the array builtins with the host globals when NumPy is installed
+import arrays
+
+
+BACKENDS = ('tree', 'quick', 'vm', 'closure')
+
+
+def evaluate(program: Union[Ast.Program, Arena], backend: str = 'tree', env: Env = None, optimized: bool = False,
+             memoize: bool = False):
+    env = Env() if env is None else env
+    if isinstance(program, Arena):
+        # the backends all run on Ast objects
+        program = program.decode()
+    if optimized:
+        program = optimize(program)
+    if memoize:
+        memoize_pure(program)
+
+    if backend in ('tree', 'quick'):
+        # the compiled backends resolve while compiling, the resolver also checks calls of host functions
+        resolve(program, env.registry)
+
+    if backend == 'tree':
+        return program.accept(Ast.Visitor(env))
+
+    if backend == 'quick':
+        return program.accept(QuickeningVisitor(env))
+
+    if backend == 'vm':
+        return VM(env).run(compile_program(program, env.registry))
+
+    if backend == 'closure':
+        return closure_compiler.compile_program(program, env)()
+
+    print(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    exit(1)
 
 
 if __name__ == "__main__":
-    pass
+    flags = [arg for arg in sys.argv[1:] if arg.startswith('-')]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('-')]
+    profile = next((flag for flag in flags if flag.split('=')[0] == '--profile'), None)
+    if not args:
+        print(f'Usage: python eval.py [-O] [--memoize] [--no-cache] [--profile[=<collapsed stacks file>]] <script> '
+              f'[{"|".join(BACKENDS)}]')
+        exit(1)
+
+    optimized = '-O' in flags
+    memoize = '--memoize' in flags
+    if '--no-cache' in flags:
+        # lexed from a memory map, the script is never read into one str
+        program = Parser.from_file(args[0]).parse_program()
+    else:
+        with open(args[0]) as f:
+            source = f.read()
+        # the cached form is already optimized when -O is given
+        program, optimized = ScriptCache().parse(source, optimized), False
+
+    env = Env()
+    if profile is None:
+        print(evaluate(program, args[1] if len(args) > 1 else 'tree', env, optimized, memoize))
+    else:
+        # profiling runs on the tree-walking evaluator
+        if isinstance(program, Arena):
+            program = program.decode()
+        if optimized:
+            program = optimize(program)
+        if memoize:
+            memoize_pure(program)
+        resolve(program, env.registry)
+        profiler = ProfilingVisitor(env)
+        print(program.accept(profiler))
+        profiler.finish()
+        print(profiler.report(), file=sys.stderr)
+        if '=' in profile:
+            with open(profile.split('=', 1)[1], 'w') as f:
+                f.write(profiler.collapsed_stacks() + '\n')
+    print(env)
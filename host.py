@@ -0,0 +1,301 @@
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Union
+from table import LuaTable
+from rope import Rope, STRING_TYPES, flatten
+import inspect
+import math
+import re
+import ops
+
+
+TYPE_NAMES = ('nil', 'boolean', 'number', 'string', 'table', 'function', 'userdata', 'thread', 'any')
+
+
+class Signature:
+    """
+    Optional metadata of a host function, checked against calls before the program runs. arity is the
+    accepted argument count as (minimum, maximum), maximum None for variadic functions. types names the
+    expected type of each parameter, 'any' accepts everything.
+    """
+    __slots__ = ('arity', 'types')
+
+    def __init__(self, arity: Tuple[int, Optional[int]], types: Optional[Sequence[str]]):
+        self.arity = arity
+        self.types = None if types is None else tuple(types)
+
+    def accepts(self, count: int) -> bool:
+        minimum, maximum = self.arity
+        return minimum <= count and (maximum is None or count <= maximum)
+
+
+class VMFunction:
+    """
+    A host function that needs the VM calling it, such as coroutine.resume. The vm backend calls fn with
+    the VM followed by the Lua arguments, the other backends cannot run it.
+    """
+    __slots__ = ('name', 'fn')
+
+    def __init__(self, name: str, fn: Callable):
+        self.name = name
+        self.fn = fn
+
+    def __repr__(self):
+        return f'VMFunction({self.name})'
+
+    def __call__(self, *args: Any):
+        print(f"'{self.name}' is only supported by the vm backend")
+        exit(1)
+
+
+class AsyncFunction:
+    """
+    A coroutine function registered as a host function. A script run by Chunk.run_async suspends at a call
+    until the event loop has awaited the call's result, other scripts keep running meanwhile.
+    """
+    __slots__ = ('name', 'fn')
+
+    def __init__(self, name: str, fn: Callable):
+        self.name = name
+        self.fn = fn
+
+    def __repr__(self):
+        return f'AsyncFunction({self.name})'
+
+    def __call__(self, *args: Any):
+        print(f"Async host function '{self.name}' can only be called by a script run with Chunk.run_async")
+        exit(1)
+
+
+class Namespace(LuaTable):
+    """
+    Global table holding the host functions registered under a dotted name, 'string' for 'string.len'.
+    Scripts can read it but not modify it, the same table is seen by every script of a Registry.
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name: str):
+        super().__init__()
+        self.name = name
+
+    def set(self, key: Any, value: Any):
+        print(f"Attempt to modify read-only table '{self.name}'")
+        exit(1)
+
+    def copy(self) -> 'Namespace':
+        namespace = Namespace(self.name)
+        namespace.array = self.array.copy()
+        namespace.hash = self.hash.copy()
+        return namespace
+
+
+class Registry:
+    """
+    The host values scripts can read without declaring them, looked up when a global name is not in the
+    Env, and the signatures of the host functions among them. A script assigning the name shadows the host
+    value. REGISTRY holds the standard library, every runtime.Runtime registers into its own copy.
+    """
+    def __init__(self):
+        self.globals: Dict[str, Any] = {}
+        # by registered name, 'print' or 'string.len'
+        self.signatures: Dict[str, Signature] = {}
+
+    def copy(self) -> 'Registry':
+        registry = Registry()
+        # namespaces are copied too, so registering 'string.trim' in the copy leaves this registry alone
+        registry.globals = {name: value.copy() if type(value) is Namespace else value
+                            for name, value in self.globals.items()}
+        registry.signatures = self.signatures.copy()
+        return registry
+
+    def register(self, name: str, value: Any, arity: Union[int, Tuple[int, Optional[int]]] = None,
+                 types: Sequence[str] = None):
+        """
+        Exposes a Python value to scripts: a global for a plain name, a field of a Namespace created on
+        demand for a dotted name such as 'string.len'. Callables are called with the Lua argument values,
+        positionally, and their return value is the result of the call, coroutine functions are wrapped in
+        an AsyncFunction. arity, an int or a (minimum, maximum) pair, and types are optional and only used
+        to check calls ahead of time.
+        """
+        if inspect.iscoroutinefunction(value):
+            value = AsyncFunction(name, value)
+        if '.' in name:
+            namespace, field = name.split('.', 1)
+            table = self.globals.get(namespace)
+            if table is None:
+                table = self.globals[namespace] = Namespace(namespace)
+            LuaTable.set(table, field, value)
+        else:
+            self.globals[name] = value
+
+        if types is not None:
+            for expected in types:
+                if expected not in TYPE_NAMES:
+                    raise ValueError(f"Unknown type '{expected}' for host function '{name}'")
+            if arity is None:
+                arity = len(types)
+        if arity is not None:
+            self.signatures[name] = Signature((arity, arity) if isinstance(arity, int) else arity, types)
+
+
+REGISTRY = Registry()
+
+
+def register(name: str, value: Any, arity: Union[int, Tuple[int, Optional[int]]] = None,
+             types: Sequence[str] = None):
+    """Registers into REGISTRY, see Registry.register"""
+    REGISTRY.register(name, value, arity, types)
+
+
+def host_function(name: str, arity: Union[int, Tuple[int, Optional[int]]] = None, types: Sequence[str] = None):
+    """Decorator form of register"""
+    def decorator(fn: Callable) -> Callable:
+        register(name, fn, arity, types)
+        return fn
+    return decorator
+
+
+def type_name(value: Any) -> str:
+    if value is None:
+        return 'nil'
+    if value is True or value is False:
+        return 'boolean'
+    if isinstance(value, ops.NUMBER_TYPES):
+        return 'number'
+    if isinstance(value, STRING_TYPES):
+        return 'string'
+    if isinstance(value, LuaTable):
+        return 'table'
+    if isinstance(value, ops.ARRAY_TYPES):
+        return 'userdata'
+    # coroutines.Coroutine is a 'thread'
+    return getattr(value, 'lua_type', 'function')
+
+
+def check(name: str, position: int, value: Any, expected: str):
+    if type_name(value) != expected:
+        print(f"Bad argument #{position} to '{name}' ({expected} expected, got {type_name(value)})")
+        exit(1)
+
+
+def to_string(value: Any) -> str:
+    if value is None:
+        return 'nil'
+    if value is True or value is False:
+        return 'true' if value else 'false'
+    if type(value) is Rope:
+        return value.flatten()
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    return f'{type_name(value)}: 0x{id(value):08x}'
+
+
+@host_function('print', (0, None))
+def lua_print(*values: Any):
+    print('\t'.join(map(to_string, values)))
+
+
+@host_function('type', 1)
+def lua_type(value: Any) -> str:
+    return type_name(value)
+
+
+@host_function('tostring', 1)
+def lua_tostring(value: Any) -> str:
+    return to_string(value)
+
+
+# numerals as Lua reads them, with an optional sign
+DECIMAL_NUMERAL = re.compile(r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?')
+HEX_NUMERAL = re.compile(r'[+-]?0[xX](?:[0-9a-fA-F]+\.?[0-9a-fA-F]*|\.[0-9a-fA-F]+)(?:[pP][+-]?[0-9]+)?')
+FLOAT_MARKS = re.compile(r'[.eE]')
+HEX_FLOAT_MARKS = re.compile(r'[.pP]')
+
+
+@host_function('tonumber', 1)
+def lua_tonumber(value: Any) -> Any:
+    if isinstance(value, ops.NUMBER_TYPES) and value is not True and value is not False:
+        return value
+    if not isinstance(value, STRING_TYPES):
+        return None
+    # int() and float() would also take Python-only forms such as '1_000', 'inf' or 'nan'
+    text = flatten(value).strip(' \t\n\r\f\v')
+    if DECIMAL_NUMERAL.fullmatch(text):
+        return float(text) if FLOAT_MARKS.search(text) else int(text)
+    if HEX_NUMERAL.fullmatch(text):
+        return float.fromhex(text) if HEX_FLOAT_MARKS.search(text) else int(text, 16)
+    return None
+
+
+@host_function('string.len', 1, ('string',))
+def string_len(s: Any) -> int:
+    check('string.len', 1, s, 'string')
+    return len(s)
+
+
+@host_function('string.sub', (2, 3), ('string', 'number', 'number'))
+def string_sub(s: Any, i: int, j: int = -1) -> str:
+    check('string.sub', 1, s, 'string')
+    check('string.sub', 2, i, 'number')
+    check('string.sub', 3, j, 'number')
+    s = flatten(s)
+    # 1-based and inclusive, negative positions count from the end
+    length = len(s)
+    i = int(i) if i >= 0 else max(length + int(i) + 1, 1)
+    j = int(j) if j >= 0 else length + int(j) + 1
+    return s[max(i, 1) - 1:j]
+
+
+@host_function('string.upper', 1, ('string',))
+def string_upper(s: Any) -> str:
+    check('string.upper', 1, s, 'string')
+    return flatten(s).upper()
+
+
+@host_function('string.lower', 1, ('string',))
+def string_lower(s: Any) -> str:
+    check('string.lower', 1, s, 'string')
+    return flatten(s).lower()
+
+
+@host_function('string.rep', 2, ('string', 'number'))
+def string_rep(s: Any, n: int) -> str:
+    check('string.rep', 1, s, 'string')
+    check('string.rep', 2, n, 'number')
+    return flatten(s) * max(int(n), 0)
+
+
+@host_function('string.reverse', 1, ('string',))
+def string_reverse(s: Any) -> str:
+    check('string.reverse', 1, s, 'string')
+    return flatten(s)[::-1]
+
+
+def number_function(name: str, fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    def wrapper(x: Any):
+        check(name, 1, x, 'number')
+        return fn(x)
+    register(name, wrapper, 1, ('number',))
+    return wrapper
+
+
+number_function('math.floor', math.floor)
+number_function('math.ceil', math.ceil)
+number_function('math.abs', abs)
+number_function('math.sqrt', lambda x: math.sqrt(x) if x >= 0 else math.nan)
+
+
+@host_function('math.max', (1, None))
+def math_max(*values: Any):
+    for position, value in enumerate(values, 1):
+        check('math.max', position, value, 'number')
+    return max(values)
+
+
+@host_function('math.min', (1, None))
+def math_min(*values: Any):
+    for position, value in enumerate(values, 1):
+        check('math.min', position, value, 'number')
+    return min(values)
+
+
+register('math.pi', math.pi)
+register('math.huge', math.inf)
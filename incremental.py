@@ -0,0 +1,162 @@
+from Token import TokenType, Token
+from regex_lexer import RegexLexer, PUNCTUATION
+from parser import Parser
+from bisect import bisect_left, bisect_right
+from typing import List
+import Ast
+
+
+PUNCTUATION_TYPES = frozenset(PUNCTUATION.values())
+
+
+def token_start(token: Token) -> int:
+    # identifiers, numbers and strings record their end, two character operators their second character
+    if token.token_type == TokenType.EOF:
+        return token.pos
+    if token.token_type in PUNCTUATION_TYPES:
+        return token.pos - len(token.lexeme) + 1
+    return token.pos - len(token.lexeme)
+
+
+def token_end(token: Token) -> int:
+    if token.token_type == TokenType.EOF:
+        return token.pos
+    return token_start(token) + len(token.lexeme)
+
+
+def first_token_ending_at(tokens: List[Token], offset: int) -> int:
+    low, high = 0, len(tokens)
+    while low < high:
+        middle = (low + high) // 2
+        if token_end(tokens[middle]) < offset:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class IncrementalDocument:
+    """
+    A source string kept together with its tokens and the top-level statements parsed from them, for
+    editors that apply small edits to large scripts. edit() re-lexes from the token before the edit until
+    the new tokens line up with an old token past it again, shifts pos/line/col of the old tokens that
+    follow and reparses only the top-level statements whose tokens changed. Statements and tokens that
+    are kept are the same objects as before the edit.
+
+    Reparsing is per top-level statement, not per innermost Block: an edit inside a function body or a
+    loop reparses the whole top-level function or loop statement containing it, so reparse time grows
+    with the size of that statement rather than with the size of the edit.
+    """
+    def __init__(self, source: str = ''):
+        self.source = source
+        self.tokens: List[Token] = []
+        self.statements: List[Ast.Statement] = []
+        # token index each statement starts at, plus the index parsing stopped at
+        self.bounds: List[int] = [0]
+        self.load(source)
+
+    def load(self, source: str):
+        self.source = source
+        self.tokens = RegexLexer().lex(source)
+        self.statements = []
+        self.bounds = [0]
+        self.reparse(0, 0)
+
+    @property
+    def program(self) -> Ast.Program:
+        if not self.statements:
+            return Ast.Program([])
+        return Ast.Program([Ast.Block(self.statements)])
+
+    def edit(self, offset: int, removed: int, inserted: str) -> Ast.Program:
+        """Replaces removed characters at offset with inserted and returns the updated program"""
+        self.source = self.source[:offset] + inserted + self.source[offset + removed:]
+        if not self.source or len(self.tokens) < 2:
+            self.load(self.source)
+            return self.program
+
+        first, new_tokens, last = self.relex(offset, removed, inserted)
+        old_bounds = self.bounds
+        self.tokens[first:last] = new_tokens
+        token_delta = len(new_tokens) - (last - first)
+
+        # the statement before the changed tokens may have stopped because of what it saw next
+        statement = max(bisect_right(old_bounds, max(first - 1, 0), 0, len(old_bounds) - 1) - 1, 0)
+        self.reparse(statement, first + len(new_tokens), token_delta)
+        return self.program
+
+    def relex(self, offset: int, removed: int, inserted: str):
+        tokens = self.tokens
+        delta = len(inserted) - removed
+        edit_end = offset + len(inserted)
+
+        # an edit right after a token can extend it, so lexing restarts at the token before the edit
+        first = min(max(first_token_ending_at(tokens, offset) - 1, 0), len(tokens) - 2)
+        lexer = RegexLexer()
+        lexer.source = self.source
+        if first == 0:
+            scanned = lexer.scan(0, 1, 1)
+        else:
+            token = tokens[first]
+            col = token.col
+            if token.token_type in PUNCTUATION_TYPES:
+                col -= len(token.lexeme) - 1
+            scanned = lexer.scan(token_start(token), token.line, col)
+
+        new_tokens = []
+        last = first
+        for token in scanned:
+            start = token_start(token)
+            if start >= edit_end:
+                # past the edit the text is unchanged, so a matching old token means the rest matches too
+                old_start = start - delta
+                while last < len(tokens) and token_start(tokens[last]) < old_start:
+                    last += 1
+                old = tokens[last] if last < len(tokens) else None
+                if (old is not None and token_start(old) == old_start and old.token_type == token.token_type
+                        and old.lexeme == token.lexeme):
+                    self.shift(last, delta, token.line - old.line, token.col - old.col)
+                    return first, new_tokens, last
+            new_tokens.append(token)
+        return first, new_tokens, len(tokens)
+
+    def shift(self, first: int, delta: int, line_delta: int, col_delta: int):
+        tokens = self.tokens
+        if col_delta:
+            # only tokens on the line the edit ended on move sideways
+            line = tokens[first].line
+            for i in range(first, len(tokens)):
+                token = tokens[i]
+                if token.line != line:
+                    break
+                token.col += col_delta
+        if delta or line_delta:
+            for i in range(first, len(tokens)):
+                token = tokens[i]
+                token.pos += delta
+                token.line += line_delta
+
+    def reparse(self, statement: int, changed_end: int, token_delta: int = 0):
+        tokens, old_bounds, old_statements = self.tokens, self.bounds, self.statements
+        start = old_bounds[statement]
+        parser = Parser(tokens=(tokens[i] for i in range(start, len(tokens))))
+        statements = old_statements[:statement]
+        bounds = old_bounds[:statement]
+
+        while True:
+            position = start + parser.pos
+            if position >= changed_end:
+                # an old statement starting on this (unchanged) token is parsed exactly as before
+                old = bisect_left(old_bounds, position - token_delta, statement + 1, len(old_bounds) - 1)
+                if old < len(old_bounds) - 1 and old_bounds[old] == position - token_delta:
+                    self.statements = statements + old_statements[old:]
+                    self.bounds = bounds + [bound + token_delta for bound in old_bounds[old:]]
+                    return
+            if parser.accept(TokenType.ELSE, TokenType.END, TokenType.EOF):
+                break
+            bounds.append(position)
+            statements.append(parser.parse_statement())
+
+        bounds.append(start + parser.pos)
+        self.statements = statements
+        self.bounds = bounds
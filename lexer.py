@@ -1,5 +1,6 @@
 from Token import TokenType, Token
-from typing import List
+from typing import Dict, List
+from sys import intern
 
 
 class Lexer:
@@ -9,6 +10,8 @@ class Lexer:
         self.line: int = 0
         self.col: int = 0
         self.tokens: List[Token] = []
+        # one shared string per distinct identifier instead of a copy per occurrence
+        self.names: Dict[str, str] = {}
         self.keywords = {
             'function': TokenType.FUNCTION,
             'return': TokenType.RETURN,
@@ -26,7 +29,8 @@ class Lexer:
             'end': TokenType.END,
             'if': TokenType.IF,
             'elseif': TokenType.ELSEIF,
-            'do': TokenType.DO
+            'do': TokenType.DO,
+            'nil': TokenType.NIL
         }
 
     def is_eof(self):
@@ -58,10 +62,13 @@ class Lexer:
 
         c = self.advance()
         while c != '\"':
+            if self.is_eof():
+                print(f'Unterminated string at line:column {start_line}:{start_col}')
+                exit(1)
             lexeme.append(c)
             c = self.advance()
 
-        lexeme = ''.join(lexeme)
+        lexeme = intern(''.join(lexeme))
         self.advance()
         return Token(self.pos, start_line, start_col, TokenType.STRING, f'"{lexeme}"', lexeme)
 
@@ -76,6 +83,7 @@ class Lexer:
             c = self.advance()
 
         lexeme = ''.join(lexeme)
+        lexeme = self.names.setdefault(lexeme, lexeme)
         token_type = TokenType.IDENT if lexeme not in self.keywords else self.keywords[lexeme]
         literal = None
         if token_type in (TokenType.TRUE, TokenType.FALSE):
@@ -136,8 +144,7 @@ class Lexer:
                 self.advance()
                 token = Token(self.pos, self.line, self.col, TokenType.DOTDOT, '..', None)
             else:
-                print(f'Unrecognized token {c}')
-                exit(1)
+                token = Token(self.pos, self.line, self.col, TokenType.DOT, '.', None)
             self.advance()
         elif c == '<':
             if self.peek(1) == '=':
@@ -173,7 +180,7 @@ class Lexer:
             self.advance()
         elif c == '-':
             if self.peek(1) == '-':
-                while c != '\n':
+                while c != '\n' and not self.is_eof():
                     c = self.advance()
                 return self.match()
             else:
@@ -212,21 +219,26 @@ class Lexer:
 
         return token
 
-    def lex(self, source=''):
+    def iter_tokens(self, source=''):
+        """Generator mode: yields each token as soon as it is matched, ending with an EOF token"""
         if source:
             self.source = source
             self.line = 1
             self.col = 1
             self.pos = 0
-            self.tokens.clear()
 
+        token = None
         while not self.is_eof():
             token = self.match()
-            self.tokens.append(token)
+            yield token
 
-        if self.tokens[-1].token_type != TokenType.EOF:
-            self.tokens.append(Token(self.pos, self.line, self.col, TokenType.EOF, '\0', None))
+        if token is None or token.token_type != TokenType.EOF:
+            yield Token(self.pos, self.line, self.col, TokenType.EOF, '\0', None)
 
+    def lex(self, source=''):
+        if source:
+            self.tokens.clear()
+        self.tokens.extend(self.iter_tokens(source))
         return self.tokens
 
 
@@ -1,7 +1,8 @@
-import Ast
+import sys
 from lexer import Lexer
 from parser import Parser
 from env import Env
+from eval import evaluate
 
 if __name__ == '__main__':
     tokens = Lexer().lex("""
@@ -31,7 +32,8 @@ if __name__ == '__main__':
     print('\n'.join([str(t) for t in tokens]))
     parser = Parser(tokens=tokens)
     program = parser.parse_program()
-    visitor = Ast.Visitor(Env())
-    print(program.accept(visitor))
-    print(visitor.env)
+    args = [arg for arg in sys.argv[1:] if arg != '-O']
+    env = Env()
+    print(evaluate(program, args[0] if args else 'tree', env, '-O' in sys.argv))
+    print(env)
 
@@ -0,0 +1,220 @@
+from Token import TokenType
+from table import LuaTable
+from rope import STRING_TYPES, flatten
+import rope
+from typing import Any, Iterable
+from itertools import count
+from math import floor, ceil, inf
+
+try:
+    from numpy import ndarray
+    ARRAY_TYPES = (ndarray,)
+except ImportError:
+    # arrays are an optional feature, without NumPy no value is an array
+    ARRAY_TYPES = ()
+
+
+NUMBER_TYPES = (int, float)
+# arithmetic on an array applies elementwise, broadcasting a number operand
+ARITHMETIC_TYPES = NUMBER_TYPES + ARRAY_TYPES
+
+
+def number_error(op: str):
+    print(f"Operands for '{op}' must be of type number")
+    exit(1)
+
+
+def add(left: Any, right: Any):
+    if isinstance(left, ARITHMETIC_TYPES) and isinstance(right, ARITHMETIC_TYPES):
+        return left + right
+    number_error('+')
+
+
+def sub(left: Any, right: Any):
+    if isinstance(left, ARITHMETIC_TYPES) and isinstance(right, ARITHMETIC_TYPES):
+        return left - right
+    number_error('-')
+
+
+def mul(left: Any, right: Any):
+    if isinstance(left, ARITHMETIC_TYPES) and isinstance(right, ARITHMETIC_TYPES):
+        return left * right
+    number_error('*')
+
+
+def div(left: Any, right: Any):
+    if isinstance(left, ARITHMETIC_TYPES) and isinstance(right, ARITHMETIC_TYPES):
+        return left / right
+    number_error('/')
+
+
+def mod(left: Any, right: Any):
+    if isinstance(left, ARITHMETIC_TYPES) and isinstance(right, ARITHMETIC_TYPES):
+        return left % right
+    number_error('%')
+
+
+def comparable(op: str, left: Any, right: Any):
+    if isinstance(left, NUMBER_TYPES) and isinstance(right, NUMBER_TYPES):
+        return
+    if isinstance(left, STRING_TYPES) and isinstance(right, STRING_TYPES):
+        return
+    print(f"Operands for '{op}' must be both of type number or string")
+    exit(1)
+
+
+def eq(left: Any, right: Any):
+    if type(left) is bool or type(right) is bool:
+        # True == 1 in Python, a boolean only equals itself in Lua
+        return left is right
+    if type(left) in ARRAY_TYPES or type(right) in ARRAY_TYPES:
+        # arrays are reference values like tables
+        return left is right
+    return left == right
+
+
+def ne(left: Any, right: Any):
+    return not eq(left, right)
+
+
+def lt(left: Any, right: Any):
+    comparable('<', left, right)
+    return flatten(left) < flatten(right)
+
+
+def le(left: Any, right: Any):
+    comparable('<=', left, right)
+    return flatten(left) <= flatten(right)
+
+
+def gt(left: Any, right: Any):
+    comparable('>', left, right)
+    return flatten(left) > flatten(right)
+
+
+def ge(left: Any, right: Any):
+    comparable('>=', left, right)
+    return flatten(left) >= flatten(right)
+
+
+def concat(left: Any, right: Any):
+    if isinstance(left, STRING_TYPES) and isinstance(right, STRING_TYPES):
+        return rope.concat(left, right)
+    print("Operands for '..' must be of type string")
+    exit(1)
+
+
+def length(operand: Any):
+    if isinstance(operand, LuaTable):
+        return operand.length()
+    if isinstance(operand, STRING_TYPES) or isinstance(operand, ARRAY_TYPES):
+        return len(operand)
+    print("Operand for '#' must be of type string or table.")
+    exit(1)
+
+
+def array_position(array: Any, key: Any) -> int:
+    # arrays are indexed from 1 like tables
+    if isinstance(key, NUMBER_TYPES) and 0 < key <= len(array) and key == int(key):
+        return int(key) - 1
+    return -1
+
+
+def index(obj: Any, key: Any):
+    if isinstance(obj, LuaTable):
+        return obj.get(key)
+    if isinstance(obj, ARRAY_TYPES):
+        position = array_position(obj, key)
+        return None if position == -1 else obj[position].item()
+    print(f"Attempt to index a non-table value '{obj}'")
+    exit(1)
+
+
+def set_index(obj: Any, key: Any, value: Any):
+    if isinstance(obj, LuaTable):
+        obj.set(key, value)
+        return
+    if isinstance(obj, ARRAY_TYPES):
+        position = array_position(obj, key)
+        if position == -1 or not isinstance(value, NUMBER_TYPES):
+            print(f"Array index {key} out of range or non-number value '{value}'")
+            exit(1)
+        obj[position] = value
+        return
+    print(f"Attempt to index a non-table value '{obj}'")
+    exit(1)
+
+
+def neg(operand: Any):
+    if isinstance(operand, ARITHMETIC_TYPES):
+        return -operand
+    print("Operand for '-' must be of type number.")
+    exit(1)
+
+
+def not_(operand: Any):
+    return operand is None or operand is False
+
+
+def float_range(start: float, stop: float, step: float):
+    value = start
+    if step > 0:
+        while value <= stop:
+            yield value
+            value += step
+    else:
+        while value >= stop:
+            yield value
+            value += step
+
+
+def numeric_range(start: Any, stop: Any, step: Any) -> Iterable:
+    """Values taken by the control variable of 'for v = start, stop, step', evaluated once up front"""
+    for name, value in (('initial', start), ('limit', stop), ('step', step)):
+        if not isinstance(value, NUMBER_TYPES):
+            print(f"'for' {name} value must be a number")
+            exit(1)
+
+    if step == 0:
+        print("'for' step is zero")
+        exit(1)
+
+    if isinstance(start, int) and isinstance(step, int):
+        if stop != stop:
+            # a NaN limit compares false with everything, the loop never runs
+            return ()
+        if stop == inf or stop == -inf:
+            # math.huge has no integer floor: the loop runs forever towards it, or never runs away from it
+            return count(start, step) if (stop > 0) == (step > 0) else ()
+        # integer loop, a float limit is clipped as in Lua 5.4
+        if step > 0:
+            return range(start, floor(stop) + 1, step)
+        return range(start, ceil(stop) - 1, step)
+
+    return float_range(start, stop, step)
+
+
+def is_truthy(value: Any):
+    return value is not None and value is not False
+
+
+BINARY = {
+    TokenType.PLUS: add,
+    TokenType.MINUS: sub,
+    TokenType.STAR: mul,
+    TokenType.SLASH: div,
+    TokenType.PERCENT: mod,
+    TokenType.EQUAL_EQUAL: eq,
+    TokenType.NEQ: ne,
+    TokenType.LESS: lt,
+    TokenType.LEQ: le,
+    TokenType.GREATER: gt,
+    TokenType.GEQ: ge,
+    TokenType.DOTDOT: concat,
+}
+
+UNARY = {
+    TokenType.MINUS: neg,
+    TokenType.HASHTAG: length,
+    TokenType.NOT: not_,
+}
@@ -0,0 +1,268 @@
+from Token import TokenType
+from typing import Any, Dict, List, Optional, Set
+import Ast
+import ops
+
+
+FOLDABLE_ARITHMETIC = (TokenType.PLUS, TokenType.MINUS, TokenType.STAR, TokenType.SLASH, TokenType.PERCENT)
+FOLDABLE_COMPARISON = (
+    TokenType.EQUAL_EQUAL, TokenType.NEQ, TokenType.LESS, TokenType.LEQ, TokenType.GREATER, TokenType.GEQ,
+)
+
+
+def is_number(value: Any):
+    return type(value) in (int, float)
+
+
+class BindingCounter:
+    """Counts how many times each name is bound (assigned, declared, used as a parameter or loop variable)"""
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+
+    def bind(self, name: str, times: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + times
+
+    def count(self, program: Ast.Program) -> Dict[str, int]:
+        for block in program.blocks:
+            block.accept(self)
+        return self.counts
+
+    def visit_literal(self, le: Ast.Literal):
+        pass
+
+    def visit_identifier(self, ident: Ast.Identifier):
+        pass
+
+    def visit_grouped_expression(self, ge: Ast.GroupedExpr):
+        ge.inner.accept(self)
+
+    def visit_binary_expr(self, expr: Ast.BinaryExpr):
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_unary_expression(self, ue: Ast.UnaryExpr):
+        ue.operand.accept(self)
+
+    def visit_assignment(self, stmt: Ast.AssignStatement):
+        self.bind(stmt.name)
+        stmt.value.accept(self)
+
+    def visit_index_assignment(self, stmt: Ast.IndexAssignStatement):
+        stmt.target.accept(self)
+        stmt.value.accept(self)
+
+    def visit_table_expr(self, te: Ast.TableExpr):
+        for key, value in te.fields:
+            if key is not None:
+                key.accept(self)
+            value.accept(self)
+
+    def visit_index_expr(self, ie: Ast.IndexExpr):
+        ie.obj.accept(self)
+        ie.key.accept(self)
+
+    def visit_return_statement(self, rs: Ast.ReturnStatement):
+        rs.value.accept(self)
+
+    def visit_block(self, block: Ast.Block):
+        for stmt in block.statements:
+            stmt.accept(self)
+
+    def visit_while_loop(self, wl: Ast.WhileLoop):
+        wl.condition.accept(self)
+        wl.body.accept(self)
+
+    def visit_for_loop(self, fl: Ast.ForLoop):
+        # the control variable changes every iteration, so it never counts as a constant
+        self.bind(fl.initializer.name, 2)
+        fl.initializer.value.accept(self)
+        fl.stop.accept(self)
+        fl.step.accept(self)
+        fl.body.accept(self)
+
+    def visit_if_stmt(self, if_stmt: Ast.IfStatement):
+        if_stmt.condition.accept(self)
+        if_stmt.true_block.accept(self)
+        if if_stmt.else_block is not None:
+            if_stmt.else_block.accept(self)
+
+    def visit_function_def(self, fn: Ast.Function):
+        if fn.name is not None:
+            self.bind(fn.name)
+        for param in fn.params:
+            self.bind(param)
+        fn.body.accept(self)
+
+    def visit_function_call(self, fc: Ast.FunctionCall):
+        if fc.callee is not None:
+            fc.callee.accept(self)
+        for arg in fc.args:
+            arg.accept(self)
+
+
+class Optimizer:
+    """
+    Rewrites the tree between Parser.parse_program and evaluation:
+    constant folding of operators over literals, propagation of locals that are bound exactly once
+    to a constant, removal of if/while statements whose condition is a constant and unwrapping of
+    GroupedExpr nodes. Folding only happens where every backend agrees on the result, anything
+    that would raise a runtime error is left for runtime.
+    """
+    def __init__(self):
+        self.bindings: Dict[str, int] = {}
+        self.constants: Dict[str, Ast.Literal] = {}
+        self.scopes: List[Set[str]] = []
+
+    def optimize(self, program: Ast.Program) -> Ast.Program:
+        self.bindings = BindingCounter().count(program)
+        program.blocks = [self.optimize_block(block) for block in program.blocks]
+        return program
+
+    def optimize_block(self, block: Ast.Block) -> Ast.Block:
+        self.scopes.append(set())
+        statements = []
+        for stmt in block.statements:
+            stmt = stmt.accept(self)
+            if stmt is None:
+                continue
+            statements.append(stmt)
+            if isinstance(stmt, Ast.ReturnStatement):
+                # anything after a return in the same block is unreachable
+                break
+        for name in self.scopes.pop():
+            del self.constants[name]
+        return Ast.Block(statements)
+
+    @staticmethod
+    def fold_binary(token_type: TokenType, left: Any, right: Any) -> Optional[Ast.Literal]:
+        if token_type in FOLDABLE_ARITHMETIC:
+            if not is_number(left) or not is_number(right):
+                return None
+            if token_type in (TokenType.SLASH, TokenType.PERCENT) and right == 0:
+                return None
+        elif token_type in FOLDABLE_COMPARISON:
+            if not (is_number(left) and is_number(right)) and not (type(left) is str and type(right) is str):
+                return None
+        elif token_type == TokenType.DOTDOT:
+            if type(left) is not str or type(right) is not str:
+                return None
+            # ops.concat may build a Rope, a literal holds the plain str
+            return Ast.Literal(left + right)
+        elif token_type in (TokenType.AND, TokenType.OR):
+            if type(left) is not bool or type(right) is not bool:
+                return None
+            return Ast.Literal(left and right if token_type == TokenType.AND else left or right)
+        else:
+            return None
+        return Ast.Literal(ops.BINARY[token_type](left, right))
+
+    @staticmethod
+    def fold_unary(token_type: TokenType, operand: Any) -> Optional[Ast.Literal]:
+        if token_type == TokenType.MINUS and is_number(operand):
+            return Ast.Literal(-operand)
+        if token_type == TokenType.HASHTAG and type(operand) is str:
+            return Ast.Literal(len(operand))
+        if token_type == TokenType.NOT and type(operand) is bool:
+            return Ast.Literal(not operand)
+        return None
+
+    @staticmethod
+    def constant_condition(expr: Ast.Expression):
+        return isinstance(expr, Ast.Literal)
+
+    def visit_literal(self, le: Ast.Literal):
+        return le
+
+    def visit_identifier(self, ident: Ast.Identifier):
+        return self.constants.get(ident.name, ident)
+
+    def visit_grouped_expression(self, ge: Ast.GroupedExpr):
+        return ge.inner.accept(self)
+
+    def visit_binary_expr(self, expr: Ast.BinaryExpr):
+        expr.left = expr.left.accept(self)
+        expr.right = expr.right.accept(self)
+        if isinstance(expr.left, Ast.Literal) and isinstance(expr.right, Ast.Literal):
+            folded = self.fold_binary(expr.op.token_type, expr.left.value, expr.right.value)
+            if folded is not None:
+                return folded
+        return expr
+
+    def visit_unary_expression(self, ue: Ast.UnaryExpr):
+        ue.operand = ue.operand.accept(self)
+        if isinstance(ue.operand, Ast.Literal):
+            folded = self.fold_unary(ue.op.token_type, ue.operand.value)
+            if folded is not None:
+                return folded
+        return ue
+
+    def visit_assignment(self, stmt: Ast.AssignStatement):
+        stmt.value = stmt.value.accept(self)
+        # top-level locals live in the global table where the host can see and change them
+        if (stmt.is_local and len(self.scopes) > 1 and self.bindings.get(stmt.name) == 1
+                and isinstance(stmt.value, Ast.Literal)):
+            self.constants[stmt.name] = stmt.value
+            self.scopes[-1].add(stmt.name)
+        return stmt
+
+    def visit_index_assignment(self, stmt: Ast.IndexAssignStatement):
+        stmt.target = stmt.target.accept(self)
+        stmt.value = stmt.value.accept(self)
+        return stmt
+
+    def visit_table_expr(self, te: Ast.TableExpr):
+        te.fields = [(None if key is None else key.accept(self), value.accept(self)) for key, value in te.fields]
+        return te
+
+    def visit_index_expr(self, ie: Ast.IndexExpr):
+        ie.obj = ie.obj.accept(self)
+        ie.key = ie.key.accept(self)
+        return ie
+
+    def visit_return_statement(self, rs: Ast.ReturnStatement):
+        rs.value = rs.value.accept(self)
+        return rs
+
+    def visit_block(self, block: Ast.Block):
+        return self.optimize_block(block)
+
+    def visit_while_loop(self, wl: Ast.WhileLoop):
+        wl.condition = wl.condition.accept(self)
+        if self.constant_condition(wl.condition) and not ops.is_truthy(wl.condition.value):
+            return None
+        wl.body = self.optimize_block(wl.body)
+        return wl
+
+    def visit_for_loop(self, fl: Ast.ForLoop):
+        fl.initializer.value = fl.initializer.value.accept(self)
+        fl.stop = fl.stop.accept(self)
+        fl.step = fl.step.accept(self)
+        fl.body = self.optimize_block(fl.body)
+        return fl
+
+    def visit_if_stmt(self, if_stmt: Ast.IfStatement):
+        if_stmt.condition = if_stmt.condition.accept(self)
+        if self.constant_condition(if_stmt.condition):
+            # the surviving branch keeps its own scope by staying a Block
+            if ops.is_truthy(if_stmt.condition.value):
+                return self.optimize_block(if_stmt.true_block)
+            return None if if_stmt.else_block is None else self.optimize_block(if_stmt.else_block)
+
+        if_stmt.true_block = self.optimize_block(if_stmt.true_block)
+        if if_stmt.else_block is not None:
+            if_stmt.else_block = self.optimize_block(if_stmt.else_block)
+        return if_stmt
+
+    def visit_function_def(self, fn: Ast.Function):
+        fn.body = self.optimize_block(fn.body)
+        return fn
+
+    def visit_function_call(self, fc: Ast.FunctionCall):
+        if fc.callee is not None:
+            fc.callee = fc.callee.accept(self)
+        fc.args = [arg.accept(self) for arg in fc.args]
+        return fc
+
+
+def optimize(program: Ast.Program) -> Ast.Program:
+    return Optimizer().optimize(program)
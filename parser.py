@@ -1,28 +1,50 @@
 from Token import TokenType, Token
-from lexer import Lexer
-from typing import List
+from regex_lexer import RegexLexer
+from typing import Deque, Iterable, List
+from collections import deque
 import Ast
 
 
 class Parser:
-    def __init__(self, source: str = None, tokens: List[Token] = None):
+    """
+    Pulls tokens on demand through a bounded lookahead buffer, so tokens can come from a list or
+    straight from RegexLexer.iter_tokens and only the previous token and the next two are kept alive.
+    """
+    def __init__(self, source: str = None, tokens: Iterable[Token] = None):
         if source is not None and tokens is not None:
             print('Parser requires either source string of list of tokens, not both.')
             exit(1)
 
         if source is not None:
-            self.tokens = Lexer(source).lex()
+            self.tokens = RegexLexer().iter_tokens(source)
 
         if tokens is not None:
-            self.tokens = tokens
+            self.tokens = iter(tokens)
 
+        self.lookahead: Deque[Token] = deque()
+        self.last: Token = None
         self.pos: int = 0
 
+    @classmethod
+    def from_file(cls, path: str) -> 'Parser':
+        """A Parser over the file at path, lexed from a memory map of it by RegexLexer.lex_file"""
+        return cls(tokens=RegexLexer().lex_file(path))
+
+    def fill(self, n: int):
+        while len(self.lookahead) <= n:
+            token = next(self.tokens, None)
+            if token is None:
+                # past the end keep answering with the EOF token
+                token = self.lookahead[-1] if self.lookahead else self.last
+            self.lookahead.append(token)
+
     def peek(self, n=0):
-        return self.tokens[self.pos + n]
+        if len(self.lookahead) <= n:
+            self.fill(n)
+        return self.lookahead[n]
 
     def previous(self):
-        return self.peek(-1)
+        return self.last
 
     def is_eof(self):
         return self.peek().token_type == TokenType.EOF
@@ -31,7 +53,8 @@ class Parser:
         if self.is_eof():
             return self.peek()
 
-        token = self.peek()
+        token = self.lookahead.popleft()
+        self.last = token
         self.pos += 1
         return token
 
@@ -70,7 +93,7 @@ class Parser:
 
     def parse_equality(self):
         expr = self.parse_comparison()
-        while self.accept(TokenType.NEQ, TokenType.EQUALS):
+        while self.accept(TokenType.NEQ, TokenType.EQUAL_EQUAL):
             op = self.advance()
             right = self.parse_comparison()
             expr = Ast.BinaryExpr(expr, op, right)
@@ -111,21 +134,77 @@ class Parser:
         if self.accept(TokenType.NUMBER, TokenType.STRING,
                        TokenType.FALSE, TokenType.TRUE):
             return Ast.Literal(self.advance().literal)
+        elif self.accept(TokenType.NIL):
+            self.advance()
+            return Ast.Literal(None)
         elif self.accept(TokenType.IDENT):
             if self.peek(1).token_type == TokenType.LPAREN:
-                return self.parse_function_call()
-            return Ast.Identifier(self.advance().lexeme)
+                return self.parse_index(self.parse_function_call())
+            return self.parse_index(Ast.Identifier(self.advance().lexeme))
         elif self.accept(TokenType.LPAREN):
             self.advance()
             expr = Ast.GroupedExpr(self.parse_expression())
             self.expect(TokenType.RPAREN)
-            return expr
+            return self.parse_index(expr)
+        elif self.accept(TokenType.LBRACE):
+            return self.parse_table()
         elif self.accept(TokenType.FUNCTION):
             return self.parse_function_def()
         else:
             print(f'Invalid token {self.peek()}')
             exit(1)
 
+    def parse_index(self, expr: Ast.Expression) -> Ast.Expression:
+        while self.accept(TokenType.LBRACKET, TokenType.DOT, TokenType.LPAREN):
+            if self.accept(TokenType.LPAREN):
+                expr = Ast.FunctionCall(self.describe(expr), self.parse_arguments(), expr)
+            elif self.advance().token_type == TokenType.DOT:
+                self.expect(TokenType.IDENT)
+                expr = Ast.IndexExpr(expr, Ast.Literal(self.previous().lexeme))
+            else:
+                expr = Ast.IndexExpr(expr, self.parse_expression())
+                self.expect(TokenType.RBRACKET)
+        return expr
+
+    @staticmethod
+    def describe(expr: Ast.Expression) -> str:
+        """Name of a called expression for error messages: string.len, t[...], ..."""
+        if isinstance(expr, Ast.Identifier):
+            return expr.name
+        if isinstance(expr, Ast.FunctionCall):
+            return f'{expr.name}(...)'
+        if isinstance(expr, Ast.IndexExpr):
+            key = expr.key
+            if isinstance(key, Ast.Literal) and isinstance(key.value, str):
+                return f'{Parser.describe(expr.obj)}.{key.value}'
+            return f'{Parser.describe(expr.obj)}[...]'
+        return '?'
+
+    def parse_table(self) -> Ast.TableExpr:
+        self.expect(TokenType.LBRACE)
+        fields = []
+        while not self.accept(TokenType.RBRACE):
+            if self.accept(TokenType.LBRACKET):
+                self.advance()
+                key = self.parse_expression()
+                self.expect(TokenType.RBRACKET)
+                self.expect(TokenType.EQUALS)
+                fields.append((key, self.parse_expression()))
+            elif self.accept(TokenType.IDENT) and self.peek(1).token_type == TokenType.EQUALS:
+                key = Ast.Literal(self.advance().lexeme)
+                self.expect(TokenType.EQUALS)
+                fields.append((key, self.parse_expression()))
+            else:
+                fields.append((None, self.parse_expression()))
+
+            if not self.accept(TokenType.RBRACE):
+                if self.accept(TokenType.SEMI):
+                    self.advance()
+                else:
+                    self.expect(TokenType.COMMA)
+        self.expect(TokenType.RBRACE)
+        return Ast.TableExpr(fields)
+
     def parse_function_def(self) -> Ast.Function:
         self.expect(TokenType.FUNCTION)
         name = None
@@ -148,7 +227,9 @@ class Parser:
     def parse_function_call(self) -> Ast.FunctionCall:
         self.expect(TokenType.IDENT)
         name = self.previous().lexeme
+        return Ast.FunctionCall(name, self.parse_arguments())
 
+    def parse_arguments(self) -> List[Ast.Expression]:
         self.expect(TokenType.LPAREN)
         args = []
         while not self.accept(TokenType.RPAREN):
@@ -156,13 +237,16 @@ class Parser:
             if not self.accept(TokenType.RPAREN):
                 self.expect(TokenType.COMMA)
         self.expect(TokenType.RPAREN)
-
-        return Ast.FunctionCall(name, args)
+        return args
 
     def parse_program(self) -> Ast.Program:
         blocks = []
         while not self.is_eof():
             blocks.append(self.parse_block())
+            if not self.is_eof():
+                # a block stops at 'else' or 'end', which only close a nested one
+                print(f'Unrecognized token {self.peek()}')
+                exit(1)
         return Ast.Program(blocks)
 
     def parse_block(self) -> Ast.Block:
@@ -172,11 +256,19 @@ class Parser:
         return Ast.Block(statements)
 
     def parse_statement(self) -> Ast.Statement:
+        token = self.peek()
+        stmt = self.parse_statement_kind()
+        stmt.token = token
+        return stmt
+
+    def parse_statement_kind(self) -> Ast.Statement:
         if self.accept(TokenType.LOCAL):
             return self.parse_assignment()
         if self.accept(TokenType.IDENT):
             if self.peek(1).token_type == TokenType.LPAREN:
                 return self.parse_function_call()
+            if self.peek(1).token_type in (TokenType.LBRACKET, TokenType.DOT):
+                return self.parse_index_assignment()
             return self.parse_assignment()
         if self.accept(TokenType.RETURN):
             return self.parse_return_statement()
@@ -225,7 +317,7 @@ class Parser:
         self.expect(TokenType.COMMA)
         stop = self.parse_expression()
 
-        step = 1
+        step = Ast.Literal(1)
         if self.accept(TokenType.COMMA):
             self.expect(TokenType.COMMA)
             step = self.parse_expression()
@@ -250,6 +342,21 @@ class Parser:
 
         return Ast.AssignStatement(ident, value, is_local)
 
+    def parse_index_assignment(self) -> Ast.IndexAssignStatement:
+        t = self.peek()
+        target = self.parse_primary()
+        if isinstance(target, Ast.FunctionCall) and not self.accept(TokenType.EQUALS):
+            # a call statement on an indexed callee, such as string.len(s)
+            return target
+        if not isinstance(target, Ast.IndexExpr):
+            print(f'Invalid assignment target at line:column {t.line}:{t.col}')
+            exit(1)
+
+        self.expect(TokenType.EQUALS)
+        value = self.parse_expression()
+
+        return Ast.IndexAssignStatement(target, value)
+
     def parse_return_statement(self) -> Ast.ReturnStatement:
         self.expect(TokenType.RETURN)
         value = self.parse_expression()
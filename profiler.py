@@ -0,0 +1,139 @@
+from typing import Any, Dict, List, Tuple
+from env import Env
+import Ast
+import ops
+import time
+
+
+MAIN = '<main>'
+
+
+class FunctionStats:
+    __slots__ = ('calls', 'inclusive', 'exclusive')
+
+    def __init__(self):
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+
+
+class ProfilingVisitor(Ast.Visitor):
+    """
+    Visitor that records, while it runs a program:
+    call counts and inclusive/exclusive time per function, execution counts per statement line, iteration
+    counts per while/for loop and exclusive time per call stack for collapsed-stack flame graphs.
+    Profiling is opted into by using this class instead of Ast.Visitor, so Ast.Visitor itself carries no
+    hooks and costs nothing extra.
+    """
+    def __init__(self, env: Env = None):
+        super().__init__(Env() if env is None else env)
+        self.functions: Dict[str, FunctionStats] = {}
+        self.lines: Dict[int, int] = {}
+        self.loops: Dict[Tuple[str, int], int] = {}
+        self.stacks: Dict[Tuple[str, ...], float] = {}
+        # one [name, start, time spent in callees] per active call, the program itself at the bottom
+        self.frames: List[list] = [[MAIN, time.perf_counter(), 0.0]]
+        self.active: Dict[str, int] = {}
+
+    def execute_statements(self, statements):
+        lines = self.lines
+        for stmt in statements:
+            token = getattr(stmt, 'token', None)
+            if token is not None:
+                lines[token.line] = lines.get(token.line, 0) + 1
+            value = stmt.accept(self)
+            if self.returning:
+                return value
+        return None
+
+    def loop_key(self, kind: str, loop: Ast.Statement) -> Tuple[str, int]:
+        token = getattr(loop, 'token', None)
+        return kind, 0 if token is None else token.line
+
+    def visit_while_loop(self, wl: Ast.WhileLoop):
+        key = self.loop_key('while', wl)
+        iterations = 0
+        return_value = None
+        condition_result = wl.condition.accept(self)
+        while condition_result is not None and condition_result is not False:
+            iterations += 1
+            return_value = wl.body.accept(self)
+            if self.returning:
+                break
+            condition_result = wl.condition.accept(self)
+        self.loops[key] = self.loops.get(key, 0) + iterations
+        return return_value
+
+    def visit_for_loop(self, fl: Ast.ForLoop):
+        values = ops.numeric_range(fl.initializer.value.accept(self), fl.stop.accept(self), fl.step.accept(self))
+        key = self.loop_key('for', fl)
+        iterations = 0
+
+        env, name, body = self.env, fl.initializer.name, fl.body
+        env.add_level()
+        scope = env.symbol_table[env.level]
+        return_value = None
+        for value in values:
+            iterations += 1
+            scope[name] = value
+            return_value = body.accept(self)
+            if self.returning:
+                break
+        env.pop_level()
+        self.loops[key] = self.loops.get(key, 0) + iterations
+        return return_value
+
+    def call(self, fn: Ast.Function, args: List[Any]):
+        name = fn.name or '<anonymous>'
+        stats = self.functions.get(name)
+        if stats is None:
+            stats = self.functions[name] = FunctionStats()
+        stats.calls += 1
+        self.active[name] = self.active.get(name, 0) + 1
+
+        frame = [name, time.perf_counter(), 0.0]
+        self.frames.append(frame)
+        try:
+            return super().call(fn, args)
+        finally:
+            elapsed = time.perf_counter() - frame[1]
+            self.frames.pop()
+            self.frames[-1][2] += elapsed
+            exclusive = elapsed - frame[2]
+            stats.exclusive += exclusive
+            # time of a recursive call is already part of its outermost activation
+            self.active[name] -= 1
+            if not self.active[name]:
+                stats.inclusive += elapsed
+            stack = tuple(f[0] for f in self.frames) + (name,)
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + exclusive
+
+    def finish(self):
+        """Closes the bottom frame, call after the program ran to account the time spent outside functions"""
+        main = self.frames[0]
+        elapsed = time.perf_counter() - main[1]
+        self.stacks[(MAIN,)] = self.stacks.get((MAIN,), 0.0) + elapsed - main[2]
+        main[1], main[2] = time.perf_counter(), 0.0
+
+    def report(self, limit: int = 20) -> str:
+        lines = [f'{"function":<24} {"calls":>8} {"inclusive ms":>13} {"exclusive ms":>13}']
+        functions = sorted(self.functions.items(), key=lambda item: item[1].exclusive, reverse=True)
+        for name, stats in functions[:limit]:
+            lines.append(f'{name:<24} {stats.calls:>8} {stats.inclusive * 1000:>13.3f} {stats.exclusive * 1000:>13.3f}')
+
+        lines.append('')
+        lines.append(f'{"line":>6} {"executions":>12}')
+        for line, count in sorted(self.lines.items(), key=lambda item: item[1], reverse=True)[:limit]:
+            lines.append(f'{line:>6} {count:>12}')
+
+        if self.loops:
+            lines.append('')
+            lines.append(f'{"loop":<12} {"line":>6} {"iterations":>12}')
+            for (kind, line), count in sorted(self.loops.items(), key=lambda item: item[1], reverse=True)[:limit]:
+                lines.append(f'{kind:<12} {line:>6} {count:>12}')
+        return '\n'.join(lines)
+
+    def collapsed_stacks(self) -> str:
+        """One 'outer;inner microseconds' line per call stack, as read by flamegraph.pl and speedscope"""
+        return '\n'.join(f'{";".join(stack)} {round(seconds * 1e6)}'
+                         for stack, seconds in sorted(self.stacks.items()) if round(seconds * 1e6) > 0)
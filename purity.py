@@ -0,0 +1,188 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from optimizer import BindingCounter
+from Ast import MISSING
+import Ast
+
+
+# argument types that hash by value and cannot be mutated through the cached result
+PRIMITIVE_TYPES = (bool, int, float, str, type(None))
+
+
+class MemoCache:
+    """Bounded LRU cache of results of one pure function, keyed by its arguments"""
+    __slots__ = ('name', 'maxsize', 'entries', 'hits', 'misses', 'evictions')
+
+    def __init__(self, name: str, maxsize: int = 1024):
+        self.name = name
+        self.maxsize = maxsize
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(args: List[Any]) -> Optional[Tuple]:
+        # 1, 1.0 and true are equal as dict keys, so the argument types are part of the key
+        for arg in args:
+            if type(arg) not in PRIMITIVE_TYPES:
+                return None
+        return (*args, *map(type, args))
+
+    def get(self, key: Tuple) -> Any:
+        value = self.entries.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: Tuple, value: Any):
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+        }
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+
+class PurityAnalyzer:
+    """
+    Finds the top-level named functions whose result depends only on their arguments. A function is pure
+    when its body reads and writes nothing but its parameters and its own locals, builds no tables or
+    closures, and only calls functions that are pure themselves and bound exactly once, so the name
+    cannot be rebound to something else. Mutually recursive candidates start out pure and are dropped
+    until no impure callee remains.
+    """
+    def __init__(self):
+        self.scopes: List[Set[str]] = []
+        self.callees: Set[str] = set()
+        self.pure = True
+
+    def analyze(self, program: Ast.Program) -> Dict[str, Ast.Function]:
+        bindings = BindingCounter().count(program)
+        candidates: Dict[str, Ast.Function] = {}
+        callees: Dict[str, Set[str]] = {}
+        for block in program.blocks:
+            for stmt in block.statements:
+                if not isinstance(stmt, Ast.Function) or stmt.name is None or bindings.get(stmt.name) != 1:
+                    continue
+                called = self.function_callees(stmt)
+                if called is not None:
+                    candidates[stmt.name] = stmt
+                    callees[stmt.name] = called
+
+        changed = True
+        while changed:
+            changed = False
+            for name in list(candidates):
+                if not callees[name] <= candidates.keys():
+                    del candidates[name]
+                    changed = True
+        return candidates
+
+    def function_callees(self, fn: Ast.Function) -> Optional[Set[str]]:
+        """Names fn calls, or None when its body is impure by itself"""
+        self.scopes = [set(fn.params)]
+        self.callees = set()
+        self.pure = True
+        self.statements(fn.body.statements)
+        return self.callees if self.pure else None
+
+    def statements(self, statements):
+        for stmt in statements:
+            if not self.pure:
+                return
+            stmt.accept(self)
+
+    def is_local(self, name: str) -> bool:
+        return any(name in scope for scope in self.scopes)
+
+    def impure(self, *_):
+        self.pure = False
+
+    def visit_literal(self, le: Ast.Literal):
+        pass
+
+    def visit_identifier(self, ident: Ast.Identifier):
+        if not self.is_local(ident.name):
+            self.pure = False
+
+    def visit_grouped_expression(self, ge: Ast.GroupedExpr):
+        ge.inner.accept(self)
+
+    def visit_binary_expr(self, expr: Ast.BinaryExpr):
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_unary_expression(self, ue: Ast.UnaryExpr):
+        ue.operand.accept(self)
+
+    def visit_assignment(self, stmt: Ast.AssignStatement):
+        stmt.value.accept(self)
+        if stmt.is_local:
+            self.scopes[-1].add(stmt.name)
+        elif not self.is_local(stmt.name):
+            # a global write
+            self.pure = False
+
+    # tables are mutable, a cached table would be shared between calls
+    visit_index_assignment = visit_table_expr = visit_index_expr = impure
+    # a nested function would capture the locals of one call
+    visit_function_def = impure
+
+    def visit_return_statement(self, rs: Ast.ReturnStatement):
+        rs.value.accept(self)
+
+    def visit_block(self, block: Ast.Block):
+        self.scopes.append(set())
+        self.statements(block.statements)
+        self.scopes.pop()
+
+    def visit_while_loop(self, wl: Ast.WhileLoop):
+        wl.condition.accept(self)
+        wl.body.accept(self)
+
+    def visit_for_loop(self, fl: Ast.ForLoop):
+        fl.initializer.value.accept(self)
+        fl.stop.accept(self)
+        fl.step.accept(self)
+        self.scopes.append({fl.initializer.name})
+        fl.body.accept(self)
+        self.scopes.pop()
+
+    def visit_if_stmt(self, if_stmt: Ast.IfStatement):
+        if_stmt.condition.accept(self)
+        if_stmt.true_block.accept(self)
+        if if_stmt.else_block is not None:
+            if_stmt.else_block.accept(self)
+
+    def visit_function_call(self, fc: Ast.FunctionCall):
+        # calls through an expression or a local cannot be tied to a candidate. Host functions such as
+        # print are never candidates either, so calling them makes the caller impure at the fixed point
+        if fc.callee is not None or self.is_local(fc.name):
+            self.pure = False
+            return
+        self.callees.add(fc.name)
+        for arg in fc.args:
+            arg.accept(self)
+
+
+def memoize(program: Ast.Program, maxsize: int = 1024) -> Dict[str, MemoCache]:
+    """Gives every pure function of program a MemoCache, which all backends consult when calling it"""
+    caches = {}
+    for name, fn in PurityAnalyzer().analyze(program).items():
+        fn.memo = caches[name] = MemoCache(name, maxsize)
+    return caches
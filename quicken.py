@@ -0,0 +1,108 @@
+from typing import Any, Callable, Dict, Tuple
+from env import Env
+from rope import Rope, concat
+import Ast
+
+
+# A quickened node keeps its slots and only changes class, to a subclass whose accept() evaluates the
+# operator itself: one Python call per node instead of accept, visit_binary_expr and a handler. Any other
+# visitor still reaches its visit method, since the same tree may be compiled or analyzed after it ran.
+
+def binary_class(name: str, left_type: type, right_type: type, fn: Callable[[Any, Any], Any]) -> type:
+    def accept(self, visitor):
+        if type(visitor) is not QuickeningVisitor:
+            return visitor.visit_binary_expr(self)
+        left = self.left.accept(visitor)
+        right = self.right.accept(visitor)
+        if type(left) is left_type and type(right) is right_type:
+            return fn(left, right)
+        # the guard missed, polymorphic sites stop paying for it
+        self.__class__ = GenericBinary
+        return Ast.LUA_OPERATORS[self.op.lexeme](left, right)
+    return type(name, (Ast.BinaryExpr,), {'__slots__': (), 'accept': accept})
+
+
+def unary_class(name: str, operand_type: type, fn: Callable[[Any], Any]) -> type:
+    def accept(self, visitor):
+        if type(visitor) is not QuickeningVisitor:
+            return visitor.visit_unary_expression(self)
+        operand = self.operand.accept(visitor)
+        if type(operand) is operand_type:
+            return fn(operand)
+        self.__class__ = GenericUnary
+        return Ast.LUA_UNARY_OPERATORS[self.op.lexeme](operand)
+    return type(name, (Ast.UnaryExpr,), {'__slots__': (), 'accept': accept})
+
+
+class GenericBinary(Ast.BinaryExpr):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        if type(visitor) is not QuickeningVisitor:
+            return visitor.visit_binary_expr(self)
+        return Ast.LUA_OPERATORS[self.op.lexeme](self.left.accept(visitor), self.right.accept(visitor))
+
+
+class GenericUnary(Ast.UnaryExpr):
+    __slots__ = ()
+
+    def accept(self, visitor):
+        if type(visitor) is not QuickeningVisitor:
+            return visitor.visit_unary_expression(self)
+        return Ast.LUA_UNARY_OPERATORS[self.op.lexeme](self.operand.accept(visitor))
+
+
+def binary_specializations() -> Dict[Tuple[str, type, type], type]:
+    # only the type combinations Visitor.binary_op accepts without an error, so a node never has to
+    # reproduce one. int / int and int % int by zero raise ZeroDivisionError just like Visitor
+    specializations = {}
+    for op, fn in Ast.ARITHMETIC_OPERATORS.items():
+        for left in (int, float):
+            for right in (int, float):
+                specializations[op, left, right] = binary_class(f'Quick{left.__name__}{op}{right.__name__}',
+                                                                left, right, fn)
+    for op, fn in Ast.COMPARISON_OPERATORS.items():
+        for operand_type in (int, float, str):
+            specializations[op, operand_type, operand_type] = binary_class(
+                f'Quick{operand_type.__name__}{op}{operand_type.__name__}', operand_type, operand_type, fn)
+    for left in (str, Rope):
+        for right in (str, Rope):
+            specializations['..', left, right] = binary_class(f'Quick{left.__name__}..{right.__name__}',
+                                                              left, right, concat)
+    return specializations
+
+
+BINARY_SPECIALIZATIONS = binary_specializations()
+
+UNARY_SPECIALIZATIONS: Dict[Tuple[str, type], type] = {
+    ('-', int): unary_class('Quick-int', int, int.__neg__),
+    ('-', float): unary_class('Quick-float', float, float.__neg__),
+    ('#', str): unary_class('Quick#str', str, len),
+    ('#', Rope): unary_class('Quick#Rope', Rope, len),
+}
+
+
+class QuickeningVisitor(Ast.Visitor):
+    """
+    Visitor whose operator nodes specialize themselves on the operand types they see. The first evaluation
+    of a BinaryExpr or UnaryExpr turns the node into a subclass whose accept() computes the operator for
+    the observed types behind a type guard (int + int, str .. str, number comparison, ...). A node whose
+    guard fails becomes a generic one for good, so polymorphic sites stop paying for guards that keep
+    missing.
+    """
+    def __init__(self, env: Env = None):
+        super().__init__(Env() if env is None else env)
+
+    def visit_binary_expr(self, expr: Ast.BinaryExpr):
+        op = expr.op.lexeme
+        if op not in Ast.BINARY_OPERATORS:
+            # 'and' and 'or' short-circuit, they stay with Visitor
+            return super().visit_binary_expr(expr)
+        left, right = expr.left.accept(self), expr.right.accept(self)
+        expr.__class__ = BINARY_SPECIALIZATIONS.get((op, type(left), type(right)), GenericBinary)
+        return Ast.LUA_OPERATORS[op](left, right)
+
+    def visit_unary_expression(self, ue: Ast.UnaryExpr):
+        operand = ue.operand.accept(self)
+        ue.__class__ = UNARY_SPECIALIZATIONS.get((ue.op.lexeme, type(operand)), GenericUnary)
+        return Ast.Visitor.unary_op(ue.op.lexeme, operand)
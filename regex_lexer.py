@@ -0,0 +1,191 @@
+from Token import TokenType, Token
+from lexer import Lexer
+from typing import List, Union
+from sys import intern
+import mmap
+import re
+
+
+PUNCTUATION = {
+    '..': TokenType.DOTDOT,
+    '<=': TokenType.LEQ,
+    '>=': TokenType.GEQ,
+    '==': TokenType.EQUAL_EQUAL,
+    '~=': TokenType.NEQ,
+    ',': TokenType.COMMA,
+    ';': TokenType.SEMI,
+    '#': TokenType.HASHTAG,
+    '.': TokenType.DOT,
+    '<': TokenType.LESS,
+    '>': TokenType.GREATER,
+    '=': TokenType.EQUALS,
+    '+': TokenType.PLUS,
+    '-': TokenType.MINUS,
+    '*': TokenType.STAR,
+    '/': TokenType.SLASH,
+    '%': TokenType.PERCENT,
+    '(': TokenType.LPAREN,
+    ')': TokenType.RPAREN,
+    '{': TokenType.LBRACE,
+    '}': TokenType.RBRACE,
+    '[': TokenType.LBRACKET,
+    ']': TokenType.RBRACKET,
+}
+
+MASTER_PATTERN = re.compile('|'.join([
+    r'(?P<SPACE> +)',
+    r'(?P<NEWLINE>[\n\r]+)',
+    r'(?P<COMMENT>--[^\n]*)',
+    r'(?P<NUMBER>\d[\d.]*)',
+    r'(?P<IDENT>[^\W\d_](?:[^\W\d]|-)*)',
+    r'(?P<STRING>"[^"]*")',
+    r'(?P<PUNCT>\.\.|<=|>=|==|~=|[,;#.<>=+\-*/%(){}\[\]])',
+    r'(?P<ERROR>.)',
+]))
+NEWLINE_PATTERN = re.compile('\n')
+
+# the same tokens over UTF-8 bytes, any non-ASCII byte counts as a letter so identifiers may be non-ASCII
+BYTES_PATTERN = re.compile(b'|'.join([
+    rb'(?P<SPACE> +)',
+    rb'(?P<NEWLINE>[\n\r]+)',
+    rb'(?P<COMMENT>--[^\n]*)',
+    rb'(?P<NUMBER>\d[\d.]*)',
+    rb'(?P<IDENT>[A-Za-z\x80-\xff](?:[A-Za-z_\x80-\xff]|-)*)',
+    rb'(?P<STRING>"[^"]*")',
+    rb'(?P<PUNCT>\.\.|<=|>=|==|~=|[,;#.<>=+\-*/%(){}\[\]])',
+    rb'(?P<ERROR>.)',
+]))
+
+
+def map_file(path: str) -> Union[mmap.mmap, bytes]:
+    """A read-only memory map of the file, the pages are read on demand and never copied into a str"""
+    with open(path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return b''
+
+
+class RegexLexer:
+    """
+    Alternate lexer engine: one pass of a compiled master regex over the source instead of a
+    peek()/advance() call per character. It yields the same Token stream as Lexer, including Lexer's
+    pos/line/col conventions, but line and col are only computed from offsets when a token is built.
+    Runs of spaces, newlines and comments are skipped without recursion. The source may also be UTF-8
+    bytes or a memory map, see lex_file, pos and col are then byte offsets.
+    """
+    def __init__(self, source: str = ""):
+        self.source = source
+        self.tokens: List[Token] = []
+        self.keywords = Lexer().keywords
+
+    def iter_tokens(self, source=''):
+        if source:
+            self.source = source
+        if not self.source:
+            # a Lexer that was never given a source reports line 0, col 0
+            yield Token(0, 0, 0, TokenType.EOF, '\0', None)
+            return
+        yield from self.scan(0, 1, 1)
+
+    def lex_file(self, path: str):
+        """
+        Generator mode over the file at path, which is memory mapped and scanned as bytes: only the lexeme
+        of each token is decoded, and each distinct identifier once.
+        """
+        self.source = map_file(path)
+        yield from self.iter_tokens()
+
+    def scan(self, start: int, line: int, col: int):
+        """
+        Lexes self.source from offset start, which must be the beginning of a token or of the source,
+        given the line and col Lexer reports for that offset.
+        """
+        source = self.source
+        end = len(source)
+        text = isinstance(source, str)
+        if text:
+            pattern, quote, count = MASTER_PATTERN, '"', source.count
+        else:
+            # memory maps have no count(), the slice is only the gap since the previous token
+            pattern, quote = BYTES_PATTERN, b'"'
+
+            def count(sub: bytes, first: int, stop: int) -> int:
+                return source[first:stop].count(sub)
+        newline = '\n' if text else b'\n'
+        # Lexer counts a newline when it advances onto it, so one at offset 0 starts no new line
+        state = [max(start, 1), line, start - col]
+
+        def line_col(offset: int):
+            offset = min(offset, end - 1)
+            last, line_, line_start = state
+            newlines = count(newline, last, offset + 1)
+            if newlines:
+                line_ += newlines
+                line_start = source.rfind(newline, last, offset + 1)
+            state[:] = max(last, offset + 1), line_, line_start
+            return line_, offset - line_start
+
+        keywords, punctuation = self.keywords, PUNCTUATION
+        # lexemes of punctuation, keywords and repeated identifiers share one string object, keyed by the
+        # matched text so bytes are decoded once per distinct name
+        names = {lexeme if text else lexeme.encode(): lexeme for lexeme in punctuation}
+        names.update((lexeme if text else lexeme.encode(), lexeme) for lexeme in keywords)
+        token = None
+        for m in pattern.finditer(source, start):
+            kind = m.lastgroup
+            start = m.start()
+
+            if kind == 'SPACE' or kind == 'NEWLINE' or kind == 'COMMENT':
+                if m.end() == end:
+                    line, col = line_col(end)
+                    token = Token(end, line, col, TokenType.EOF, '\0' if kind == 'NEWLINE' else '', None)
+                    yield token
+                continue
+
+            line, col = line_col(start)
+            lexeme = m.group()
+            if kind == 'IDENT':
+                name = names.get(lexeme)
+                if name is None:
+                    name = names[lexeme] = lexeme if text else intern(lexeme.decode())
+                lexeme = name
+                token_type = keywords.get(lexeme, TokenType.IDENT)
+                literal = None
+                if token_type in (TokenType.TRUE, TokenType.FALSE):
+                    literal = token_type == TokenType.TRUE
+                token = Token(m.end(), line, col, token_type, lexeme, literal)
+            elif kind == 'PUNCT':
+                lexeme = names[lexeme]
+                if len(lexeme) == 2:
+                    # two character operators report the position of their second character
+                    line, col = line_col(start + 1)
+                    start += 1
+                token = Token(start, line, col, punctuation[lexeme], lexeme, None)
+            elif kind == 'NUMBER':
+                if not text:
+                    lexeme = lexeme.decode()
+                token = Token(m.end(), line, col, TokenType.NUMBER, lexeme, float(lexeme) if '.' in lexeme else int(lexeme))
+            elif kind == 'STRING':
+                if not text:
+                    lexeme = lexeme.decode()
+                # interned, equal literals share one str and compare and hash by identity first
+                token = Token(m.end(), line, col, TokenType.STRING, lexeme, intern(lexeme[1:-1]))
+            elif lexeme == quote:
+                print(f'Unterminated string at line:column {line}:{col}')
+                exit(1)
+            else:
+                print(f"Unrecognized token {lexeme if text else lexeme.decode(errors='replace')}")
+                exit(1)
+            yield token
+
+        if token is None or token.token_type != TokenType.EOF:
+            line, col = line_col(end)
+            yield Token(end, line, col, TokenType.EOF, '\0', None)
+
+    def lex(self, source=''):
+        if source:
+            self.tokens.clear()
+        self.tokens.extend(self.iter_tokens(source))
+        return self.tokens
@@ -0,0 +1,218 @@
+from typing import Dict, List, Optional, Set
+from optimizer import BindingCounter
+import Ast
+import host
+
+
+GLOBAL = -1
+
+
+class FunctionScope:
+    def __init__(self, depth: int):
+        self.depth = depth
+        self.frame_size = 0
+
+    def allocate(self) -> int:
+        # slots are never reused so closures keep seeing the variable they captured
+        self.frame_size += 1
+        return self.frame_size - 1
+
+
+class Scope:
+    def __init__(self, function: FunctionScope, is_global: bool = False, node: Ast.Node = None):
+        self.function = function
+        self.is_global = is_global
+        # the Block or ForLoop declaring the scope's locals, None for a function's parameters
+        self.node = node
+        self.slots: Dict[str, int] = {}
+
+
+class Resolver:
+    """
+    Static scope resolution. Annotates Identifier, AssignStatement (through its ident), FunctionCall
+    and named Function nodes with a (depth, slot) pair, where depth is the number of enclosing function
+    frames to walk up and slot is the index into that frame. Names that are not locals get depth GLOBAL.
+    Function and Program nodes get the frame_size their activation needs. A Block or ForLoop declaring a
+    local that a nested function captures gets a frame_size too, and a frame of its own each time it is
+    entered or iterates, so closures made in different iterations do not share the variable. Calls of host
+    functions with a host.Signature in the registry are checked against it, unless the script binds the
+    name itself.
+    """
+    def __init__(self, registry: host.Registry = None):
+        self.registry = host.REGISTRY if registry is None else registry
+        self.scopes: List[Scope] = []
+        self.function: Optional[FunctionScope] = None
+        self.bindings: Dict[str, int] = {}
+        # blocks and loops with a local looked up from a nested function, and those given a frame of their own
+        self.captured: Set[Ast.Node] = set()
+        self.framed: Set[Ast.Node] = set()
+
+    def resolve(self, program: Ast.Program) -> Ast.Program:
+        self.bindings = BindingCounter().count(program)
+        self.resolve_program(program)
+        if self.captured:
+            # which blocks need frames is only known once the nested functions have been resolved
+            self.framed, self.captured = self.captured, set()
+            self.resolve_program(program)
+        return program
+
+    def resolve_program(self, program: Ast.Program):
+        self.function = FunctionScope(0)
+        for block in program.blocks:
+            # locals declared directly in a top-level block live in the global table, as with Env level 0
+            self.scopes.append(Scope(self.function, is_global=True))
+            self.resolve_statements(block.statements)
+            self.scopes.pop()
+        program.frame_size = self.function.frame_size
+
+    def resolve_statements(self, statements):
+        for stmt in statements:
+            stmt.accept(self)
+
+    def lookup(self, name: str):
+        for scope in reversed(self.scopes):
+            if name in scope.slots:
+                if scope.function is not self.function and scope.node is not None:
+                    self.captured.add(scope.node)
+                return self.function.depth - scope.function.depth, scope.slots[name]
+        return GLOBAL, GLOBAL
+
+    def declare(self, name: str):
+        scope = self.scopes[-1]
+        if scope.is_global:
+            return GLOBAL, GLOBAL
+        if name not in scope.slots:
+            scope.slots[name] = self.function.allocate()
+        return 0, scope.slots[name]
+
+    def target(self, name: str, is_local: bool):
+        return self.declare(name) if is_local else self.lookup(name)
+
+    def visit_literal(self, le: Ast.Literal):
+        pass
+
+    def visit_identifier(self, ident: Ast.Identifier):
+        ident.depth, ident.slot = self.lookup(ident.name)
+
+    def visit_grouped_expression(self, ge: Ast.GroupedExpr):
+        ge.inner.accept(self)
+
+    def visit_binary_expr(self, expr: Ast.BinaryExpr):
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_unary_expression(self, ue: Ast.UnaryExpr):
+        ue.operand.accept(self)
+
+    def visit_assignment(self, stmt: Ast.AssignStatement):
+        # the value is resolved first so 'local x = x' reads the outer x
+        stmt.value.accept(self)
+        stmt.ident.depth, stmt.ident.slot = self.target(stmt.name, stmt.is_local)
+
+    def visit_index_assignment(self, stmt: Ast.IndexAssignStatement):
+        stmt.target.accept(self)
+        stmt.value.accept(self)
+
+    def visit_table_expr(self, te: Ast.TableExpr):
+        for key, value in te.fields:
+            if key is not None:
+                key.accept(self)
+            value.accept(self)
+
+    def visit_index_expr(self, ie: Ast.IndexExpr):
+        ie.obj.accept(self)
+        ie.key.accept(self)
+
+    def visit_return_statement(self, rs: Ast.ReturnStatement):
+        rs.value.accept(self)
+
+    def enter_scope(self, node: Ast.Node) -> Optional[FunctionScope]:
+        """Pushes the scope of a Block or ForLoop, with a FunctionScope of its own if it is framed"""
+        enclosing = None
+        if node in self.framed:
+            enclosing, self.function = self.function, FunctionScope(self.function.depth + 1)
+        self.scopes.append(Scope(self.function, node=node))
+        return enclosing
+
+    def leave_scope(self, node: Ast.Node, enclosing: Optional[FunctionScope]):
+        self.scopes.pop()
+        node.frame_size = None if enclosing is None else self.function.frame_size
+        if enclosing is not None:
+            self.function = enclosing
+
+    def visit_block(self, block: Ast.Block):
+        enclosing = self.enter_scope(block)
+        self.resolve_statements(block.statements)
+        self.leave_scope(block, enclosing)
+
+    def visit_while_loop(self, wl: Ast.WhileLoop):
+        wl.condition.accept(self)
+        wl.body.accept(self)
+
+    def visit_for_loop(self, fl: Ast.ForLoop):
+        fl.initializer.value.accept(self)
+        fl.stop.accept(self)
+        fl.step.accept(self)
+        enclosing = self.enter_scope(fl)
+        fl.initializer.ident.depth, fl.initializer.ident.slot = self.declare(fl.initializer.name)
+        fl.body.accept(self)
+        self.leave_scope(fl, enclosing)
+
+    def visit_if_stmt(self, if_stmt: Ast.IfStatement):
+        if_stmt.condition.accept(self)
+        if_stmt.true_block.accept(self)
+        if if_stmt.else_block is not None:
+            if_stmt.else_block.accept(self)
+
+    def visit_function_def(self, fn: Ast.Function):
+        if fn.name is not None:
+            fn.depth, fn.slot = self.target(fn.name, fn.is_local)
+
+        enclosing = self.function
+        self.function = FunctionScope(enclosing.depth + 1)
+        scope = Scope(self.function)
+        self.scopes.append(scope)
+        for param in fn.params:
+            scope.slots[param] = self.function.allocate()
+        # parameters and body locals share one scope, as in Visitor.visit_function_call
+        self.resolve_statements(fn.body.statements)
+        self.scopes.pop()
+        fn.frame_size = self.function.frame_size
+        self.function = enclosing
+
+    def visit_function_call(self, fc: Ast.FunctionCall):
+        if fc.callee is None:
+            fc.depth, fc.slot = self.lookup(fc.name)
+        else:
+            fc.callee.accept(self)
+        for arg in fc.args:
+            arg.accept(self)
+
+        signature = self.registry.signatures.get(fc.name)
+        if signature is not None and fc.name.split('.')[0] not in self.bindings:
+            self.check_host_call(fc, signature)
+
+    @staticmethod
+    def check_host_call(fc: Ast.FunctionCall, signature: host.Signature):
+        if not signature.accepts(len(fc.args)):
+            print(f"Incorrect number of arguments for '{fc.name}'")
+            exit(1)
+        if signature.types is None:
+            return
+        for position, (arg, expected) in enumerate(zip(fc.args, signature.types), 1):
+            # only the types of constant arguments are known before running
+            if isinstance(arg, Ast.Literal):
+                actual = host.type_name(arg.value)
+            elif isinstance(arg, Ast.TableExpr):
+                actual = 'table'
+            elif isinstance(arg, Ast.Function):
+                actual = 'function'
+            else:
+                continue
+            if expected != 'any' and actual != expected:
+                print(f"Bad argument #{position} to '{fc.name}' ({expected} expected, got {actual})")
+                exit(1)
+
+
+def resolve(program: Ast.Program, registry: host.Registry = None) -> Ast.Program:
+    return Resolver(registry).resolve(program)
@@ -0,0 +1,107 @@
+from typing import Any, List, Union
+
+
+# results of '..' up to this many characters are built as plain str, copying them is cheaper than a node
+SHORT = 64
+
+
+class Rope:
+    """
+    Lazy result of '..': the two operands plus the total length, so building a string piece by piece does
+    not copy everything built so far on every step and '#' is O(1). The characters are joined the first
+    time they are needed, when the string is compared, hashed or printed, and kept from then on.
+    """
+    __slots__ = ('left', 'right', 'length', 'flat')
+
+    def __init__(self, left: Union[str, 'Rope'], right: Union[str, 'Rope'], length: int):
+        self.left = left
+        self.right = right
+        self.length = length
+        self.flat: str = None
+
+    def __len__(self):
+        return self.length
+
+    def flatten(self) -> str:
+        if self.flat is None:
+            # iterative, a loop of 's = s .. piece' builds a rope as deep as the loop is long
+            pieces = []
+            stack = [self]
+            while stack:
+                node = stack.pop()
+                if type(node) is str:
+                    pieces.append(node)
+                elif node.flat is not None:
+                    pieces.append(node.flat)
+                else:
+                    stack.append(node.right)
+                    stack.append(node.left)
+            self.flat = ''.join(pieces)
+            self.left = self.right = None
+        return self.flat
+
+    def __str__(self):
+        return self.flatten()
+
+    def __repr__(self):
+        return repr(self.flatten())
+
+    def __hash__(self):
+        # equal to the hash of the str, so ropes and strings find the same dict entries
+        return hash(self.flatten())
+
+    def __eq__(self, other: Any):
+        if type(other) is Rope:
+            return self.length == other.length and self.flatten() == other.flatten()
+        if type(other) is str:
+            return self.length == len(other) and self.flatten() == other
+        return NotImplemented
+
+    def __ne__(self, other: Any):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __lt__(self, other: Any):
+        return self.flatten() < flatten(other)
+
+    def __le__(self, other: Any):
+        return self.flatten() <= flatten(other)
+
+    def __gt__(self, other: Any):
+        return self.flatten() > flatten(other)
+
+    def __ge__(self, other: Any):
+        return self.flatten() >= flatten(other)
+
+    def __reduce__(self):
+        # pickled, as in the script cache or a batch result, a rope is just its str
+        return str, (self.flatten(),)
+
+
+STRING_TYPES = (str, Rope)
+
+
+def flatten(value: Any) -> Any:
+    return value.flatten() if type(value) is Rope else value
+
+
+def flatten_all(values: List[Any]) -> List[Any]:
+    """values with every rope replaced by its str, ropes never reach Python code such as a host function"""
+    for value in values:
+        if type(value) is Rope:
+            return [flatten(v) for v in values]
+    return values
+
+
+def concat(left: Union[str, Rope], right: Union[str, Rope]) -> Union[str, Rope]:
+    """left .. right for two strings"""
+    length = len(left) + len(right)
+    if length <= SHORT:
+        return flatten(left) + flatten(right)
+    if type(right) is str and type(left) is Rope and left.flat is None:
+        # appending a short piece to a rope ending in a short piece: merge the two so a loop appending
+        # small pieces builds one node per SHORT characters instead of one per piece
+        tail = left.right
+        if type(tail) is str and len(tail) + len(right) <= SHORT:
+            return Rope(left.left, tail + right, length)
+    return Rope(left, right, length)
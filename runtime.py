@@ -0,0 +1,216 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from parser import Parser
+from env import Env, Frame
+from compiler import Compiler
+from optimizer import optimize
+from purity import memoize as memoize_pure
+from quicken import QuickeningVisitor
+from resolver import resolve
+from vm import VM, Closure
+from closure_compiler import ClosureCompiler, LuaFunction
+from cache import ScriptCache
+from eval import BACKENDS
+from host import Registry, REGISTRY
+from coroutines import Coroutine
+from rope import Rope, flatten
+import Ast
+
+
+def flatten_globals(globals_: Dict[str, Any]):
+    """Replaces the ropes among the values of globals_ by their str, so Python code reading it sees strings"""
+    for name, value in globals_.items():
+        if type(value) is Rope:
+            globals_[name] = value.flatten()
+
+
+def global_env(globals_: Dict[str, Any], registry: Registry = None) -> Env:
+    """An Env whose global level is the globals_ dict itself, so the caller sees every global write"""
+    env = Env(registry)
+    env.add_level()
+    env.symbol_table[0] = globals_
+    return env
+
+
+class Chunk:
+    """
+    A script parsed, optimized and compiled for one backend once, then run any number of times. Made by
+    Runtime.compile. Host values are looked up in registry, host.REGISTRY by default.
+    """
+    def __init__(self, program: Ast.Program, backend: str = 'vm', optimized: bool = False, memoize: bool = False,
+                 registry: Registry = None):
+        if optimized:
+            program = optimize(program)
+        if memoize:
+            memoize_pure(program)
+        self.backend = backend
+        self.registry = REGISTRY if registry is None else registry
+        # resolved once, both compilers take the annotated program as it is
+        self.program = resolve(program, self.registry)
+        self.code = Compiler().compile_program(self.program) if backend == 'vm' else None
+        # the closure backend reads globals from the table each run is given
+        self.closure: Callable[[Dict[str, Any]], Any] = (
+            ClosureCompiler(self.registry).compile(self.program) if backend == 'closure' else None)
+
+    @staticmethod
+    def globals_table(globals: Union[Dict[str, Any], Env, None]) -> Dict[str, Any]:
+        if isinstance(globals, Env):
+            if globals.level == -1:
+                globals.add_level()
+            return globals.symbol_table[0]
+        return {} if globals is None else globals
+
+    def run(self, globals: Union[Dict[str, Any], Env] = None) -> Any:
+        """
+        Runs the chunk and returns its result as evaluate does. Global reads and writes go to globals, a dict
+        or an Env, which is left holding the globals the chunk set. A fresh, empty table is used when
+        globals is None. Strings built by '..' reach Python as str, in the result and in globals.
+        """
+        globals = self.globals_table(globals)
+        value = self.execute(globals)
+        flatten_globals(globals)
+        return flatten(value)
+
+    def execute(self, globals: Dict[str, Any]) -> Any:
+        if self.backend == 'vm':
+            return VM(global_env(globals, self.registry)).run(self.code)
+        if self.backend == 'closure':
+            return self.closure(globals)
+        if self.backend == 'quick':
+            return self.program.accept(QuickeningVisitor(global_env(globals, self.registry)))
+        return self.program.accept(Ast.Visitor(global_env(globals, self.registry)))
+
+    async def run_async(self, globals: Union[Dict[str, Any], Env] = None) -> Any:
+        """
+        Runs the chunk like run, as a coroutine of the running event loop: a call to an async host function
+        suspends the script until the loop has awaited it, so one loop interleaves any number of scripts:
+
+            await asyncio.gather(*(chunk.run_async(table) for table in tables))
+
+        Only the vm backend can suspend a script.
+        """
+        if self.backend != 'vm':
+            print(f"run_async needs the vm backend, not '{self.backend}'")
+            exit(1)
+        globals = self.globals_table(globals)
+        vm = VM(global_env(globals, self.registry))
+        main = Coroutine(None, main=True)
+        main.code, main.frame = self.code, Frame(self.code.frame_size)
+        # the main coroutine cannot yield, so every suspension is an async host call handing over its awaitable
+        value = vm.resume(main, [])
+        while main.status == 'suspended':
+            value = vm.resume(main, [await value])
+        flatten_globals(globals)
+        return flatten(value)
+
+
+class ScriptFunction:
+    """
+    A Lua function, or host function, made callable from Python: calling it with Python values runs the
+    function with those arguments against the globals it was looked up in and returns its result.
+    """
+    def __init__(self, name: str, fn: Any, globals_: Dict[str, Any], backend: str, registry: Registry = None):
+        self.name = name
+        self.fn = fn
+        self.globals = globals_
+        self.visitor = None
+        self.vm = None
+        if isinstance(fn, Ast.Function):
+            env = global_env(globals_, registry)
+            self.visitor = QuickeningVisitor(env) if backend == 'quick' else Ast.Visitor(env)
+        elif isinstance(fn, Closure):
+            self.vm = VM(global_env(globals_, registry))
+        elif not isinstance(fn, LuaFunction) and not callable(fn):
+            print(f"Attempt to call a non-function value '{name}'")
+            exit(1)
+
+    def __repr__(self):
+        return f'ScriptFunction({self.name})'
+
+    def __call__(self, *args: Any) -> Any:
+        return self.call(list(args))
+
+    def call(self, args: List[Any]) -> Any:
+        # a string result built by '..' is returned as str
+        return flatten(self.invoke(args))
+
+    def invoke(self, args: List[Any]) -> Any:
+        fn = self.fn
+        if self.vm is not None:
+            return self.vm.call(fn, args)
+        if self.visitor is not None:
+            if len(args) != len(fn.params):
+                print(f"Incorrect number of arguments for '{self.name}'")
+                exit(1)
+            return self.visitor.call(fn, args)
+        if isinstance(fn, LuaFunction):
+            if len(args) != len(fn.params):
+                print(f"Incorrect number of arguments for '{self.name}'")
+                exit(1)
+            frame = Frame(fn.frame_size, fn.frame)
+            frame[:len(args)] = args
+            result = fn.body(frame)
+            return None if result is None else result[0]
+        return fn(*args)
+
+
+class Runtime:
+    """
+    Embedding entry point. compile turns source into a Chunk once, chunks run against the runtime's own
+    globals table or any other, and get_function wraps a global Lua function as a Python callable:
+
+        runtime = Runtime()
+        runtime.compile(source).run(runtime.globals)
+        handler = runtime.get_function('handle')
+        handler(request)
+
+    Each runtime starts from a copy of host.REGISTRY, so its register calls are only seen by its own scripts.
+    """
+    def __init__(self, backend: str = 'vm', optimized: bool = False, memoize: bool = False,
+                 cache: ScriptCache = None):
+        if backend not in BACKENDS:
+            print(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+            exit(1)
+        self.backend = backend
+        self.optimized = optimized
+        self.memoize = memoize
+        self.cache = cache
+        self.globals: Dict[str, Any] = {}
+        self.chunks: Dict[str, Chunk] = {}
+        self.registry = REGISTRY.copy()
+
+    def register(self, name: str, value: Any, arity: Union[int, Tuple[int, Optional[int]]] = None,
+                 types: Sequence[str] = None):
+        """Exposes value to the scripts of this runtime, see host.Registry.register"""
+        self.registry.register(name, value, arity, types)
+
+    def compile(self, source: str) -> Chunk:
+        """Compiles source, or returns the chunk compiled from the same source before"""
+        chunk = self.chunks.get(source)
+        if chunk is None:
+            if self.cache is None:
+                program = Parser(source=source).parse_program()
+                optimized = self.optimized
+            else:
+                # the cached form is already optimized
+                program, optimized = self.cache.parse(source, self.optimized).decode(), False
+            chunk = self.chunks[source] = Chunk(program, self.backend, optimized, self.memoize, self.registry)
+        return chunk
+
+    def run(self, source: str) -> Any:
+        """Compiles and runs source against the runtime's globals"""
+        return self.compile(source).run(self.globals)
+
+    async def run_async(self, source: str) -> Any:
+        """Compiles source and runs it with Chunk.run_async against the runtime's globals"""
+        return await self.compile(source).run_async(self.globals)
+
+    def get_function(self, name: str, globals: Dict[str, Any] = None) -> ScriptFunction:
+        """Wraps the function stored in global name, of the runtime's globals by default, as a Python callable"""
+        globals = self.globals if globals is None else globals
+        fn = globals.get(name)
+        if fn is None:
+            fn = self.registry.globals.get(name)
+        if fn is None:
+            print(f"Function '{name}' not previously declared")
+            exit(1)
+        return ScriptFunction(name, fn, globals, self.backend, self.registry)
@@ -0,0 +1,97 @@
+from typing import Any, Dict, Iterator, List, Tuple
+from reprlib import recursive_repr
+from rope import Rope
+
+# True == 1 and hash(True) == hash(1), so booleans go into the hash part under keys no Lua value equals
+BOOLEAN_KEYS = {False: ('boolean', False), True: ('boolean', True)}
+
+
+class LuaTable:
+    """
+    Hybrid table as in the reference Lua implementation. Integer keys 1..n live in the contiguous
+    array part, every other key in the hash part. The array part never holds nil and the hash part
+    never holds key n + 1, so len(array) is always a border and '#' is O(1).
+    """
+    __slots__ = ('array', 'hash')
+
+    def __init__(self):
+        self.array: List[Any] = []
+        self.hash: Dict[Any, Any] = {}
+
+    @recursive_repr('{...}')
+    def __repr__(self):
+        items = [repr(v) for v in self.array] + [f'{k!r}: {v!r}' for k, v in self.hash_items()]
+        return '{' + ', '.join(items) + '}'
+
+    @staticmethod
+    def normalize_key(key: Any):
+        if type(key) is float and key.is_integer():
+            return int(key)
+        return key
+
+    def get(self, key: Any):
+        if type(key) is float:
+            key = self.normalize_key(key)
+        elif type(key) is bool:
+            key = BOOLEAN_KEYS[key]
+        if type(key) is int and 0 < key <= len(self.array):
+            return self.array[key - 1]
+        return self.hash.get(key)
+
+    def set(self, key: Any, value: Any):
+        if key is None or key != key:
+            print('Table index is nil or NaN')
+            exit(1)
+
+        if type(key) is float:
+            key = self.normalize_key(key)
+        elif type(key) is Rope:
+            # keys are kept as plain strings, lookups with a rope still match through its str hash
+            key = key.flatten()
+        elif type(key) is bool:
+            key = BOOLEAN_KEYS[key]
+
+        array = self.array
+        if type(key) is int and 0 < key <= len(array) + 1:
+            if key <= len(array):
+                if value is None:
+                    self.truncate(key)
+                else:
+                    array[key - 1] = value
+            elif value is not None:
+                array.append(value)
+                self.migrate()
+            return
+
+        if value is None:
+            self.hash.pop(key, None)
+        else:
+            self.hash[key] = value
+
+    def migrate(self):
+        # pull keys n + 1, n + 2, ... out of the hash part after the array part grew
+        hash_part = self.hash
+        if not hash_part:
+            return
+        key = len(self.array) + 1
+        while key in hash_part:
+            self.array.append(hash_part.pop(key))
+            key += 1
+
+    def truncate(self, key: int):
+        # a nil at key ends the sequence, everything after it moves to the hash part
+        array = self.array
+        for i in range(key, len(array)):
+            self.hash[i + 1] = array[i]
+        del array[key - 1:]
+
+    def length(self) -> int:
+        return len(self.array)
+
+    def items(self) -> Iterator[Tuple[Any, Any]]:
+        yield from enumerate(self.array, 1)
+        yield from self.hash_items()
+
+    def hash_items(self) -> Iterator[Tuple[Any, Any]]:
+        for key, value in self.hash.items():
+            yield (key[1] if type(key) is tuple else key), value
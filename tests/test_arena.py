@@ -0,0 +1,86 @@
+import pickle
+
+import pytest
+
+from arena import encode
+import Ast
+from env import Env
+from eval import BACKENDS, evaluate
+from optimizer import optimize
+from parser import Parser
+
+SOURCE = '''
+local limit = 10
+function classify(n)
+    if n % 2 == 0 then
+        return "even"
+    else
+        return "odd"
+    end
+end
+t = {1, 2.5, -0.0, true, "s", x = {nested = 1}, [3] = nil}
+total = 0
+for i = 1, limit do
+    total = total + i * t[1]
+end
+while total > 20 do
+    total = total - #t
+end
+label = classify(total) .. "!"
+t.x.nested = not false
+nested = (t.x.nested and 1 or 2) * 2
+adder = function(a, b) return a + b end
+sum = adder(1, 2)
+'''
+
+
+def statement_tokens(blocks):
+    """The first token of every statement in blocks and the blocks nested in them, in source order"""
+    tokens = []
+    for block in blocks:
+        for stmt in block.statements:
+            tokens.append(stmt.token)
+            value = getattr(stmt, 'value', None)
+            nested = [value.body] if isinstance(value, Ast.Function) else []
+            for name in ('body', 'true_block', 'else_block'):
+                if isinstance(getattr(stmt, name, None), Ast.Block):
+                    nested.append(getattr(stmt, name))
+            tokens.extend(statement_tokens(nested))
+    return tokens
+
+
+def run(program, backend):
+    env = Env()
+    evaluate(program, backend, env)
+    # tables and functions compare by identity
+    return {name: value for name, value in env.symbol_table[0].items() if type(value) in (bool, int, float, str)}
+
+
+@pytest.mark.parametrize('optimized', [False, True])
+def test_decode_reverses_encode(optimized):
+    program = Parser(source=SOURCE).parse_program()
+    if optimized:
+        program = optimize(program)
+    arena = pickle.loads(pickle.dumps(encode(program)))
+    decoded = arena.decode()
+    assert repr(decoded) == repr(program)
+    tokens = statement_tokens(program.blocks)
+    assert len(tokens) > 10
+    # line info of statements survives the round trip
+    assert statement_tokens(decoded.blocks) == tokens
+    assert repr(encode(decoded).decode()) == repr(program)
+
+
+def test_constants_keep_their_type():
+    # equal as dict keys, but the pool keeps them apart
+    arena = encode(Parser(source='a = 1\nb = 1.0\nc = true\nd = 0.0\ne = 0').parse_program())
+    values = [stmt.value.value for stmt in arena.decode().blocks[0].statements]
+    assert [(type(value), repr(value)) for value in values] == \
+           [(int, '1'), (float, '1.0'), (bool, 'True'), (float, '0.0'), (int, '0')]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_decoded_arenas_run_like_the_program(backend):
+    expected = run(Parser(source=SOURCE).parse_program(), backend)
+    assert expected['label'] == 'odd!' and expected['sum'] == 3
+    assert run(encode(Parser(source=SOURCE).parse_program()), backend) == expected
@@ -0,0 +1,83 @@
+from contextlib import redirect_stdout
+import io
+
+import pytest
+
+from env import Env
+from eval import BACKENDS, evaluate
+from parser import Parser
+
+numpy = pytest.importorskip('numpy')
+
+
+def run(source, backend):
+    env = Env()
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            evaluate(Parser(source=source).parse_program(), backend, env)
+    except SystemExit:
+        return 'error', output.getvalue()
+    return env.symbol_table[0]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_bulk_builtins(backend):
+    globals_ = run('''
+        a = array({1, 2, 3})
+        b = array_add(a, 10)
+        c = array_mul(a, b)
+        s = array_sum(c)
+        lo = array_min(b)
+        hi = array_max(b)
+        d = array_dot(a, a)
+        first = b[1]
+        b[2] = 0.5
+        changed = b[2]
+        n = #a
+        t = array_table(b)
+        back = t[3]
+    ''', backend)
+    assert globals_['s'] == 11 + 24 + 39 and (globals_['lo'], globals_['hi']) == (11, 13)
+    assert globals_['d'] == 14 and globals_['first'] == 11 and globals_['changed'] == 0.5
+    assert globals_['n'] == 3 and globals_['back'] == 13
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_array_map_runs_the_function_over_the_whole_array(backend):
+    globals_ = run('''
+        a = array({1, 2, 3})
+        m = array_map(function(x)
+            local y = x * 2
+            y = y + 1
+            return -y / 2
+        end, a)
+        constant = array_map(function(x) return 4 end, a)
+        first = m[1]
+        last = m[3]
+        c = constant[2]
+    ''', backend)
+    assert (globals_['first'], globals_['last'], globals_['c']) == (-1.5, -3.5, 4)
+
+
+@pytest.mark.parametrize('source', [
+    # a local captured from the enclosing function
+    '''
+        function scale(a)
+            local k = 3
+            return array_map(function(x) return x * k end, a)
+        end
+        m = scale(array({1, 2}))
+    ''',
+    # a global
+    'k = 3\nm = array_map(function(x) return x * k end, array({1, 2}))',
+    # a local read before it is assigned
+    'm = array_map(function(x) local y = y * x return y end, array({1, 2}))',
+    # control flow and calls
+    'm = array_map(function(x) if x then return 1 end return 2 end, array({1, 2}))',
+    'm = array_map(function(x) return math.floor(x) end, array({1, 2}))',
+])
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_array_map_rejects_functions_it_cannot_run_elementwise(source, backend):
+    assert run(source, backend) == ('error', "'array_map' expects a function of one parameter that only computes "
+                                             "arithmetic on it and its locals\n")
@@ -0,0 +1,404 @@
+"""
+Differential tests: every script runs on every backend, with and without the optimizer, and all runs must
+agree on the result, the globals left behind, the printed output and the error a failing script reports.
+"""
+from contextlib import redirect_stdout
+import io
+
+import pytest
+
+from closure_compiler import LuaFunction
+from env import Env
+from eval import BACKENDS, evaluate
+from parser import Parser
+from vm import Closure
+import Ast
+
+FUNCTION_TYPES = (Ast.Function, Closure, LuaFunction)
+
+SCRIPTS = {
+    'arithmetic': '''
+        a = 7 % 3
+        b = 7 / 2
+        c = (1 + 2) * 3
+        d = 1 - 2 - 3
+        e = -a
+        f = 2.5 * 4
+    ''',
+    'comparison': '''
+        a = 3 <= 4
+        b = "a" < "b"
+        c = 2 == 2
+        d = 2 ~= 2
+        e = 1 == 1.0
+    ''',
+    'equality of mixed types': '''
+        a = 1 == "1"
+        b = nil == nil
+        c = 1 ~= "1"
+        t = {}
+        d = t == t
+        e = t == {}
+        f = true == 1
+        g = false == 0
+        h = true ~= 1
+        i = true == true
+    ''',
+    'strings': '''
+        c = "ab" .. "cd"
+        d = #c
+        s = ""
+        for i = 1, 50 do
+            s = s .. "x"
+        end
+        n = #s
+        e = s == string.rep("x", 50)
+        long = ""
+        for i = 1, 100 do
+            long = long .. "ab"
+        end
+        m = #long
+        f = long == string.rep("ab", 100)
+        g = long .. "" == long
+        t = {}
+        t[long] = 1
+        h = t[string.rep("ab", 100)]
+        u = string.len(string.upper(long .. "c"))
+    ''',
+    'and or': '''
+        a = nil or 5
+        b = false or nil
+        c = 1 or nope
+        d = 1 and 2
+        e = nil and nope
+        f = false and 1
+        g = 1 < 2 and "a" < "b"
+    ''',
+    'not': '''
+        a = not 0
+        b = not nil
+        c = not 1
+        d = not false
+        e = not ""
+    ''',
+    'truthiness': '''
+        x = 0
+        if 0 then
+            x = 1
+        end
+        y = 0
+        while y do
+            y = false
+        end
+        z = ""
+        if z then
+            z = "set"
+        end
+    ''',
+    'functions': '''
+        function fib(n)
+            if n < 2 then
+                return n
+            end
+            return fib(n - 2) + fib(n - 1)
+        end
+        function first(n)
+            local i = 1
+            while i < 100 do
+                if i * i > n then
+                    return i
+                end
+                i = i + 1
+            end
+            return 0
+        end
+        a = fib(18)
+        b = first(50)
+        f = function(x) return x * 2 end
+        c = f(21)
+    ''',
+    'nil locals': '''
+        function f(a)
+            return a == nil
+        end
+        function g()
+            local v = nil
+            if v == nil then
+                v = "set"
+            end
+            return v
+        end
+        a = f(nil)
+        b = g()
+    ''',
+    'top-level return': '''
+        x = 2
+        if x > 1 then
+            return x * 3
+        end
+        x = 100
+    ''',
+    'for loops': '''
+        s = 0
+        for i = 1, 10 do
+            s = s + i
+        end
+        d = 0
+        for i = 10, 1, -2 do
+            d = d * 10 + i
+        end
+        f = 0
+        for x = 0.5, 2.5, 0.5 do
+            f = f + x
+        end
+        c = 0
+        for i = 1, 3.7 do
+            c = c + i
+        end
+        e = 0
+        for i = 5, 1 do
+            e = e + 1
+        end
+    ''',
+    'for loops with infinite or nan limits': '''
+        function up(k)
+            for i = 1, math.huge do
+                if i >= k then
+                    return i
+                end
+            end
+        end
+        function down(k)
+            for i = -1, -math.huge, -2 do
+                if i <= k then
+                    return i
+                end
+            end
+        end
+        function float_up(k)
+            for x = 0.5, math.huge do
+                if x >= k then
+                    return x
+                end
+            end
+        end
+        a = up(5)
+        b = down(-6)
+        c = float_up(3)
+        d = 0
+        for i = 1, -math.huge do
+            d = d + 1
+        end
+        nan = math.huge - math.huge
+        e = 0
+        for i = 1, nan do
+            e = e + 1
+        end
+        for x = 0.5, nan do
+            e = e + 1
+        end
+    ''',
+    'tables': '''
+        t = {10, 20, 30, x = "ex", ["k"] = 5}
+        n = #t
+        t[4] = 40
+        t[6] = 60
+        nb = #t
+        t[5] = 50
+        nc = #t
+        t.y = t.x .. "!"
+        v = t["y"]
+        t[6] = nil
+        nd = #t
+        nested = {{1, 2}, {3, 4; 5}}
+        w = nested[2][3] + #nested[1]
+        function mk(a)
+            return {a, a * 2}
+        end
+        q = mk(4)[2]
+    ''',
+    'boolean keys': '''
+        t = {}
+        t[0] = "zero"
+        t[false] = "no"
+        t[1] = "one"
+        t[true] = "yes"
+        a = t[0]
+        b = t[false]
+        c = t[1]
+        d = t[true]
+        n = #t
+        u = {[true] = 1, [1] = 2}
+        e = u[true] + u[1]
+    ''',
+    'host functions': '''
+        print("x", 1, nil, true)
+        a = type(1) .. type("") .. type({}) .. type(print)
+        b = tostring(2.5) .. tostring(nil)
+        c = tonumber("42") + math.floor(2.7)
+        d = string.upper(string.sub("hello", 2, 4))
+        e = math.max(3, 9, 4)
+    ''',
+    'constant conditions': '''
+        r = 0
+        if 0 then
+            r = r + 1
+        end
+        if nil then
+            r = r + 10
+        else
+            r = r + 100
+        end
+        while false do
+            r = 1
+        end
+    ''',
+}
+
+# globals some SCRIPTS must leave behind, as repr, where agreeing backends could still all be wrong
+EXPECTED = {
+    'equality of mixed types': {'a': 'False', 'b': 'True', 'c': 'True', 'd': 'True', 'e': 'False', 'f': 'False',
+                                'g': 'False', 'h': 'True', 'i': 'True'},
+    'strings': {'n': '50', 'e': 'True', 'm': '200', 'f': 'True', 'g': 'True', 'h': '1', 'u': '201'},
+    'nil locals': {'a': 'True', 'b': "'set'"},
+    'for loops with infinite or nan limits': {'a': '5', 'b': '-7', 'c': '3.5', 'd': '0', 'e': '0'},
+    'top-level return': {'x': '2'},
+}
+# and the value some return, as repr
+RESULTS = {
+    'top-level return': '6',
+}
+
+# scripts failing at runtime, with the message every backend must print
+ERRORS = {
+    'arithmetic': ('x = 1 + "a"', "Operands for '+' must be of type number"),
+    'comparison': ('x = 1 < "a"', "Operands for '<' must be both of type number or string"),
+    'concatenation': ('x = "a" .. 1', "Operands for '..' must be of type string"),
+    'undeclared identifier': ('x = nope + 1', 'Identifier nope not previously declared'),
+    'argument count': ('function f(a) return a end\nx = f(1, 2)', "Incorrect number of arguments for 'f'"),
+    'index': ('x = 1\ny = x[1]', "Attempt to index a non-table value '1'"),
+    'namespace assignment': ('math.pi = 3', "Attempt to modify read-only table 'math'"),
+}
+
+RUNS = [(backend, optimized) for backend in BACKENDS for optimized in (False, True)]
+
+
+def values(table):
+    # function values are backend specific, tables compare by their contents
+    return {name: repr(value) for name, value in table.items() if not isinstance(value, FUNCTION_TYPES)}
+
+
+def run(source, backend, optimized=False):
+    env = Env()
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            result = evaluate(Parser(source=source).parse_program(), backend, env, optimized)
+    except SystemExit:
+        return 'error', output.getvalue()
+    return repr(result), values(env.symbol_table[0]), output.getvalue()
+
+
+@pytest.mark.parametrize('name', SCRIPTS)
+def test_backends_agree(name):
+    source = SCRIPTS[name]
+    reference = run(source, 'tree')
+    assert reference[0] != 'error', reference[1]
+    for global_name, expected in EXPECTED.get(name, {}).items():
+        assert reference[1][global_name] == expected, global_name
+    if name in RESULTS:
+        assert reference[0] == RESULTS[name]
+    for backend, optimized in RUNS:
+        assert run(source, backend, optimized) == reference, (backend, optimized)
+
+
+@pytest.mark.parametrize('name', ERRORS)
+def test_backends_report_the_same_error(name):
+    source, message = ERRORS[name]
+    for backend, optimized in RUNS:
+        assert run(source, backend, optimized) == ('error', message + '\n'), (backend, optimized)
+
+
+# Scoping is the one intended difference: the tree backends are dynamically scoped, the compiled ones
+# lexically. See Ast.Visitor.
+DYNAMIC = ('tree', 'quick')
+LEXICAL = ('vm', 'closure')
+
+
+def test_callee_sees_caller_locals_only_with_dynamic_scoping():
+    source = '''
+        function f() return caller end
+        function g() local caller = 5 return f() end
+        r = g()
+    '''
+    for backend in DYNAMIC:
+        assert run(source, backend)[1]['r'] == '5'
+    for backend in LEXICAL:
+        assert run(source, backend) == ('error', 'Identifier caller not previously declared\n')
+
+
+def test_closures_only_with_lexical_scoping():
+    source = '''
+        function counter()
+            local n = 0
+            return function() n = n + 1 return n end
+        end
+        c = counter()
+        c()
+        r = c()
+    '''
+    for backend in LEXICAL:
+        assert run(source, backend)[1]['r'] == '2'
+    for backend in DYNAMIC:
+        assert run(source, backend) == ('error', 'Identifier n not previously declared\n')
+
+
+# scripts only the lexically scoped backends run, with the globals they must leave behind
+CLOSURE_SCRIPTS = {
+    'loop variable': ('''
+        fns = {}
+        for i = 1, 3 do fns[i] = function() return i end end
+        r = fns[1]()
+        s = fns[3]()
+    ''', {'r': '1', 's': '3'}),
+    'block local': ('''
+        fns = {}
+        n = 0
+        while n < 3 do
+            n = n + 1
+            local k = n * 10
+            fns[n] = function() k = k + 1 return k end
+        end
+        a = fns[1]()
+        b = fns[1]()
+        c = fns[2]()
+    ''', {'a': '11', 'b': '12', 'c': '21'}),
+    'nested blocks': ('''
+        function make()
+            local out = {}
+            for i = 1, 3 do
+                local j = i
+                out[i] = function() return i + j end
+                if i == 2 then
+                    local z = 100
+                    out[i] = function() return z + i end
+                end
+            end
+            return out
+        end
+        t = make()
+        a = t[1]()
+        b = t[2]()
+        c = t[3]()
+    ''', {'a': '2', 'b': '102', 'c': '6'}),
+}
+
+
+@pytest.mark.parametrize('name', CLOSURE_SCRIPTS)
+def test_closures_capture_a_fresh_variable_per_entry(name):
+    source, expected = CLOSURE_SCRIPTS[name]
+    for backend in LEXICAL:
+        for optimized in (False, True):
+            result = run(source, backend, optimized)
+            assert result[0] != 'error', result[1]
+            assert {global_name: result[1][global_name] for global_name in expected} == expected, (backend, optimized)
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+import cache
+from cache import ScriptCache
+from runtime import Runtime
+
+SOURCE = 'function add(a, b) return a + b end\nreturn add(1, 2) + 0 * 5'
+
+
+def entries(directory):
+    return sorted(os.listdir(directory))
+
+
+def test_a_miss_stores_and_a_hit_skips_the_parser(tmp_path, monkeypatch):
+    scripts = ScriptCache(str(tmp_path))
+    stored = scripts.parse(SOURCE)
+    assert entries(tmp_path) == [scripts.key(SOURCE) + '.arena']
+
+    def fail(*_, **__):
+        raise AssertionError('parsed on a cache hit')
+
+    monkeypatch.setattr(cache, 'Parser', fail)
+    loaded = scripts.parse(SOURCE)
+    assert loaded is not stored and repr(loaded.decode()) == repr(stored.decode())
+
+
+def test_keys_depend_on_the_source_and_the_optimizer(tmp_path):
+    scripts = ScriptCache(str(tmp_path))
+    plain, optimized = scripts.parse(SOURCE), scripts.parse(SOURCE, optimized=True)
+    assert len(entries(tmp_path)) == 2 and repr(plain.decode()) != repr(optimized.decode())
+    assert scripts.load(SOURCE + ' ') is None
+    assert len({scripts.key(SOURCE), scripts.key(SOURCE, True), scripts.key(SOURCE + ' ')}) == 3
+
+
+def test_corrupt_entries_are_misses_and_get_replaced(tmp_path):
+    scripts = ScriptCache(str(tmp_path))
+    path = scripts.path(scripts.key(SOURCE))
+    with open(path, 'wb') as f:
+        f.write(b'not a pickle')
+    assert scripts.load(SOURCE) is None
+    scripts.parse(SOURCE)
+    assert scripts.load(SOURCE) is not None
+
+
+def test_a_failed_store_leaves_the_previous_entry(tmp_path, monkeypatch):
+    scripts = ScriptCache(str(tmp_path))
+    arena = scripts.parse(SOURCE)
+
+    def partial_dump(value, f, *_):
+        f.write(b'partial')
+        raise OSError('disk full')
+
+    monkeypatch.setattr(cache.pickle, 'dump', partial_dump)
+    with pytest.raises(OSError):
+        scripts.store(SOURCE, arena)
+    # the temporary file is removed and the entry was never overwritten
+    assert entries(tmp_path) == [scripts.key(SOURCE) + '.arena']
+    monkeypatch.undo()
+    assert repr(scripts.load(SOURCE).decode()) == repr(arena.decode())
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    sources = [f'x = {i}' for i in range(3)]
+    scripts = ScriptCache(str(tmp_path))
+    for age, source in zip((300, 200, 100), sources):
+        scripts.parse(source)
+        path = scripts.path(scripts.key(source))
+        os.utime(path, (0, os.path.getmtime(path) - age))
+    size = os.path.getsize(scripts.path(scripts.key(sources[0])))
+
+    # loading the oldest entry makes it the most recently used
+    assert scripts.load(sources[0]) is not None
+    scripts.max_bytes = 3 * size
+    scripts.parse('x = 3')
+    assert scripts.load(sources[1]) is None
+    assert all(scripts.load(source) is not None for source in (sources[0], sources[2], 'x = 3'))
+    assert len(entries(tmp_path)) == 3
+
+    scripts.clear()
+    assert entries(tmp_path) == []
+
+
+def test_runtimes_compile_through_the_cache(tmp_path, monkeypatch):
+    scripts = ScriptCache(str(tmp_path))
+    assert Runtime(cache=scripts).run(SOURCE) == 3
+    assert Runtime(optimized=True, cache=scripts).run(SOURCE) == 3
+    assert entries(tmp_path) == sorted(scripts.key(SOURCE, optimized) + '.arena' for optimized in (False, True))
+
+    monkeypatch.setattr(cache, 'Parser', None)
+    # fresh runtimes load both forms without parsing
+    assert Runtime(cache=scripts).run(SOURCE) == 3
+    assert Runtime(optimized=True, cache=scripts).run(SOURCE) == 3
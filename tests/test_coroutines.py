@@ -0,0 +1,127 @@
+from contextlib import redirect_stdout
+import asyncio
+import io
+
+import pytest
+
+from env import Env
+from eval import evaluate
+from parser import Parser
+from runtime import Runtime
+
+
+def run(source):
+    # coroutines are only supported by the vm backend
+    env = Env()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        evaluate(Parser(source=source).parse_program(), 'vm', env)
+    return env.symbol_table[0], output.getvalue()
+
+
+def test_resume_and_yield_pass_values_both_ways():
+    globals_, output = run('''
+        function gen(n)
+            for i = 1, n do
+                local got = coroutine.yield(i * 10)
+                print(got)
+            end
+            return "done"
+        end
+        co = coroutine.create(gen)
+        a = coroutine.resume(co, 2)
+        b = coroutine.resume(co, "x")
+        c = coroutine.resume(co, "y")
+    ''')
+    assert (globals_['a'], globals_['b'], globals_['c']) == (10, 20, 'done')
+    assert output == 'x\ny\n'
+
+
+def test_status_follows_the_coroutine():
+    globals_, _ = run('''
+        function body()
+            inside = coroutine.status(co)
+            outer_yieldable = coroutine.isyieldable()
+            local inner = coroutine.create(function() seen_from_inner = coroutine.status(co) end)
+            coroutine.resume(inner)
+            coroutine.yield(1)
+        end
+        co = coroutine.create(body)
+        before = coroutine.status(co)
+        coroutine.resume(co)
+        suspended = coroutine.status(co)
+        coroutine.resume(co)
+        after = coroutine.status(co)
+        main_yieldable = coroutine.isyieldable()
+    ''')
+    assert globals_['before'] == 'suspended'
+    assert globals_['inside'] == 'running' and globals_['seen_from_inner'] == 'normal'
+    assert globals_['suspended'] == 'suspended' and globals_['after'] == 'dead'
+    assert globals_['outer_yieldable'] is True and globals_['main_yieldable'] is False
+
+
+def test_wrap_resumes_on_every_call_and_yields_across_deep_calls():
+    globals_, _ = run('''
+        function deep(k)
+            if k == 0 then
+                return coroutine.yield("bottom")
+            end
+            return deep(k - 1) + 1
+        end
+        w = coroutine.wrap(function() return deep(5000) end)
+        a = w()
+        b = w(1)
+    ''')
+    assert (globals_['a'], globals_['b']) == ('bottom', 5001)
+
+
+def test_dead_or_failing_coroutines_resume_to_nil():
+    globals_, output = run('''
+        co = coroutine.create(function() return 1 end)
+        first = coroutine.resume(co)
+        again = coroutine.resume(co)
+        bad = coroutine.create(function() local x = 1 + "a" return x end)
+        failed = coroutine.resume(bad)
+        status = coroutine.status(bad)
+        after = coroutine.resume(bad)
+        finished = true
+    ''')
+    assert globals_['first'] == 1 and globals_['again'] is None
+    assert globals_['failed'] is None and globals_['status'] == 'dead' and globals_['after'] is None
+    assert globals_['finished'] is True
+    assert output == "Operands for '+' must be of type number\n"
+
+
+@pytest.mark.parametrize('source, message', [
+    ('w = coroutine.wrap(function() return 1 + "a" end)\nw()', "Operands for '+' must be of type number"),
+    ('w = coroutine.wrap(function() return 1 end)\nw()\nw()', 'Cannot resume dead coroutine'),
+    ('coroutine.yield(1)', 'Attempt to yield from outside a coroutine'),
+])
+def test_errors_that_end_the_script(source, message):
+    output = io.StringIO()
+    with pytest.raises(SystemExit), redirect_stdout(output):
+        evaluate(Parser(source=source).parse_program(), 'vm', Env())
+    assert output.getvalue() == message + '\n'
+
+
+def test_run_async_interleaves_scripts():
+    events = []
+
+    async def fetch(key):
+        events.append(('start', key))
+        await asyncio.sleep(0.01)
+        events.append(('end', key))
+        return key * 2
+
+    runtime = Runtime()
+    runtime.register('fetch', fetch, 1)
+    chunk = runtime.compile('local total = 0\nfor i = 1, 2 do total = total + fetch(base + i) end\nreturn total')
+
+    async def main():
+        tables = [{'base': base} for base in (0, 10, 20)]
+        return await asyncio.gather(*(chunk.run_async(table) for table in tables))
+
+    assert asyncio.run(main()) == [6, 46, 86]
+    # every script awaits its first call before any of them finishes one
+    assert [event for event, _ in events[:3]] == ['start'] * 3
+    assert sorted(key for event, key in events if event == 'start') == [1, 2, 11, 12, 21, 22]
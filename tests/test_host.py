@@ -0,0 +1,35 @@
+import pytest
+
+from host import lua_tonumber
+from rope import Rope
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('42', 42),
+    (' 42\n', 42),
+    ('+3', 3),
+    ('-7', -7),
+    ('1e3', 1000.0),
+    ('.5', 0.5),
+    ('5.', 5.0),
+    ('1.5e-2', 0.015),
+    ('0x10', 16),
+    ('-0x10', -16),
+    ('0XfF', 255),
+    ('0x1p4', 16.0),
+    ('0x.8', 0.5),
+])
+def test_tonumber_reads_lua_numerals(text, expected):
+    value = lua_tonumber(text)
+    assert value == expected and type(value) is type(expected)
+
+
+@pytest.mark.parametrize('text', ['1_000', 'inf', 'nan', 'Infinity', '1e', '0x', '- 3', 'abc', '', '1 2', '0b1'])
+def test_tonumber_rejects_what_lua_rejects(text):
+    assert lua_tonumber(text) is None
+
+
+def test_tonumber_of_other_values():
+    assert lua_tonumber(2.5) == 2.5
+    assert lua_tonumber(True) is None and lua_tonumber(None) is None
+    assert lua_tonumber(Rope('1' * 40, '0' * 40, 80)) == int('1' * 40 + '0' * 40)
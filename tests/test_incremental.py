@@ -0,0 +1,103 @@
+from contextlib import redirect_stdout
+import io
+import random
+
+import pytest
+
+from incremental import IncrementalDocument
+from parser import Parser
+from regex_lexer import RegexLexer
+
+SOURCE = '''function add(a, b)
+    return a + b
+end
+-- a comment
+x = add(1, 2)
+s = "some text" .. "more"
+function count(n)
+    local total = 0
+    for i = 1, n do
+        if i % 2 == 0 then
+            total = total + i
+        else
+            total = total - 1
+        end
+    end
+    return total
+end
+t = {1, 2, x = 3}
+y = count(10) * #t
+while y > 0 do
+    y = y - 7
+end
+'''
+
+INSERTS = ['', 'x', ' ', '\n', '1', '+ 1', '"s"', 'y = 2\n', '\n\n', 'ab', '..', '=', '<', 'end', 'if x then ',
+           '(', ')', 'local z = 1\nz = z .. "a"\n', '\n-- note\n']
+
+
+def fresh(source):
+    """Tokens and program of a full lex and parse, None if source does not parse"""
+    try:
+        with redirect_stdout(io.StringIO()):
+            tokens = RegexLexer().lex(source)
+            return tokens, Parser(tokens=list(tokens)).parse_program()
+    except (SystemExit, ValueError):
+        # both lexers raise ValueError on numerals such as '1..'
+        return None
+
+
+def assert_matches_fresh(document):
+    tokens, program = fresh(document.source)
+    # Token equality covers pos, line and col
+    assert document.tokens == tokens
+    assert repr(document.program) == repr(program)
+
+
+def test_multi_line_insert_shifts_lines_and_columns():
+    document = IncrementalDocument(SOURCE)
+    kept = document.statements[-1]
+    offset = SOURCE.index('s = "some')
+    document.edit(offset, 0, 'local z = 1\nz = z .. "a"\n    ')
+    assert_matches_fresh(document)
+    s = next(token for token in document.tokens if token.lexeme == 's')
+    assert (s.line, s.col) == (8, 5)
+    # the while loop was past the edit, it is the same statement object
+    assert document.statements[-1] is kept
+    assert document.tokens[-2].lexeme == 'end' and document.tokens[-2].line == SOURCE.count('\n') + 2
+
+
+def test_multi_line_delete_and_replace():
+    document = IncrementalDocument(SOURCE)
+    start = SOURCE.index('function count')
+    end = SOURCE.index('t = {')
+    document.edit(start, end - start, '')
+    assert_matches_fresh(document)
+    t = next(token for token in document.tokens if token.lexeme == 't')
+    assert (t.line, t.col) == (7, 1)
+
+    offset = document.source.index('y - 7')
+    document.edit(offset, len('y - 7'), 'y -\n        7 -\n        1')
+    assert_matches_fresh(document)
+    assert document.tokens[-2].lexeme == 'end' and document.tokens[-2].line == 13
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_random_edits_agree_with_a_fresh_parse(seed):
+    rng = random.Random(seed)
+    document = IncrementalDocument(SOURCE)
+    source = SOURCE
+    applied = 0
+    while applied < 40:
+        offset = rng.randint(0, len(source))
+        removed = rng.randint(0, min(6, len(source) - offset))
+        inserted = rng.choice(INSERTS)
+        candidate = source[:offset] + inserted + source[offset + removed:]
+        if fresh(candidate) is None:
+            # the document only has to follow edits that leave a valid script
+            continue
+        document.edit(offset, removed, inserted)
+        source = candidate
+        assert document.source == source
+        assert_matches_fresh(document)
+        applied += 1
@@ -0,0 +1,50 @@
+from contextlib import redirect_stdout
+import io
+import random
+
+import pytest
+
+from lexer import Lexer
+from regex_lexer import RegexLexer
+
+FRAGMENTS = ['x', 'name_1', '_', 'and', 'or', 'not', 'local', 'function', 'end', 'true', 'false', 'nil', '0', '42',
+             '3.25', '10.', '"text"', '""', '"a b"', '+', '-', '*', '/', '%', '^', '#', '..', '==', '~=', '<=', '>=',
+             '<', '>', '=', '(', ')', '{', '}', '[', ']', ',', ';', ':', '.', ' ', '  ', '\t', '\n', '\r\n', '\n\n',
+             '-- comment', '--', '-- note\n']
+
+
+def lex(lexer, source):
+    """The tokens of source, or the message the lexer exits with"""
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            return lexer.lex(source)
+    except SystemExit:
+        return output.getvalue()
+    except ValueError as e:
+        # both lexers hand numerals such as '1..' to float()
+        return type(e)
+
+
+@pytest.mark.parametrize('source', [
+    '',
+    ' ',
+    '\n',
+    'x = 1',
+    'local s = "a" .. "b" -- tail\n',
+    'if a ~= b then\r\n  return a >= b\r\nend',
+    't = {1, 2.5, [3] = "x"}\nprint(#t)',
+    '-- only a comment',
+    ' ' * 500 + 'x' + '\n' * 500,
+    '"unterminated',
+    'x = @',
+])
+def test_regex_lexer_matches_lexer(source):
+    assert lex(RegexLexer(), source) == lex(Lexer(), source)
+
+
+def test_regex_lexer_matches_lexer_on_random_inputs():
+    rng = random.Random(9)
+    for _ in range(3000):
+        source = ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 12)))
+        assert lex(RegexLexer(), source) == lex(Lexer(), source), source
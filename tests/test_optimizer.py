@@ -0,0 +1,23 @@
+import Ast
+from optimizer import optimize
+from parser import Parser
+
+
+def folded_value(source):
+    program = optimize(Parser(source=source).parse_program())
+    value = program.blocks[0].statements[0].value
+    return value.value if isinstance(value, Ast.Literal) else value
+
+
+def test_equality_of_numbers_and_of_strings_is_folded():
+    assert folded_value('x = 1 == 1.0') is True
+    assert folded_value('x = "a" ~= "b"') is True
+
+
+def test_equality_of_other_literals_is_left_to_runtime():
+    for source in ('x = 1 == "1"', 'x = nil == nil', 'x = true ~= false'):
+        assert isinstance(folded_value(source), Ast.BinaryExpr), source
+
+
+def test_division_by_zero_is_left_to_runtime():
+    assert isinstance(folded_value('x = 1 / 0'), Ast.BinaryExpr)
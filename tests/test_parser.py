@@ -0,0 +1,57 @@
+import pytest
+
+from env import Env
+from eval import evaluate
+from parser import Parser
+from regex_lexer import RegexLexer
+from table import LuaTable
+
+SOURCES = {
+    'empty': '',
+    'blank': '\n\n',
+    'lf': 'x = 1\nif x then\n  s = "a" .. "b"\nend\n',
+    'crlf': 'x = 1\r\nif x then\r\n  s = "a" .. "b" -- note\r\nend\r\nt = {x, 2}\r\nn = #t',
+    'non-ascii': 's = "héllo wörld ✓"\nn = #s\nt = {"ü", "日本"}\nlast = t[2]\n',
+}
+
+
+def write(tmp_path, source):
+    path = tmp_path / 'script.lua'
+    # bytes, so line endings are kept as written
+    path.write_bytes(source.encode())
+    return str(path)
+
+
+def run(program):
+    env = Env()
+    evaluate(program, 'vm', env)
+    # tables compare by identity
+    return {name: value for name, value in env.symbol_table[0].items() if not isinstance(value, LuaTable)}
+
+
+@pytest.mark.parametrize('name', SOURCES)
+def test_from_file_parses_like_source(tmp_path, name):
+    source = SOURCES[name]
+    path = write(tmp_path, source)
+    from_file = Parser.from_file(path).parse_program()
+    assert repr(from_file) == repr(Parser(source=source).parse_program())
+
+    assert run(from_file) == run(Parser(source=source).parse_program())
+
+
+@pytest.mark.parametrize('name', ['empty', 'blank', 'lf', 'crlf'])
+def test_ascii_files_lex_to_the_same_tokens(tmp_path, name):
+    source = SOURCES[name]
+    assert list(RegexLexer().lex_file(write(tmp_path, source))) == RegexLexer().lex(source)
+
+
+def test_non_ascii_files_count_positions_in_bytes(tmp_path):
+    source = SOURCES['non-ascii']
+    from_file = list(RegexLexer().lex_file(write(tmp_path, source)))
+    from_source = RegexLexer().lex(source)
+    assert [(t.token_type, t.lexeme, t.literal, t.line) for t in from_file] == \
+           [(t.token_type, t.lexeme, t.literal, t.line) for t in from_source]
+    # the string has two 2-byte characters and one 3-byte character
+    assert from_file[2].pos == from_source[2].pos + 4
+    assert from_file[-1].pos == len(source.encode())
+    assert from_file[2].literal == 'héllo wörld ✓'
@@ -0,0 +1,104 @@
+from contextlib import redirect_stdout
+import io
+
+import pytest
+
+from Ast import MISSING
+from env import Env
+from eval import BACKENDS, evaluate
+from parser import Parser
+from purity import MemoCache, PurityAnalyzer, memoize
+
+
+def pure_functions(source):
+    return set(PurityAnalyzer().analyze(Parser(source=source).parse_program()))
+
+
+def test_arithmetic_on_parameters_and_locals_is_pure():
+    assert pure_functions('''
+        function square(x) return x * x end
+        function add(a, b)
+            local total = a
+            for i = 1, b do total = total + 1 end
+            return total
+        end
+        function sum_squares(a, b) return add(square(a), square(b)) end
+    ''') == {'square', 'add', 'sum_squares'}
+
+
+@pytest.mark.parametrize('body', [
+    'counter = x return x',
+    'return x + offset',
+    'print(x) return x',
+    'return {x}',
+    'local t = x t[1] = 2 return x',
+    'return function() return x end',
+    'local f = x return f(1)',
+])
+def test_global_access_io_tables_and_closures_are_impure(body):
+    assert pure_functions(f'offset = 1\nfunction f(x) {body} end') == set()
+
+
+def test_impure_callees_make_their_callers_impure():
+    assert pure_functions('''
+        function log(x) print(x) return x end
+        function twice(x) return log(x) * 2 end
+        function four_times(x) return twice(twice(x)) end
+        function square(x) return x * x end
+    ''') == {'square'}
+
+
+def test_rebound_functions_and_their_callers_are_impure():
+    assert pure_functions('''
+        function square(x) return x * x end
+        function cube(x) return square(x) * x end
+        function half(x) return x / 2 end
+        function half(x) return x * 0.5 end
+        square = nil
+    ''') == set()
+
+
+def test_mutual_recursion_is_pure():
+    assert pure_functions('''
+        function is_even(n) if n == 0 then return true end return is_odd(n - 1) end
+        function is_odd(n) if n == 0 then return false end return is_even(n - 1) end
+    ''') == {'is_even', 'is_odd'}
+
+
+def test_memo_cache_keys_and_lru_eviction():
+    cache = MemoCache('f', maxsize=2)
+    # equal arguments of different types do not share an entry, tables are never cached
+    assert MemoCache.key([1]) != MemoCache.key([1.0]) != MemoCache.key([True])
+    assert MemoCache.key([1, {}]) is None
+    cache.put(cache.key([1]), 'one')
+    cache.put(cache.key([2]), 'two')
+    assert cache.get(cache.key([1])) == 'one'
+    cache.put(cache.key([3]), 'three')
+    # 2 was the least recently used
+    assert list(cache.entries) == [cache.key([1]), cache.key([3])]
+    assert cache.get(cache.key([2])) is MISSING
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 1, 'size': 2, 'maxsize': 2}
+    cache.clear()
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'evictions': 0, 'size': 0, 'maxsize': 2}
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_pure_calls_are_memoized(backend):
+    program = Parser(source='''
+        function square(x) return x * x end
+        function noisy(x) print(x) return x end
+        a = square(1) + square(2) + square(1) + square(3)
+        b = square(2) + square(1.0)
+        n = noisy(1) + noisy(1)
+    ''').parse_program()
+    caches = memoize(program, maxsize=2)
+    assert set(caches) == {'square'}
+    env = Env()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        evaluate(program, backend, env)
+    assert (env.symbol_table[0]['a'], env.symbol_table[0]['b'], env.symbol_table[0]['n']) == (15, 5.0, 2)
+    # the impure function runs on every call
+    assert output.getvalue() == '1\n1\n'
+    # square(2) was evicted by square(3), square(1.0) is a separate entry from square(1)
+    assert caches['square'].stats() == {'hits': 1, 'misses': 5, 'evictions': 3, 'size': 2, 'maxsize': 2}
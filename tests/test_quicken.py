@@ -0,0 +1,45 @@
+from env import Env
+from eval import evaluate
+from parser import Parser
+import quicken
+
+SOURCE = '''
+function add(a, b)
+    return a + b
+end
+function neg(a)
+    return -a
+end
+x = add(1, 2)
+y = add(4, 5)
+n = neg(x)
+'''
+
+
+def add_expr(program):
+    return program.blocks[0].statements[0].body.statements[0].value
+
+
+def run(program, backend):
+    env = Env()
+    evaluate(program, backend, env)
+    return {name: value for name, value in env.symbol_table[0].items() if name in ('x', 'y', 'z', 'n')}
+
+
+def test_monomorphic_site_is_specialized():
+    program = Parser(source=SOURCE).parse_program()
+    assert run(program, 'quick') == {'x': 3, 'y': 9, 'n': -3}
+    assert type(add_expr(program)) is quicken.BINARY_SPECIALIZATIONS['+', int, int]
+
+
+def test_guard_miss_turns_the_site_generic():
+    program = Parser(source=SOURCE + 'z = add(1.5, 2)\n').parse_program()
+    assert run(program, 'quick') == {'x': 3, 'y': 9, 'n': -3, 'z': 3.5}
+    assert type(add_expr(program)) is quicken.GenericBinary
+
+
+def test_quickened_tree_runs_on_every_backend():
+    program = Parser(source=SOURCE).parse_program()
+    expected = run(program, 'quick')
+    for backend in ('tree', 'vm', 'closure', 'quick'):
+        assert run(program, backend) == expected, backend
@@ -0,0 +1,97 @@
+from batch import run_batch
+from closure_compiler import ClosureCompiler
+from compiler import Compiler
+from eval import BACKENDS
+from host import REGISTRY
+from parser import Parser
+from resolver import Resolver
+from runtime import Chunk, Runtime
+import pytest
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_batch_returns_job_values(backend):
+    jobs = [('r = n * 2\nreturn r', {'n': n}) for n in range(5)]
+    for workers in (1, 2):
+        results = run_batch(jobs, backend, workers, chunksize=2)
+        assert [result.value for result in results] == [0, 2, 4, 6, 8]
+        assert [result.globals for result in results] == [{'n': n, 'r': n * 2} for n in range(5)]
+
+
+def test_batch_default_backend_returns_job_values():
+    assert [result.value for result in run_batch([('return 1 + 1', {})], workers=1)] == [2]
+
+
+@pytest.mark.parametrize('backend', ['tree', 'vm', 'closure'])
+def test_batch_jobs_do_not_share_namespaces(backend):
+    first, second = run_batch([('math.pi = 3\nr = 1', {}), ('r = math.pi', {})], backend, workers=1)
+    assert first.error == "Attempt to modify read-only table 'math'"
+    assert second.error is None and second.globals['r'] == pytest.approx(3.14159, abs=1e-5)
+
+
+def test_scripts_can_shadow_a_namespace():
+    runtime, other = Runtime(), Runtime()
+    runtime.run('string = {}\nstring.len = 3\nr = string.len')
+    other.run('r = string.len("abcd")')
+    assert runtime.globals['r'] == 3 and other.globals['r'] == 4
+
+
+@pytest.mark.parametrize('backend', ['tree', 'quick', 'vm', 'closure'])
+def test_registrations_stay_in_their_runtime(backend):
+    runtime, other = Runtime(backend), Runtime(backend)
+    runtime.register('twice', lambda x: x * 2, 1, ('number',))
+    runtime.register('string.shout', lambda s: s.upper() + '!', 1, ('string',))
+    runtime.run('a = twice(21)\nb = string.shout("hi")')
+    assert runtime.globals['a'] == 42 and runtime.globals['b'] == 'HI!'
+    assert runtime.get_function('twice')(4) == 8
+
+    assert 'twice' not in REGISTRY.globals and REGISTRY.globals['string'].get('shout') is None
+    assert other.registry.globals['string'].get('shout') is None
+    with pytest.raises(SystemExit):
+        other.run('a = twice(21)')
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_strings_reach_python_as_str(backend):
+    runtime = Runtime(backend)
+    seen = []
+    runtime.register('shout', lambda s: seen.append(type(s)) or s.upper(), 1, ('string',))
+    runtime.run('''
+        s = ""
+        for i = 1, 100 do
+            s = s .. "x"
+        end
+        loud = shout(s .. "!")
+        function grow(t) return t .. string.rep("y", 70) end
+    ''')
+    assert seen == [str]
+    assert type(runtime.globals['s']) is str and runtime.globals['s'] == 'x' * 100
+    assert runtime.globals['loud'] == 'X' * 100 + '!'
+    grown = runtime.get_function('grow')('z')
+    assert type(grown) is str and grown == 'z' + 'y' * 70
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_chunk_resolves_and_compiles_once(backend, monkeypatch):
+    calls = []
+    for cls, method in ((Resolver, 'resolve'), (ClosureCompiler, 'compile'), (Compiler, 'compile_program')):
+        original = getattr(cls, method)
+        monkeypatch.setattr(cls, method, lambda self, program, original=original, name=cls.__name__:
+                            calls.append(name) or original(self, program))
+    chunk = Chunk(Parser(source='x = 1\nfunction f(a) return a * 10 end\nreturn f(x)').parse_program(), backend)
+    other = Chunk(Parser(source='x = n + 1\nreturn x * 10').parse_program(), backend)
+    compiled = list(calls)
+    assert [chunk.run() for _ in range(5)] == [10] * 5
+    assert [other.run({'n': n}) for n in range(3)] == [10, 20, 30]
+    assert calls == compiled and compiled.count('Resolver') == 2
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_functions_keep_the_globals_of_their_run(backend):
+    runtime = Runtime(backend)
+    chunk = runtime.compile('x = v\nfunction get() return x end')
+    first, second = {'v': 1}, {'v': 2}
+    chunk.run(first)
+    chunk.run(second)
+    assert runtime.get_function('get', first)() == 1
+    assert runtime.get_function('get', second)() == 2
@@ -0,0 +1,47 @@
+from table import LuaTable
+
+
+def test_array_part_grows_and_migrates():
+    t = LuaTable()
+    t.set(2, 'b')
+    t.set(1, 'a')
+    assert t.array == ['a', 'b'] and not t.hash
+    assert t.length() == 2
+
+
+def test_nil_truncates_the_array_part():
+    t = LuaTable()
+    for i in range(1, 5):
+        t.set(i, i * 10)
+    t.set(2, None)
+    assert t.length() == 1
+    assert t.get(3) == 30 and t.get(2) is None
+
+
+def test_float_keys_with_integer_values_are_integers():
+    t = LuaTable()
+    t.set(1.0, 'one')
+    assert t.get(1) == 'one' and t.length() == 1
+
+
+def test_boolean_keys_are_distinct_from_numbers():
+    t = LuaTable()
+    t.set(0, 'zero')
+    t.set(False, 'no')
+    t.set(True, 'yes')
+    t.set(1, 'one')
+    t.set(1.0, 'one again')
+    assert t.get(0) == 'zero'
+    assert t.get(False) == 'no'
+    assert t.get(True) == 'yes'
+    assert t.get(1) == 'one again'
+    assert t.length() == 1
+    assert sorted(t.items(), key=repr) == sorted([(1, 'one again'), (0, 'zero'), (False, 'no'), (True, 'yes')], key=repr)
+
+
+def test_boolean_key_removal():
+    t = LuaTable()
+    t.set(True, 'yes')
+    t.set(1, 'one')
+    t.set(True, None)
+    assert t.get(True) is None and t.get(1) == 'one'
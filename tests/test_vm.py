@@ -0,0 +1,76 @@
+from contextlib import redirect_stdout
+import io
+
+from env import Env
+from eval import evaluate
+from parser import Parser
+from purity import memoize
+import vm
+
+COUNT = '''
+function count(n, acc)
+    if n == 0 then
+        return acc
+    end
+    return count(n - 1, acc + 1)
+end
+'''
+
+DEPTH = '''
+function depth(n)
+    if n == 0 then
+        return 0
+    end
+    return 1 + depth(n - 1)
+end
+'''
+
+
+def run(source, program=None):
+    env = Env()
+    output = io.StringIO()
+    program = Parser(source=source).parse_program() if program is None else program
+    try:
+        with redirect_stdout(output):
+            evaluate(program, 'vm', env)
+    except SystemExit:
+        return 'error', output.getvalue()
+    return env.symbol_table[0]
+
+
+def test_tail_calls_run_in_constant_space(monkeypatch):
+    # a tail call replaces its caller's activation, so it never adds to the call stack
+    monkeypatch.setattr(vm, 'MAX_CALL_DEPTH', 100)
+    assert run(COUNT + 'r = count(100000, 0)')['r'] == 100000
+    assert run(DEPTH + 'r = depth(200)') == ('error', 'Stack overflow\n')
+
+
+def test_deep_recursion_outgrows_the_python_stack():
+    assert run(DEPTH + 'r = depth(50000)')['r'] == 50000
+
+
+def test_memoized_tail_calls_store_every_result():
+    source = COUNT + 'r = count(10000, 0)\nagain = count(10000, 0)\nshifted = count(5000, 5000)'
+    program = Parser(source=source).parse_program()
+    cache = memoize(program, maxsize=20000)['count']
+    globals_ = run('', program)
+    assert (globals_['r'], globals_['again'], globals_['shifted']) == (10000, 10000, 10000)
+    # the memoized callee keeps its activation until it returns, so each of the first run's
+    # 10001 calls is stored, and the last two calls are answered by the cache
+    assert cache.stats() == {'hits': 2, 'misses': 10001, 'evictions': 0, 'size': 10001, 'maxsize': 20000}
+
+
+def test_tail_calls_through_other_functions():
+    globals_ = run('''
+        function is_even(n)
+            if n == 0 then return true end
+            return is_odd(n - 1)
+        end
+        function is_odd(n)
+            if n == 0 then return false end
+            return is_even(n - 1)
+        end
+        big = is_even(100001)
+        small = is_odd(3)
+    ''')
+    assert globals_['big'] is False and globals_['small'] is True
@@ -0,0 +1,276 @@
+from compiler import (
+    CodeObject, FunctionProto, BINARY_FUNCS, UNARY_FUNCS, DEPTH_SHIFT, SLOT_MASK,
+    LOAD_CONST, LOAD_GLOBAL, STORE_GLOBAL, LOAD_LOCAL, STORE_LOCAL, LOAD_OUTER, STORE_OUTER,
+    BINARY_OP, UNARY_OP, JUMP, JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP,
+    MAKE_FUNCTION, CALL, POP_TOP, DUP_TOP, RETURN, NEW_TABLE, TABLE_SET, LOAD_INDEX, STORE_INDEX,
+    FOR_PREP, FOR_ITER, TAIL_CALL, ENTER_BLOCK, LEAVE_BLOCK,
+)
+from typing import Any, List
+from Ast import MISSING
+from env import Env, Frame
+from host import VMFunction, AsyncFunction
+from coroutines import Coroutine, YIELD
+from table import LuaTable
+from rope import flatten_all
+from ops import index, set_index, numeric_range
+
+
+class Closure:
+    """A FunctionProto paired with the frame it was created in"""
+    def __init__(self, proto: FunctionProto, frame: Frame):
+        self.proto = proto
+        self.frame = frame
+
+    def __repr__(self):
+        return repr(self.proto)
+
+
+# Lua call depth at which execution stops with a stack overflow, calls no longer use Python frames
+MAX_CALL_DEPTH = 200000
+
+
+class VM:
+    """
+    Stack-based interpreter for CodeObjects produced by compiler.Compiler. Lua calls do not recurse into
+    execute(): CALL saves the caller's code, frame, operand stack and pc on an explicit call stack and
+    RETURN restores them, so Lua recursion depth is not bounded by Python's recursion limit. TAIL_CALL
+    replaces the current activation instead of saving it, except for a memoized callee whose result has
+    to be stored on return. Since all of that state is local to one execute() loop, a coroutine suspends by
+    storing it and returning, and resume() starts a new loop from the stored state. Names are scoped
+    lexically, see Ast.Visitor for how that differs from the tree backends.
+    """
+    def __init__(self, env: Env = None):
+        self.env = Env() if env is None else env
+        if self.env.level == -1:
+            self.env.add_level()
+        self.globals = self.env.symbol_table[0]
+        # the coroutine being resumed, None while running the main chunk synchronously
+        self.current: Coroutine = None
+
+    def run(self, code: CodeObject):
+        return self.execute(code, Frame(code.frame_size))
+
+    @staticmethod
+    def enter(fn: Any, args: List[Any]) -> Frame:
+        if not isinstance(fn, Closure):
+            print(f"Attempt to call a non-function value '{fn}'")
+            exit(1)
+
+        proto = fn.proto
+        if len(args) != len(proto.params):
+            print(f"Incorrect number of arguments for '{proto.name}'")
+            exit(1)
+
+        frame = Frame(proto.code.frame_size, fn.frame)
+        frame[:len(args)] = args
+        return frame
+
+    def call(self, fn: Any, args: List[Any]):
+        frame = self.enter(fn, args)
+        return self.execute(fn.proto.code, frame)
+
+    def resume(self, co: Coroutine, args: List[Any], protected: bool = True) -> Any:
+        """
+        Runs co until it yields or returns and gives back that value. The first resume passes args to the
+        coroutine's function, later ones make args[0] the result of the yield it is suspended in. Where Lua's
+        resume returns false and a message, a protected resume of a dead or non-suspended coroutine returns
+        nil, and so does one whose coroutine fails: the error is printed and the coroutine is dead. An
+        unprotected resume, as by coroutine.wrap, ends the script on those errors instead.
+        """
+        if co.status != 'suspended':
+            if protected and not co.main:
+                return None
+            print(f"Cannot resume {'dead' if co.status == 'dead' else 'non-suspended'} coroutine")
+            exit(1)
+
+        previous = self.current
+        if previous is not None:
+            previous.status = 'normal'
+        co.status = 'running'
+        self.current = co
+        try:
+            if co.stack is not None:
+                co.stack.append(args[0] if args else None)
+            elif co.code is None:
+                co.frame = self.enter(co.fn, args)
+                co.code = co.fn.proto.code
+            value = self.execute(co.code, co.frame, co)
+        except SystemExit:
+            # errors are printed right before exiting, a failed coroutine is dead either way. The main chunk
+            # of run_async has no caller to report the failure to
+            co.status = 'dead'
+            co.code = co.frame = co.stack = co.calls = None
+            if not protected or co.main:
+                raise
+            value = None
+        finally:
+            self.current = previous
+            if previous is not None:
+                previous.status = 'running'
+
+        # execute() marks a coroutine suspended when it yields
+        if co.status == 'running':
+            co.status = 'dead'
+            co.code = co.frame = co.stack = co.calls = None
+        return value
+
+    def execute(self, code: CodeObject, frame: Frame, thread: Coroutine = None):
+        ops, args, consts, names = code.ops, code.args, code.consts, code.names
+        binary_funcs, unary_funcs = BINARY_FUNCS, UNARY_FUNCS
+        globals_, host_globals = self.globals, self.env.registry.globals
+        enter = self.enter
+        if thread is not None and thread.stack is not None:
+            stack, pc, calls = thread.stack, thread.pc, thread.calls
+        else:
+            stack, pc = [], 0
+            # (code, frame, stack, pc, (memo, key) or None) of every caller below the running function
+            calls = []
+        push, pop = stack.append, stack.pop
+
+        while True:
+            op = ops[pc]
+            arg = args[pc]
+            pc += 1
+
+            if op == LOAD_LOCAL:
+                push(frame[arg])
+            elif op == LOAD_CONST:
+                push(consts[arg])
+            elif op == BINARY_OP:
+                right = pop()
+                stack[-1] = binary_funcs[arg](stack[-1], right)
+            elif op == STORE_LOCAL:
+                frame[arg] = pop()
+            elif op == FOR_ITER:
+                value = next(stack[-1], None)
+                if value is None:
+                    pop()
+                    pc = arg
+                else:
+                    push(value)
+            elif op == LOAD_GLOBAL:
+                value = globals_.get(names[arg])
+                if value is None:
+                    value = host_globals.get(names[arg])
+                    if value is None:
+                        print(f"Identifier {names[arg]} not previously declared")
+                        exit(1)
+                push(value)
+            elif op == STORE_GLOBAL:
+                globals_[names[arg]] = pop()
+            elif op == JUMP_IF_FALSE:
+                value = pop()
+                if value is None or value is False:
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == CALL or op == TAIL_CALL:
+                call_args = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                fn = pop()
+                if not isinstance(fn, Closure) and callable(fn):
+                    kind = type(fn)
+                    if kind is VMFunction and fn is not YIELD:
+                        push(fn.fn(self, *call_args))
+                        continue
+                    if kind is not VMFunction and kind is not AsyncFunction:
+                        # a host function runs right here, a TAIL_CALL is followed by a RETURN of its value
+                        push(fn(*flatten_all(call_args)))
+                        continue
+                    # a yield, or an async host call, suspends the coroutine: resuming it pushes the
+                    # yield's result, or the awaited value, where the call's result would have gone
+                    if kind is VMFunction:
+                        if thread is None or thread.main:
+                            print('Attempt to yield from outside a coroutine')
+                            exit(1)
+                        value = call_args[0] if call_args else None
+                    else:
+                        if thread is None or not thread.main:
+                            print(f"Async host function '{fn.name}' can only be called by a script run with "
+                                  f"Chunk.run_async, outside of coroutines")
+                            exit(1)
+                        value = fn.fn(*flatten_all(call_args))
+                    thread.code, thread.frame, thread.stack, thread.pc, thread.calls = code, frame, stack, pc, calls
+                    thread.status = 'suspended'
+                    return value
+                pending = None
+                memo = fn.proto.memo if isinstance(fn, Closure) else None
+                if memo is not None:
+                    key = memo.key(call_args)
+                    if key is not None:
+                        value = memo.get(key)
+                        if value is not MISSING:
+                            push(value)
+                            continue
+                        # the result is stored when the call returns, so it keeps its own activation
+                        pending = (memo, key)
+                callee_frame = enter(fn, call_args)
+                if op == CALL or pending is not None:
+                    if len(calls) >= MAX_CALL_DEPTH:
+                        print('Stack overflow')
+                        exit(1)
+                    calls.append((code, frame, stack, pc, pending))
+                    stack = []
+                    push, pop = stack.append, stack.pop
+                else:
+                    del stack[:]
+                code, frame, pc = fn.proto.code, callee_frame, 0
+                ops, args, consts, names = code.ops, code.args, code.consts, code.names
+            elif op == RETURN:
+                value = pop()
+                if not calls:
+                    return value
+                code, frame, stack, pc, pending = calls.pop()
+                if pending is not None:
+                    pending[0].put(pending[1], value)
+                ops, args, consts, names = code.ops, code.args, code.consts, code.names
+                push, pop = stack.append, stack.pop
+                push(value)
+            elif op == LOAD_INDEX:
+                key = pop()
+                stack[-1] = index(stack[-1], key)
+            elif op == STORE_INDEX:
+                value = pop()
+                key = pop()
+                set_index(pop(), key, value)
+            elif op == LOAD_OUTER:
+                push(frame.get(arg >> DEPTH_SHIFT, arg & SLOT_MASK))
+            elif op == STORE_OUTER:
+                frame.set(arg >> DEPTH_SHIFT, arg & SLOT_MASK, pop())
+            elif op == UNARY_OP:
+                stack[-1] = unary_funcs[arg](stack[-1])
+            elif op == POP_TOP:
+                pop()
+            elif op == JUMP_IF_FALSE_OR_POP:
+                value = stack[-1]
+                if value is None or value is False:
+                    pc = arg
+                else:
+                    pop()
+            elif op == JUMP_IF_TRUE_OR_POP:
+                value = stack[-1]
+                if value is None or value is False:
+                    pop()
+                else:
+                    pc = arg
+            elif op == MAKE_FUNCTION:
+                push(Closure(consts[arg], frame))
+            elif op == DUP_TOP:
+                push(stack[-1])
+            elif op == FOR_PREP:
+                step = pop()
+                stop = pop()
+                stack[-1] = iter(numeric_range(stack[-1], stop, step))
+            elif op == NEW_TABLE:
+                push(LuaTable())
+            elif op == TABLE_SET:
+                value = pop()
+                key = pop()
+                stack[-1].set(key, value)
+            elif op == ENTER_BLOCK:
+                frame = Frame(arg, frame)
+            elif op == LEAVE_BLOCK:
+                frame = frame.parent
+            else:
+                print(f'Unknown opcode {op}')
+                exit(1)